@@ -10,13 +10,30 @@ class BaseTaskModel(BaseModel):
     width: int = 1920
     height: int = 1088
     detect_class_indices: List[int] = []
+    device: Optional[str] = None  # 为空时使用 worker 的 YOLO_DEVICE 配置
 
 # 扩展的 YOLOTaskModel 类
 class YOLOTaskModel(BaseTaskModel):
     inserted_id: str  # YOLOTaskModel 特有的字段
+    cache_key: Optional[str] = None  # 结果缓存键，leader 任务完成后共享结果
+    parent_id: Optional[str] = None  # 任务所在文件夹，进度事件按文件夹推送给订阅的客户端
 
 # 扩展的 TaskParams 类
 class TaskParams(BaseTaskModel):
     media_type: str  # TaskParams 特有的字段
     detect_classes: List[str] = []  # TaskParams 特有的字段
-    parent_id: str
\ No newline at end of file
+    parent_id: str
+
+# 批量图片任务参数，所有图片共享同一模型和参数
+class BatchTaskParams(BaseModel):
+    media_ids: List[str]
+    model_id: str
+    conf: float = 0.25
+    augment: bool = False
+    width: int = 1920
+    height: int = 1088
+    detect_class_indices: List[int] = []
+    detect_classes: List[str] = []
+    parent_id: str
+    batch_size: Optional[int] = None
+    device: Optional[str] = None
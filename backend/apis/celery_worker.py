@@ -1,29 +1,67 @@
 # 标准库导入
+import io
 import os
 import time
-import json
+import uuid
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
 import cv2
+import numpy as np
 
 # 第三方库导入
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from minio import Minio
-from celery import Celery, Task
+from celery import Celery, Task, chord
 from celery.contrib.abortable import AbortableTask
 from celery.signals import (
     task_postrun,
     task_success,
     task_failure,
-    task_revoked
+    task_revoked,
+    task_prerun,
+    before_task_publish,
+    celeryd_init,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown
 )
 from pydantic import ValidationError
-from ultralytics import YOLO
+from billiard.process import current_process
 
 # 自定义模块导入
 from apis.logger import get_logger
 from apis.celery_task_meta import YOLOTaskModel
+from apis.model_cache import model_cache
+from apis.device import resolve_device, configure_cpu_threads
+from apis.inference_backends import load_inference_model, export_and_compare
+from apis.progress import ProgressReporter
+from apis.media_source import open_media_source, stream_input_enabled
+from apis.media_probe import probe_video, has_video_metadata, VIDEO_METADATA_FIELDS
+from apis.task_events import publish_task_event, publish_task_updates
+from apis.read_cache import model_docs, model_list, folder_infos, folder_info_key, MODEL_LIST_KEY
+from apis.worker_profiles import TASK_QUEUES, TASK_ROUTES, BROKER_TRANSPORT_OPTIONS, DEFAULT_QUEUE, DEFAULT_PRIORITY, worker_profile
+from apis.video_encoder import FFmpegVideoWriter
+from apis.detections import DetectionWriter, DETECTIONS_FORMAT, detection_keys, concat_detections
+from apis.minio_client_setup import bulk_remove_objects
+from apis.result_cache import READY, publish_result, release_result, object_content_hash
+from apis.thumbnails import (
+    image_thumbnails, video_poster, video_sprite, thumbnail_key, thumbnail_extension,
+    enqueue_thumbnails, take_pending, finish_batch, thumbnails_enabled
+)
+from apis.metrics import (
+    StageTimer,
+    stage,
+    TASK_QUEUE_WAIT_SECONDS,
+    TASKS_TOTAL,
+    FRAMES_TOTAL,
+    VIDEO_FPS,
+    reset_multiprocess_dir,
+    start_metrics_server,
+    mark_process_dead
+)
 
 # 初始化logger
 logger = get_logger()
@@ -34,6 +72,7 @@ db = mongo_client['yolo_tasks']
 task_collection = db['tasks']
 media_collection = db['medias']
 model_collection = db['models']
+result_cache_collection = db['result_cache']
 
 # 创建MinIO客户端
 minio_client = Minio(
@@ -47,18 +86,33 @@ minio_client = Minio(
 app = Celery('yolo_tasks', broker='redis://redis:6379/0', backend='redis://redis:6379/0')
 
 # 配置Celery
+profile = worker_profile()
 app.conf.update(
     task_serializer='json',
     accept_content=['json'],
     result_serializer='json',
     timezone='Asia/Shanghai',
     enable_utc=True,
-    worker_concurrency=4,
+    # 并发数和预取数由 WORKER_PROFILE 决定，见 apis/worker_profiles.py
+    worker_concurrency=profile['concurrency'],
+    worker_prefetch_multiplier=profile['prefetch_multiplier'],
     task_acks_late=True,
     task_reject_on_worker_lost=True,
     broker_connection_retry_on_startup=True,  # 添加此行
+    # 转码、图片推理、视频推理、缩略图分别走独立队列，由不同配置的 worker 消费
+    task_queues=TASK_QUEUES,
+    task_default_queue=DEFAULT_QUEUE,
+    task_routes=TASK_ROUTES,
+    task_default_priority=DEFAULT_PRIORITY,
+    broker_transport_options=BROKER_TRANSPORT_OPTIONS,
 )
 
+# worker 只消费所选配置的队列；命令行传了 -Q 时以命令行为准
+@celeryd_init.connect
+def select_worker_queues(sender=None, instance=None, **kwargs):
+    instance.app.amqp.queues.select(profile['queues'])
+    logger.info(f"Worker profile {profile['name']}: queues {profile['queues']}, concurrency {profile['concurrency']}, prefetch {profile['prefetch_multiplier']}")
+
 def update_collection(task_name, task_id, update_data):
     if task_name == 'convert_video':
         # 对于 convert_video 任务，我们需要通过 celery_task_id 查找对应的 video 记录
@@ -68,11 +122,45 @@ def update_collection(task_name, task_id, update_data):
                 {'_id': video['_id']},
                 {'$set': update_data}
             )
-    elif task_name in ['run_yolo_image', 'run_yolo_video']:
-        task_collection.update_one(
+    elif task_name in ['run_yolo_image', 'run_yolo_video', 'merge_video_segments']:
+        task = task_collection.find_one_and_update(
             {'celery_task_id': task_id},
-            {'$set': update_data}
+            {'$set': update_data},
+            projection={'parent_id': 1}
         )
+        if task:
+            publish_task_event(task['_id'], update_data, task.get('parent_id'))
+    elif task_name == 'run_yolo_image_batch':
+        # 批量任务的每个文档各自记录结果，这里只处理尚未结束的文档（如整批失败）
+        query = {'celery_task_id': task_id, 'status': {'$in': ['PENDING', 'RUNNING']}}
+        ids = [doc['_id'] for doc in task_collection.find(query, {'_id': 1})]
+        if ids:
+            task_collection.update_many({'_id': {'$in': ids}}, {'$set': update_data})
+            publish_task_updates(task_collection, {'_id': {'$in': ids}}, update_data)
+
+# CPU 推理时按 prefork 进程数分配线程，必须在加载模型之前执行
+@worker_process_init.connect
+def configure_inference_threads(**kwargs):
+    try:
+        configure_cpu_threads(app.conf.worker_concurrency, getattr(current_process(), 'index', 0) or 0)
+    except Exception as e:
+        logger.error(f"Failed to configure CPU threads: {e}", exc_info=True)
+
+# worker 子进程启动时预加载模型，PRELOAD_MODEL_IDS 为逗号分隔的模型 id
+@worker_process_init.connect
+def preload_models(**kwargs):
+    model_ids = [m.strip() for m in os.getenv('PRELOAD_MODEL_IDS', '').split(',') if m.strip()]
+    for model_id in model_ids:
+        try:
+            model_info = model_collection.find_one({'_id': ObjectId(model_id)})
+            if not model_info:
+                logger.warning(f"Preload skipped, model {model_id} not found")
+                continue
+            model_cache.preload(model_id, model_info['model_path'])
+        except Exception as e:
+            logger.error(f"Failed to preload model {model_id}: {e}", exc_info=True)
+    if model_ids:
+        logger.info(f"Model cache preloaded: {model_cache.stats()}")
 
 @task_postrun.connect
 def task_postrun_handler(task_id, task, *args, retval=None, state=None, **kwargs):
@@ -95,6 +183,69 @@ def task_revoked_handler(request, terminated, signum, expired, **kwargs):
     update_data = {'status': 'REVOKED', 'end_time': time.time()}
     update_collection(request.task, request.id, update_data)
 
+# ---- Prometheus 指标 ----
+
+# 发布任务时记录入队时间，用于统计排队等待时长
+@before_task_publish.connect
+def record_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+@task_prerun.connect
+def observe_queue_wait(task_id, task, *args, **kwargs):
+    enqueued_at = getattr(task.request, 'enqueued_at', None) or (task.request.headers or {}).get('enqueued_at')
+    if enqueued_at:
+        TASK_QUEUE_WAIT_SECONDS.labels(task.name).observe(max(0, time.time() - float(enqueued_at)))
+
+@task_postrun.connect
+def count_finished_task(task_id, task, *args, state=None, **kwargs):
+    task_args = kwargs.get('args') or []
+    params = task_args[0] if task_args else None
+    if isinstance(params, list):
+        params = params[0] if params else None
+    model_id = params.get('model_id', '') if isinstance(params, dict) else ''
+    TASKS_TOTAL.labels(task.name, model_id, state or 'UNKNOWN').inc()
+
+# worker 主进程启动 exporter，子进程写入的指标通过多进程目录汇总
+@worker_init.connect
+def start_worker_metrics(**kwargs):
+    port = int(os.getenv('WORKER_METRICS_PORT', 9100))
+    if port:
+        reset_multiprocess_dir()
+        start_metrics_server(port)
+        logger.info(f"Worker metrics exporter listening on :{port}")
+
+@worker_process_shutdown.connect
+def cleanup_worker_metrics(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
+
+# 浏览器可以直接播放的编码：H.264 8bit 4:2:0 + AAC（或无音频）
+WEB_VIDEO_CODECS = {'h264'}
+WEB_PIX_FMTS = {'yuv420p', 'yuvj420p'}
+WEB_H264_PROFILES = {'Constrained Baseline', 'Baseline', 'Main', 'High'}
+WEB_AUDIO_CODECS = {'aac'}
+
+# 根据探测结果决定转换方式：兼容的流直接复制，只重新编码不兼容的流
+def plan_conversion(metadata):
+    video_ok = (
+        metadata['vcodec'] in WEB_VIDEO_CODECS
+        and metadata['pix_fmt'] in WEB_PIX_FMTS
+        and metadata['profile'] in WEB_H264_PROFILES
+    )
+    audio_ok = metadata['acodec'] is None or metadata['acodec'] in WEB_AUDIO_CODECS
+
+    video_args = ['-c:v', 'copy'] if video_ok else ['-c:v', 'libx264', '-profile:v', 'high', '-pix_fmt', 'yuv420p']
+    audio_args = ['-c:a', 'copy'] if audio_ok else ['-c:a', 'aac', '-b:a', '128k']
+    if video_ok and audio_ok:
+        mode = 'remux'
+    elif video_ok:
+        mode = 'audio_transcode'
+    elif audio_ok:
+        mode = 'video_transcode'
+    else:
+        mode = 'transcode'
+    return mode, video_args + audio_args
+
 @app.task(base=AbortableTask, bind=True, name='convert_video')
 def convert_video(self, video_id):
     try:
@@ -106,99 +257,93 @@ def convert_video(self, video_id):
             {'_id': ObjectId(video_id)},
             {'$set': {'status': 'RUNNING'}}
         )
+        timer = StageTimer('convert_video')
 
         minio_filename = video_info['minio_filename']
         file_extension = os.path.splitext(minio_filename)[1]
         unique_filename = f"{self.request.id}{file_extension}"
         local_filename = f"/tmp/{unique_filename}"
 
-        # Download file from MinIO
-        minio_client.fget_object("yolo-files", minio_filename, local_filename)
-
-        # Get video metadata
-        def get_video_metadata(file_path):
-            result = subprocess.run([
-                'ffprobe', '-v', 'quiet', '-print_format', 'json',
-                '-show_format', '-show_streams', file_path
-            ], capture_output=True, text=True)
-            metadata = json.loads(result.stdout)
-
-            video_stream = next((s for s in metadata['streams'] if s['codec_type'] == 'video'), None)
-
-            return {
-                'width': int(video_stream['width']),
-                'height': int(video_stream['height']),
-                'duration': float(metadata['format']['duration']),
-                'vcodec': video_stream['codec_name'],
-                'file_extension': os.path.splitext(file_path)[1],
-            }
-
-        # Extract metadata and update database
-        metadata = get_video_metadata(local_filename)
+        # Stream from a presigned URL when possible, otherwise download from MinIO
+        with timer.stage('download'):
+            source, downloaded = open_media_source(minio_client, "yolo-files", minio_filename, local_filename)
+
+        # 上传时已经按范围读取文件头探测过元数据，只有旧数据才需要在这里探测
+        if has_video_metadata(video_info):
+            metadata = {field: video_info[field] for field in VIDEO_METADATA_FIELDS}
+        else:
+            with timer.stage('probe'):
+                metadata = probe_video(source)
+        mode, codec_args = plan_conversion(metadata)
         media_collection.update_one(
             {'_id': ObjectId(video_id)},
-            {'$set': {
-                'width': metadata['width'],
-                'height': metadata['height'],
-                'duration': metadata['duration'],
-                'vcodec': metadata['vcodec'],
-                'file_extension': metadata['file_extension'],
-                'progress': 0
-            }}
+            {'$set': {**metadata, 'file_extension': file_extension, 'progress': 0}}
         )
 
-        # Always convert to MP4
-        print("Converting video to MP4...")
+        # Always produce a faststart MP4; copy streams that browsers can already play
+        logger.debug("Converting video %s to MP4 (%s)", video_id, mode)
         converted_filename = f"/tmp/converted_{self.request.id}.mp4"
         ffmpeg_command = [
-            '/usr/bin/ffmpeg', '-i', local_filename, 
-            '-c:v', 'libx264', '-profile:v', 'high', '-pix_fmt', 'yuv420p',
-            '-c:a', 'aac', '-b:a', '128k',  # Add audio conversion
+            '/usr/bin/ffmpeg', '-i', source,
+            '-map', '0:v:0', '-map', '0:a:0?',
+            *codec_args,
             '-movflags', '+faststart',  # Optimize for web streaming
             '-progress', 'pipe:1',
             '-y', converted_filename
         ]
-        process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-
-        duration = metadata['duration']
-        for line in process.stdout:
-            if 'time=' in line:
-                time_str = line.split('time=')[1].split()[0]
-                hours, minutes, seconds = map(float, time_str.split(':'))
-                current_time = hours * 3600 + minutes * 60 + seconds
-                progress = int((current_time / duration) * 100)
-                # Update progress in Video table
-                media_collection.update_one(
-                    {'_id': ObjectId(video_id)},
-                    {'$set': {'progress': progress}}
-                )
-
-        process.wait()
+        with timer.stage(mode):
+            process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+            duration = metadata['duration']
+            # Update progress in Video table (coalesced, written by a background thread)
+            with ProgressReporter(media_collection, {'_id': ObjectId(video_id)}) as reporter:
+                for line in process.stdout:
+                    # ffprobe 没有读到时长时（duration 为 0）无法计算进度，只等待转换完成
+                    if 'time=' in line and duration > 0:
+                        time_str = line.split('time=')[1].split()[0]
+                        try:
+                            hours, minutes, seconds = map(float, time_str.split(':'))
+                        except ValueError:
+                            # -progress 在开始时可能输出 N/A
+                            continue
+                        current_time = hours * 3600 + minutes * 60 + seconds
+                        reporter.update(min(current_time / duration, 1) * 100)
+
+                process.wait()
         if process.returncode != 0:
             raise Exception("Video conversion failed")
 
-        os.remove(local_filename)
+        if downloaded:
+            os.remove(local_filename)
         local_filename = converted_filename
 
-        # Update metadata for converted video
-        metadata = get_video_metadata(local_filename)
-
         # Upload converted file to MinIO
         converted_minio_filename = f"converted/converted_{video_id}.mp4"
-        minio_client.fput_object("yolo-files", converted_minio_filename, local_filename)
+        with timer.stage('upload'):
+            minio_client.fput_object("yolo-files", converted_minio_filename, local_filename)
 
-        # Update Video table with file info and metadata
+        # 不缩放，宽高和时长沿用第一次探测的结果；转码后的编码统一为 H.264
+        timings = timer.summary()
         media_collection.update_one(
             {'_id': ObjectId(video_id)},
             {
                 '$set': {
                     'minio_filename': converted_minio_filename,
                     'progress': 100,
-                    'width': metadata['width'],
-                    'height': metadata['height'],
-                    'duration': metadata['duration'],
-                    'vcodec': metadata['vcodec'],
+                    **metadata,
+                    'vcodec': 'h264',
+                    'pix_fmt': 'yuv420p' if mode in ('video_transcode', 'transcode') else metadata['pix_fmt'],
+                    'profile': 'High' if mode in ('video_transcode', 'transcode') else metadata['profile'],
+                    'acodec': 'aac' if metadata['acodec'] else None,
                     'file_extension': '.mp4',
+                    'conversion': {
+                        'mode': mode,
+                        'seconds': timings['stages'][mode],
+                        'source_vcodec': metadata['vcodec'],
+                        'source_acodec': metadata['acodec'],
+                        'source_pix_fmt': metadata['pix_fmt'],
+                    },
+                    'timings': timings,
                 }
             }
         )
@@ -206,7 +351,10 @@ def convert_video(self, video_id):
         # Clean up temporary file
         os.remove(local_filename)
 
-        return {'status': 'success', 'converted_filename': converted_minio_filename}
+        # 转换完成后生成海报帧和雪碧图
+        request_thumbnails(video_id)
+
+        return {'status': 'success', 'converted_filename': converted_minio_filename, 'mode': mode}
     except Exception as e:
         # Update Video table with error status
         media_collection.update_one(
@@ -215,21 +363,304 @@ def convert_video(self, video_id):
         )
         raise e
 
+# 文档关联的 MinIO 对象：媒体的原文件，任务的结果文件和检测结果
+# 任务文档里的 minio_filename 指向源媒体，不能随任务一起删除
+def collect_object_keys(collection_name, doc):
+    if collection_name == 'medias':
+        keys = [doc.get('minio_filename'), doc.get('poster'), (doc.get('sprite') or {}).get('key')]
+        keys += list((doc.get('thumbnails') or {}).values())
+    else:
+        keys = [doc.get('result_file')]
+        detections = doc.get('detections') or {}
+        keys += [detections.get('index'), detections.get('data')]
+    return [k for k in keys if k]
+
+# 删除时需要读取的字段：关联的 MinIO 对象和文档类型
+OBJECT_KEY_PROJECTION = {'minio_filename': 1, 'result_file': 1, 'detections': 1, 'thumbnails': 1, 'poster': 1, 'sprite': 1, 'media_type': 1, 'segment_count': 1}
+
+# 先按 ancestors.id 一次查出整个子树（同一查询带上所选文件夹下缺少 ancestors 的旧文档），
+# 只有查到缺少 ancestors 的旧文件夹时，才继续按 parent_id 逐层查找它们的子文档；回填完成的子树只需一次查询
+# 回填自上而下进行，带 ancestors 的文件夹下不会有旧文档（回填中途除外）
+def find_subtree(collection, folder_ids):
+    projection = {**OBJECT_KEY_PROJECTION, 'ancestors': {'$slice': 1}}
+    seen = set(ObjectId(i) for i in folder_ids)
+    query = {'$or': [
+        {'ancestors.id': {'$in': list(folder_ids)}},
+        {'parent_id': {'$in': list(folder_ids)}, 'ancestors': {'$exists': False}},
+    ]}
+    while query:
+        legacy = []
+        for doc in collection.find(query, projection):
+            if doc['_id'] in seen:
+                continue
+            seen.add(doc['_id'])
+            if doc.get('media_type') == 'folder' and 'ancestors' not in doc:
+                legacy.append(str(doc['_id']))
+            yield doc
+        # 旧文件夹的子文档可能缺少 ancestors，也可能是之后新建的（ancestors 中包含该文件夹）
+        query = {'$or': [
+            {'parent_id': {'$in': legacy}, 'ancestors': {'$exists': False}},
+            {'ancestors.id': {'$in': legacy}},
+        ]} if legacy else None
+
+# 递归删除所选文件夹的子树：所选文档已由 API 同步删除，这里删除子文档并批量删除 MinIO 对象
+# object_keys 是所选文档关联的对象，segmented_task_ids 是所选的分段处理过的任务，其分段对象需要按前缀列出
+@app.task(bind=True, name='delete_subtree')
+def delete_subtree(self, collection_name, folder_ids, object_keys=(), segmented_task_ids=()):
+    collection = {'medias': media_collection, 'tasks': task_collection}[collection_name]
+
+    self.update_state(state='PROGRESS', meta={'stage': 'collecting'})
+    doc_ids = []
+    sub_folder_ids = []
+    keys = list(object_keys)
+    segmented = list(segmented_task_ids)
+    for doc in find_subtree(collection, folder_ids):
+        doc_ids.append(doc['_id'])
+        if doc.get('media_type') == 'folder':
+            sub_folder_ids.append(doc['_id'])
+        if collection_name == 'tasks' and doc.get('segment_count'):
+            segmented.append(str(doc['_id']))
+        keys.extend(collect_object_keys(collection_name, doc))
+    folder_infos.invalidate(*[folder_info_key(collection_name, i) for i in sub_folder_ids])
+    # 分段失败或合并前被删除的任务可能留下分段对象
+    for task_doc_id in segmented:
+        keys.extend(segment_object_keys(task_doc_id))
+
+    self.update_state(state='PROGRESS', meta={'stage': 'deleting_documents', 'total_documents': len(doc_ids)})
+    deleted_count = 0
+    for start in range(0, len(doc_ids), 10000):
+        chunk = doc_ids[start:start + 10000]
+        deleted_count += collection.delete_many({'_id': {'$in': chunk}}).deleted_count
+        # 结果缓存指向被删除任务的产物，一并失效；running 条目由 API 定期清理释放
+        if collection_name == 'tasks':
+            chunk_ids = [str(i) for i in chunk]
+            result_cache_collection.delete_many({'task_doc_id': {'$in': chunk_ids}, 'state': READY})
+            result_cache_collection.update_many({'followers': {'$in': chunk_ids}}, {'$pull': {'followers': {'$in': chunk_ids}}})
+
+    total_objects = len(set(keys))
+
+    def report(removed_count):
+        self.update_state(state='PROGRESS', meta={
+            'stage': 'removing_objects',
+            'deleted_documents': deleted_count,
+            'removed_objects': removed_count,
+            'total_objects': total_objects
+        })
+
+    report(0)
+    removed_count, errors = bulk_remove_objects(minio_client, "yolo-files", keys, progress_callback=report)
+    if errors:
+        logger.warning(f"Failed to remove {len(errors)} object(s) from MinIO: {errors[:20]}")
+
+    logger.debug("Deleted %s %s document(s) and %s object(s)", deleted_count, collection_name, removed_count)
+    return {
+        'deleted_documents': deleted_count,
+        'removed_objects': removed_count,
+        'total_objects': total_objects,
+        'errors': errors[:100]
+    }
+
+# ---- 缩略图 ----
+
+def schedule_thumbnail_batch(delay):
+    generate_thumbnails.apply_async(countdown=delay)
+
+# 加入缩略图待处理列表，Redis 不可用时单独处理这一个媒体；THUMBNAILS=0 时不生成缩略图
+def request_thumbnails(media_id):
+    if not thumbnails_enabled():
+        return
+    try:
+        enqueue_thumbnails(media_id, schedule_thumbnail_batch)
+    except Exception as e:
+        logger.warning(f"Thumbnail batching unavailable, scheduling {media_id} alone: {e}")
+        generate_thumbnails.apply_async(args=[[media_id]])
+
+def upload_thumbnail(media_id, name, data):
+    key = thumbnail_key(media_id, name)
+    content_type = 'image/jpeg' if thumbnail_extension() == 'jpg' else 'image/webp'
+    minio_client.put_object("yolo-files", key, io.BytesIO(data), len(data), content_type=content_type)
+    return key
+
+def make_media_thumbnails(media):
+    media_id = str(media['_id'])
+    if media['media_type'] == 'image':
+        response = minio_client.get_object("yolo-files", media['minio_filename'])
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        return {'thumbnails': {name: upload_thumbnail(media_id, name, blob) for name, blob in image_thumbnails(data).items()}}
+
+    # 视频：海报帧同时作为 medium 缩略图，再由它缩小得到 small
+    workdir = f"/tmp/thumbs_{media_id}"
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        source, _ = open_media_source(minio_client, "yolo-files", media['minio_filename'], os.path.join(workdir, 'source.mp4'))
+        extension = thumbnail_extension()
+        poster_path = os.path.join(workdir, f"poster.{extension}")
+        sprite_path = os.path.join(workdir, f"sprite.{extension}")
+        video_poster(source, media.get('duration'), poster_path)
+        sprite = video_sprite(source, media.get('duration'), sprite_path)
+
+        with open(poster_path, 'rb') as f:
+            thumbnails = image_thumbnails(f.read())
+        with open(sprite_path, 'rb') as f:
+            sprite['key'] = upload_thumbnail(media_id, 'sprite', f.read())
+        keys = {name: upload_thumbnail(media_id, name, blob) for name, blob in thumbnails.items()}
+        return {'thumbnails': keys, 'poster': keys['medium'], 'sprite': sprite}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# 成批生成缩略图：不传 media_ids 时从 Redis 待处理列表取一批
+@app.task(bind=True, name='generate_thumbnails')
+def generate_thumbnails(self, media_ids=None):
+    batched = media_ids is None
+    if batched:
+        media_ids = take_pending(self.request.id)
+
+    operations = []
+    failed = 0
+    try:
+        medias = list(media_collection.find(
+            {'_id': {'$in': [ObjectId(i) for i in media_ids]}, 'media_type': {'$in': ['image', 'video']}},
+            {'media_type': 1, 'minio_filename': 1, 'duration': 1}
+        ))
+        with ThreadPoolExecutor(max_workers=int(os.getenv('THUMBNAIL_WORKERS', 4))) as executor:
+            futures = {executor.submit(make_media_thumbnails, media): media for media in medias}
+            for future in as_completed(futures):
+                media = futures[future]
+                try:
+                    operations.append(UpdateOne({'_id': media['_id']}, {'$set': future.result()}))
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Failed to generate thumbnails for media {media['_id']}: {e}")
+        if operations:
+            media_collection.bulk_write(operations, ordered=False)
+    finally:
+        if batched:
+            finish_batch(self.request.id, schedule_thumbnail_batch)
+
+    logger.debug("Thumbnails generated for %s media(s), %s failed", len(operations), failed)
+    return {'generated': len(operations), 'failed': failed}
+
+# ---- 结果缓存 ----
+
+# 上传时对象 ETag 不是内容 MD5（分段上传）时，由 worker 流式计算内容哈希
+@app.task(bind=True, name='hash_media')
+def hash_media(self, media_id, object_name):
+    content_hash = object_content_hash(minio_client, "yolo-files", object_name)
+    media_collection.update_one({'_id': ObjectId(media_id)}, {'$set': {'content_hash': content_hash}})
+    return content_hash
+
+# leader 任务完成后标记缓存可用，并把结果复制给等待同一结果的任务
+def notify_tasks(query, update):
+    publish_task_updates(task_collection, query, update)
+
+def publish_cached_result(params, result_file, detections):
+    if not params.cache_key:
+        return
+    try:
+        publish_result(result_cache_collection, task_collection, minio_client, "yolo-files", params.cache_key, params.inserted_id, result_file, detections, notify=notify_tasks)
+    except Exception as e:
+        logger.error(f"Failed to publish cached result for task {params.inserted_id}: {e}", exc_info=True)
+
+def release_cached_result(params, error):
+    if not params.cache_key:
+        return
+    try:
+        release_result(result_cache_collection, task_collection, params.cache_key, params.inserted_id, str(error), notify=notify_tasks)
+    except Exception as e:
+        logger.error(f"Failed to release cache entry for task {params.inserted_id}: {e}", exc_info=True)
+
+# 导出对比用的样本图片：优先取最近上传的图片，没有时使用合成图
+def sample_images(count):
+    images = []
+    for media in media_collection.find({'media_type': 'image'}, {'minio_filename': 1}).sort('_id', -1).limit(count):
+        try:
+            images.append(read_image_from_minio(minio_client, "yolo-files", media['minio_filename']))
+        except Exception as e:
+            logger.warning(f"Skip sample image {media['_id']}: {e}")
+    if not images:
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8) for _ in range(count)]
+    return images
+
+# 模型文档很少变化，每个任务都读一次时走读穿透缓存
+def get_model_info(model_id):
+    return model_docs.get(model_id, lambda: model_collection.find_one({'_id': ObjectId(model_id)}))
+
+# 导出状态和产物写入模型文档后使缓存失效，API 和其他 worker 能看到新的导出结果
+def invalidate_model_info(model_id):
+    model_docs.invalidate(model_id)
+    model_list.invalidate(MODEL_LIST_KEY)
+
+# 模型注册后导出 ONNX / OpenVINO 产物，并记录与 PyTorch 的速度和精度对比
+# 在视频推理队列上执行，延迟在推理 worker 所在的节点上测得，报告中记录 worker 名称
+@app.task(bind=True, name='export_model')
+def export_model(self, model_id):
+    model_info = model_collection.find_one({'_id': ObjectId(model_id)})
+    if not model_info:
+        raise Exception(f"Model with id {model_id} not found")
+
+    model_collection.update_one(
+        {'_id': ObjectId(model_id)},
+        {'$set': {'export_status': 'RUNNING', 'export_task_id': self.request.id}}
+    )
+    invalidate_model_info(model_id)
+    try:
+        images = sample_images(int(os.getenv('MODEL_EXPORT_EVAL_IMAGES', 16)))
+        artifacts, report = export_and_compare(model_id, model_info['model_path'], images)
+        report['host'] = self.request.hostname
+    except Exception as e:
+        model_collection.update_one(
+            {'_id': ObjectId(model_id)},
+            {'$set': {'export_status': 'FAILURE', 'export_error': str(e)}}
+        )
+        invalidate_model_info(model_id)
+        raise
+
+    model_collection.update_one(
+        {'_id': ObjectId(model_id)},
+        {'$set': {'export_status': 'SUCCESS', 'exports': artifacts, 'export_report': report}}
+    )
+    invalidate_model_info(model_id)
+    logger.info(f"Model {model_id} export finished: {len([a for a in artifacts if a['status'] == 'ready'])}/{len(artifacts)} artifact(s) ready")
+    return report
+
 # 下载文件
 def download_file_from_minio(minio_client, bucket_name, minio_filename, local_filename):
     try:
         minio_client.fget_object(bucket_name, minio_filename, local_filename)
-        logger.debug(f'File downloaded to: {local_filename}')
+        logger.debug('File downloaded to: %s', local_filename)
         return local_filename
     except Exception as e:
         raise Exception(f"Failed to download file from MinIO: {e}")
 
 
+# 直接把图片读入内存并解码，不经过 /tmp
+def read_image_from_minio(minio_client, bucket_name, minio_filename):
+    try:
+        response = minio_client.get_object(bucket_name, minio_filename)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    except Exception as e:
+        raise Exception(f"Failed to read file from MinIO: {e}")
+
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise Exception(f"Failed to decode image {minio_filename}")
+    return image
+
+
 # 上传文件
 def upload_file_to_minio(minio_client, bucket_name, local_filepath, remote_filepath):
     try:
         minio_client.fput_object(bucket_name, remote_filepath, local_filepath)
-        logger.debug(f'File uploaded to: {remote_filepath}')
+        logger.debug('File uploaded to: %s', remote_filepath)
     except Exception as e:
         raise Exception(f"Failed to upload file to MinIO: {e}")
 
@@ -238,56 +669,117 @@ def upload_file_to_minio(minio_client, bucket_name, local_filepath, remote_filep
 def remove_local_file(filepath):
     try:
         os.remove(filepath)
-        logger.debug(f'Local file {filepath} deleted')
+        logger.debug('Local file %s deleted', filepath)
     except FileNotFoundError:
         logger.warning(f'Local file {filepath} not found for deletion')
     except Exception as e:
         raise Exception(f"Failed to delete local file {filepath}: {e}")
 
 
-# 更新任务状态
+# 更新任务状态，并把状态/进度变化推送给订阅的客户端
 def update_task_status(task_collection, task_id, update_fields):
     try:
-        task_collection.update_one(
+        task = task_collection.find_one_and_update(
             {'_id': ObjectId(task_id)},
-            {'$set': update_fields}
+            {'$set': update_fields},
+            projection={'parent_id': 1}
         )
-        logger.debug(f"Task {task_id} updated with {update_fields}")
+        logger.debug("Task %s updated with %s", task_id, update_fields)
+        if task:
+            publish_task_event(task_id, update_fields, task.get('parent_id'))
     except Exception as e:
         raise Exception(f"Failed to update task {task_id}: {e}")
 
 
-# 处理 YOLO 预测
-def perform_yolo_prediction(model, local_filename, params: YOLOTaskModel):
+# 保存单张预测结果图像，source_name 用于生成结果文件名
+def save_result_image(result, source_name):
+    # 处理预测结果
+    im_array = result.plot(font_size=8, line_width=1)
+    im = Image.fromarray(im_array[..., ::-1])  # RGB PIL image
+
+    # 保存结果图像       
+    result_filename = f"result_{os.path.basename(source_name)}"
+    # 从环境变量获取 RESULT_DIR，默认为 '/tmp/results' 如果未设置
+    RESULT_DIR = os.getenv('RESULT_DIR', '/tmp/results')
+    result_filepath = os.path.join(RESULT_DIR, result_filename)
+    os.makedirs(os.path.dirname(result_filepath), exist_ok=True)
+    im.save(result_filepath)
+
+    logger.debug("Result saved at: %s", result_filepath)
+    return result_filepath
+
+
+# 保存结果图像和结构化检测结果，返回 (result_filepath, detection_writer)
+def save_prediction(result, source_name, timer=None):
+    with stage(timer, 'render'):
+        result_filepath = save_result_image(result, source_name)
+    detection_writer = DetectionWriter(os.path.splitext(result_filepath)[0])
     try:
-        # YOLO 模型进行预测
-        results = model.predict(
-            local_filename, 
-            conf=params.conf, 
-            imgsz=(params.height,params.width), 
-            augment=params.augment, 
-            classes=params.detect_class_indices, 
-            device='cuda:0'
-        )
+        with stage(timer, 'detections'):
+            detection_writer.add(result)
+            detection_writer.close()
+    except Exception:
+        detection_writer.discard()
+        remove_local_file(result_filepath)
+        raise
+    return result_filepath, detection_writer
 
-        # 处理预测结果
-        im_array = results[0].plot(font_size=8, line_width=1)
-        im = Image.fromarray(im_array[..., ::-1])  # RGB PIL image
 
-        # 保存结果图像       
-        result_filename = f"result_{os.path.basename(local_filename)}"
-        # 从环境变量获取 RESULT_DIR，默认为 '/tmp/results' 如果未设置
-        RESULT_DIR = os.getenv('RESULT_DIR', '/tmp/results')
-        result_filepath = os.path.join(RESULT_DIR, result_filename)
-        os.makedirs(os.path.dirname(result_filepath), exist_ok=True)
-        im.save(result_filepath)
+# 处理 YOLO 预测，source 可以是本地路径或已解码的图像数组
+def perform_yolo_prediction(model, source, params: YOLOTaskModel, source_name=None, timer=None):
+    try:
+        # YOLO 模型进行预测
+        with stage(timer, 'inference'):
+            results = model.predict(
+                source, 
+                conf=params.conf, 
+                imgsz=(params.height,params.width), 
+                augment=params.augment, 
+                classes=params.detect_class_indices, 
+                device=resolve_device(params.device)
+            )
 
-        logger.debug(f"Result saved at: {result_filepath}")
-        return result_filepath
+        return save_prediction(results[0], source_name or source, timer)
     except Exception as e:
         raise Exception(f"YOLO prediction failed: {e}")
 
 
+# 批量 YOLO 预测，返回与输入顺序一致的 ((result_filepath, detection_writer), error) 列表
+def perform_yolo_batch_prediction(model, local_filenames, params: YOLOTaskModel, batch_size, timer=None):
+    device = resolve_device(params.device)
+    outputs = []
+    for start in range(0, len(local_filenames), batch_size):
+        chunk = local_filenames[start:start + batch_size]
+        try:
+            with stage(timer, 'inference'):
+                results = model.predict(
+                    chunk,
+                    conf=params.conf,
+                    imgsz=(params.height, params.width),
+                    augment=params.augment,
+                    classes=params.detect_class_indices,
+                    device=device,
+                    batch=batch_size,
+                    verbose=False
+                )
+        except Exception as e:
+            # 整批失败时逐张重试，把错误限定在出问题的图片上
+            logger.warning(f"Batch prediction failed, retrying images one by one: {e}")
+            for local_filename in chunk:
+                try:
+                    outputs.append((perform_yolo_prediction(model, local_filename, params, timer=timer), None))
+                except Exception as single_error:
+                    outputs.append((None, str(single_error)))
+            continue
+
+        for local_filename, result in zip(chunk, results):
+            try:
+                outputs.append((save_prediction(result, local_filename, timer), None))
+            except Exception as e:
+                outputs.append((None, f"Failed to save result: {e}"))
+    return outputs
+
+
 # Celery 任务
 @app.task(base=Task, bind=True, name='run_yolo_image')
 def run_yolo_image(self, task_params: dict):
@@ -295,11 +787,12 @@ def run_yolo_image(self, task_params: dict):
         # 验证参数
         try:
             params = YOLOTaskModel(**task_params)
-            logger.warning(f"Start processing image : {params}")
+            logger.debug("Start processing image : %s", params)
         except ValidationError as e:
             raise Exception(f"Invalid task parameters: {e}")
         
-        logger.debug(f"Start processing image {params.media_id}")
+        logger.debug("Start processing image %s", params.media_id)
+        timer = StageTimer('run_yolo_image')
 
         # 获取媒体信息
         media_info = media_collection.find_one({'_id': ObjectId(params.media_id)})
@@ -309,50 +802,222 @@ def run_yolo_image(self, task_params: dict):
         # 更新任务状态为 RUNNING
         update_task_status(task_collection, params.inserted_id, {'celery_task_id': self.request.id, 'status': 'RUNNING'})
 
-        # 下载文件
+        # 读取文件：默认直接读入内存，关闭 STREAM_INPUT 时下载到 /tmp
         minio_filename = media_info['minio_filename']
         file_extension = os.path.splitext(minio_filename)[1]
         unique_filename = f"{self.request.id}{file_extension}"
-        local_filename = download_file_from_minio(minio_client, "yolo-files", minio_filename, f"/tmp/{unique_filename}")
+        with timer.stage('download'):
+            if stream_input_enabled():
+                source = read_image_from_minio(minio_client, "yolo-files", minio_filename)
+                local_filename = None
+            else:
+                local_filename = download_file_from_minio(minio_client, "yolo-files", minio_filename, f"/tmp/{unique_filename}")
+                source = local_filename
 
         # 加载 YOLO 模型
-        model_info = model_collection.find_one({'_id': ObjectId(params.model_id)})
-        if not model_info:
-            raise Exception(f"Model with id {params.model_id} not found")
-        
-        model = YOLO(model_info['model_path'])
+        with timer.stage('model_load'):
+            model_info = get_model_info(params.model_id)
+            if not model_info:
+                raise Exception(f"Model with id {params.model_id} not found")
+            
+            model, backend = load_inference_model(model_cache, params.model_id, model_info, params)
 
         # 执行 YOLO 预测
-        result_filepath = perform_yolo_prediction(model, local_filename, params)
+        result_filepath, detection_writer = perform_yolo_prediction(model, source, params, source_name=unique_filename, timer=timer)
 
-        # 上传结果文件到 MinIO
-        upload_file_to_minio(minio_client, "yolo-files", result_filepath, f"results/{os.path.basename(result_filepath)}")
+        # 上传结果文件和检测结果到 MinIO
+        with timer.stage('upload'):
+            upload_file_to_minio(minio_client, "yolo-files", result_filepath, f"results/{os.path.basename(result_filepath)}")
+            detections = detection_writer.upload(minio_client, "yolo-files", params.inserted_id)
 
         # 更新任务状态为完成
-        update_task_status(task_collection, params.inserted_id, {'progress': 100, 'result_file': f"results/{os.path.basename(result_filepath)}"})
+        update_task_status(task_collection, params.inserted_id, {'progress': 100, 'result_file': f"results/{os.path.basename(result_filepath)}", 'detections': detections, 'timings': timer.summary(), 'inference_backend': backend})
+        publish_cached_result(params, f"results/{os.path.basename(result_filepath)}", detections)
 
         # 清理本地文件
-        remove_local_file(local_filename)
+        if local_filename:
+            remove_local_file(local_filename)
         remove_local_file(result_filepath)
 
-        logger.debug(f"Image {params.media_id} processing completed successfully")
+        logger.debug("Image %s processing completed successfully", params.media_id)
         return f"Image {params.media_id} processing completed, result file: results/{os.path.basename(result_filepath)}"
     
     except Exception as e:
         logger.error(f"Error processing image {params.media_id}: {str(e)}", exc_info=True)
+        release_cached_result(params, e)
         raise
 
+# 批量图片任务：同一模型和参数的多张图片共用一次查询、一次模型加载和批量推理
+@app.task(base=Task, bind=True, name='run_yolo_image_batch')
+def run_yolo_image_batch(self, task_params_list: list, batch_size: int = None):
+    try:
+        params_list = [YOLOTaskModel(**task_params) for task_params in task_params_list]
+    except ValidationError as e:
+        raise Exception(f"Invalid task parameters: {e}")
+
+    if not params_list:
+        return "Empty batch"
+
+    batch_size = batch_size or int(os.getenv('YOLO_BATCH_SIZE', 16))
+    download_workers = int(os.getenv('BATCH_DOWNLOAD_WORKERS', 8))
+    shared = params_list[0]
+    logger.debug("Start processing image batch of %s with model %s", len(params_list), shared.model_id)
+    timer = StageTimer('run_yolo_image_batch')
+
+    # 更新所有任务状态为 RUNNING
+    task_collection.bulk_write([
+        UpdateOne({'_id': ObjectId(p.inserted_id)}, {'$set': {'celery_task_id': self.request.id, 'status': 'RUNNING'}})
+        for p in params_list
+    ], ordered=False)
+    for p in params_list:
+        publish_task_event(p.inserted_id, {'status': 'RUNNING'}, p.parent_id)
+
+    # 一次 $in 查询获取所有媒体信息
+    media_ids = list({ObjectId(p.media_id) for p in params_list})
+    media_infos = {str(m['_id']): m for m in media_collection.find({'_id': {'$in': media_ids}})}
+
+    model_info = get_model_info(shared.model_id)
+    if not model_info:
+        raise Exception(f"Model with id {shared.model_id} not found")
+
+    errors = {}
+
+    # 并发下载
+    def download(p):
+        media_info = media_infos.get(p.media_id)
+        if not media_info:
+            raise Exception(f"File with id {p.media_id} not found")
+        minio_filename = media_info['minio_filename']
+        file_extension = os.path.splitext(minio_filename)[1]
+        local_filename = f"/tmp/{self.request.id}_{p.inserted_id}{file_extension}"
+        return download_file_from_minio(minio_client, "yolo-files", minio_filename, local_filename)
+
+    local_files = {}
+    with timer.stage('download'), ThreadPoolExecutor(max_workers=download_workers) as executor:
+        futures = {executor.submit(download, p): p for p in params_list}
+        for future in as_completed(futures):
+            p = futures[future]
+            try:
+                local_files[p.inserted_id] = future.result()
+            except Exception as e:
+                errors[p.inserted_id] = str(e)
+
+    ready = [p for p in params_list if p.inserted_id in local_files]
+    result_files = {}
+    if ready:
+        with timer.stage('model_load'):
+            model, backend = load_inference_model(model_cache, shared.model_id, model_info, shared)
+        outputs = perform_yolo_batch_prediction(model, [local_files[p.inserted_id] for p in ready], shared, batch_size, timer)
+        for p, (output, error) in zip(ready, outputs):
+            if error:
+                errors[p.inserted_id] = error
+            else:
+                result_files[p.inserted_id] = output
+
+    # 并发上传结果
+    def upload(item):
+        inserted_id, (result_filepath, detection_writer) = item
+        upload_file_to_minio(minio_client, "yolo-files", result_filepath, f"results/{os.path.basename(result_filepath)}")
+        return detection_writer.upload(minio_client, "yolo-files", inserted_id)
+
+    uploaded = {}
+    with timer.stage('upload'), ThreadPoolExecutor(max_workers=download_workers) as executor:
+        futures = {executor.submit(upload, item): item[0] for item in result_files.items()}
+        for future in as_completed(futures):
+            inserted_id = futures[future]
+            try:
+                uploaded[inserted_id] = future.result()
+            except Exception as e:
+                errors[inserted_id] = str(e)
+
+    # 一次 bulk_write 更新所有任务文档
+    end_time = time.time()
+    # 整批共享一份耗时汇总，各阶段为整批的总耗时
+    timings = {**timer.summary(), 'batch_items': len(params_list)}
+    operations = []
+    updates = []
+    for p in params_list:
+        if p.inserted_id in uploaded:
+            update_fields = {
+                'status': 'SUCCESS',
+                'progress': 100,
+                'result_file': f"results/{os.path.basename(result_files[p.inserted_id][0])}",
+                'detections': uploaded[p.inserted_id],
+                'timings': timings,
+                'inference_backend': backend,
+                'end_time': end_time
+            }
+        else:
+            update_fields = {
+                'status': 'FAILURE',
+                'error_message': errors.get(p.inserted_id, 'Unknown error'),
+                'end_time': end_time
+            }
+        operations.append(UpdateOne({'_id': ObjectId(p.inserted_id)}, {'$set': update_fields}))
+        updates.append((p, update_fields))
+    task_collection.bulk_write(operations, ordered=False)
+    for p, update_fields in updates:
+        publish_task_event(p.inserted_id, update_fields, p.parent_id)
+
+    # 清理本地文件
+    for local_filename in local_files.values():
+        remove_local_file(local_filename)
+    for result_filepath, detection_writer in result_files.values():
+        remove_local_file(result_filepath)
+        detection_writer.discard()
+
+    if errors:
+        logger.warning(f"Image batch finished with {len(errors)} failure(s): {errors}")
+    logger.debug("Image batch processing completed, %s/%s succeeded", len(uploaded), len(params_list))
+    return {'succeeded': len(uploaded), 'failed': len(errors)}
+
+def progress_publisher(params):
+    return lambda value: publish_task_event(params.inserted_id, {'progress': value}, params.parent_id)
+
+# 逐帧推理并写入编码器和检测结果，返回处理的帧数；is_aborted() 为真时返回 None
+def annotate_frames(cap, model, params, device, out, detection_writer, reporter, timer, is_aborted, total_frames=None):
+    if total_frames is None:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_count = 0
+    while True:
+        with timer.stage('decode'):
+            ret, source_frame = cap.read()
+        if not ret:
+            break
+        frame_count += 1
+
+        # 进行预测
+        with timer.stage('inference'):
+            result = model.predict(source_frame, conf=params.conf, imgsz=(params.height, params.width), augment=params.augment, classes=params.detect_class_indices, device=device, verbose=False)[0]
+
+        # 处理每一帧
+        with timer.stage('detections'):
+            detection_writer.add(result)
+        with timer.stage('render'):
+            im_array = result.plot()
+            frame = cv2.resize(im_array, (params.width, params.height))
+        with timer.stage('encode'):
+            out.write(frame)
+
+        # 更新进度（流式读取时部分容器拿不到总帧数）
+        if total_frames > 0:
+            reporter.update(min(frame_count / total_frames, 1) * 100)
+
+        if is_aborted():
+            return None
+    return frame_count
+
 @app.task(base=AbortableTask, bind=True, name='run_yolo_video')
 def run_yolo_video(self, task_params: dict):
     try:
         # 验证参数
         try:
             params = YOLOTaskModel(**task_params)
-            logger.debug(f"Start processing video: {params}")
         except ValidationError as e:
             raise Exception(f"Invalid task parameters: {e}")
 
-        logger.debug(f"Start processing video {params.media_id}")
+        logger.debug("Start processing video %s", params.media_id)
+        timer = StageTimer('run_yolo_video')
 
         # 获取媒体信息
         media_info = media_collection.find_one({'_id': ObjectId(params.media_id)})
@@ -362,75 +1027,357 @@ def run_yolo_video(self, task_params: dict):
         # 更新任务状态为 RUNNING
         update_task_status(task_collection, params.inserted_id, {'celery_task_id': self.request.id, 'status': 'RUNNING'})
 
-        # 下载文件
+        # 长视频切分成多段，由多个 worker 并行处理
+        if should_split_video(media_info):
+            return dispatch_video_segments(self, params, media_info)
+
+        # 打开视频：faststart 的视频直接从预签名 URL 边读边解码，否则先下载
         minio_filename = media_info['minio_filename']
         file_extension = os.path.splitext(minio_filename)[1]
         unique_filename = f"{self.request.id}{file_extension}"
-        local_filename = download_file_from_minio(minio_client, "yolo-files", minio_filename, f"/tmp/{unique_filename}")
+        local_filename = f"/tmp/{unique_filename}"
+        with timer.stage('download'):
+            source, downloaded = open_media_source(minio_client, "yolo-files", minio_filename, local_filename)
 
         # 加载 YOLO 模型
-        model_info = model_collection.find_one({'_id': ObjectId(params.model_id)})
-        if not model_info:
-            raise Exception(f"Model with id {params.model_id} not found")
-        
-        model = YOLO(model_info['model_path'])
-
-        # 设置视频写入器
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        with timer.stage('model_load'):
+            model_info = get_model_info(params.model_id)
+            if not model_info:
+                raise Exception(f"Model with id {params.model_id} not found")
+            
+            model, backend = load_inference_model(model_cache, params.model_id, model_info, params)
+
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise Exception(f"Failed to open video {minio_filename}")
+        # 帧率和帧数使用上传时探测的元数据，旧数据才从解码器读取
+        fps = media_info.get('fps') or cap.get(cv2.CAP_PROP_FPS)
+        total_frames = media_info.get('frame_count')
+
+        # 设置视频写入器：帧直接送入 ffmpeg 编码为 H.264，不再二次转码
         output_filename = f"result_{unique_filename.split('.')[0]}.mp4"
         output_filename_relative_path = f"results/{output_filename}"
         os.makedirs(os.path.dirname(output_filename_relative_path), exist_ok=True)
-        fps = cv2.VideoCapture(local_filename).get(cv2.CAP_PROP_FPS)
-        out = cv2.VideoWriter(output_filename_relative_path, fourcc, fps, (params.width, params.height))
-
-        # 进行预测
-        results = model(local_filename, stream=True, conf=params.conf, imgsz=(params.height, params.width), augment=params.augment, classes=params.detect_class_indices, device='cuda:0')
-
-        frame_count = 0
-        total_frames = int(cv2.VideoCapture(local_filename).get(cv2.CAP_PROP_FRAME_COUNT))
+        out = FFmpegVideoWriter(output_filename_relative_path, params.width, params.height, fps)
+        detection_writer = DetectionWriter(f"results/{unique_filename.split('.')[0]}")
 
-        for result in results:
-            frame_count += 1
-            progress = int((frame_count / total_frames) * 100)
-
-            # 处理每一帧
-            im_array = result.plot()
-            frame = cv2.resize(im_array, (params.width, params.height))
-            out.write(frame)
-
-            # 更新进度
-            update_task_status(task_collection, params.inserted_id, {'progress': progress})
-
-            if self.is_aborted():
-                logger.debug(f"Video {params.media_id} processing aborted")
-                out.release()
+        # 进度合并写入，退出时（成功、异常、中止）保证最后一次进度落库
+        try:
+            with ProgressReporter(task_collection, {'_id': ObjectId(params.inserted_id)}, on_write=progress_publisher(params)) as reporter:
+                frame_count = annotate_frames(cap, model, params, resolve_device(params.device), out, detection_writer, reporter, timer, self.is_aborted, total_frames)
+            if frame_count is None:
+                logger.debug("Video %s processing aborted", params.media_id)
+                out.abort()
+                detection_writer.discard()
+                if downloaded:
+                    remove_local_file(local_filename)
+                release_cached_result(params, "aborted")
                 return "Task aborted"
+        except Exception:
+            out.abort()
+            detection_writer.discard()
+            raise
+        finally:
+            cap.release()
 
-        out.release()
-
-        # FFmpeg转码
-        transcoded_output = f"results/transcoded_{output_filename}"
-        ffmpeg_command = [
-            '/usr/bin/ffmpeg', '-i', output_filename_relative_path, 
-            '-c:v', 'libx264', '-profile:v', 'high', '-pix_fmt', 'yuv420p',
-            '-y', transcoded_output
-        ]
-        subprocess.run(ffmpeg_command, check=True)
+        with timer.stage('encode_flush'):
+            out.release()
 
         # 上传结果文件到 MinIO
-        upload_file_to_minio(minio_client, "yolo-files", transcoded_output, f"results/{output_filename}")
+        with timer.stage('upload'):
+            upload_file_to_minio(minio_client, "yolo-files", output_filename_relative_path, f"results/{output_filename}")
+            detections = detection_writer.upload(minio_client, "yolo-files", params.inserted_id)
+
+        timings = timer.summary(frames=frame_count)
+        FRAMES_TOTAL.labels(params.model_id).inc(frame_count)
+        if timings['fps']:
+            VIDEO_FPS.labels(params.model_id).observe(timings['fps'])
 
         # 更新任务状态
-        update_task_status(task_collection, params.inserted_id, {'progress': 100, 'result_file': f"results/{output_filename}"})
+        update_task_status(task_collection, params.inserted_id, {'progress': 100, 'result_file': f"results/{output_filename}", 'detections': detections, 'timings': timings, 'inference_backend': backend})
+        publish_cached_result(params, f"results/{output_filename}", detections)
 
         # 清理临时文件
-        remove_local_file(local_filename)
+        if downloaded:
+            remove_local_file(local_filename)
         remove_local_file(output_filename_relative_path)
-        remove_local_file(transcoded_output)
 
-        logger.debug(f"Video {params.media_id} processing completed successfully")
+        logger.debug("Video %s processing completed successfully", params.media_id)
         return f"Video {params.media_id} processing completed, result file: results/{output_filename}"
     
     except Exception as e:
         logger.error(f"Error processing video {params.media_id}: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        release_cached_result(params, e)
+        raise
+
+# ---- 长视频分段并行处理 ----
+
+# 分段长度（秒），为 0 时关闭分段；只有时长不少于 VIDEO_SEGMENT_MIN_DURATION 的视频才切分
+def should_split_video(media_info):
+    segment_seconds = float(os.getenv('VIDEO_SEGMENT_SECONDS', 120))
+    min_duration = float(os.getenv('VIDEO_SEGMENT_MIN_DURATION', 600))
+    duration = media_info.get('duration') or 0
+    return segment_seconds > 0 and duration >= max(min_duration, 2 * segment_seconds)
+
+# 分段进度写入后读回合并后的总进度再推送
+def segment_progress_publisher(params):
+    def publish(value):
+        task = task_collection.find_one({'_id': ObjectId(params.inserted_id)}, {'progress': 1})
+        if task and task.get('progress') is not None:
+            publish_task_event(params.inserted_id, {'progress': task['progress']}, params.parent_id)
+    return publish
+
+def segment_prefix(task_doc_id):
+    return f"segments/{task_doc_id}"
+
+# 分段源文件、分段结果和分段检测结果都在 segment_prefix 下；旧版本的分段检测结果在 results/detections/<id>_segNNNN
+def segment_object_keys(task_doc_id):
+    keys = []
+    for prefix in (f"{segment_prefix(task_doc_id)}/", f"results/detections/{task_doc_id}_seg"):
+        keys += [obj.object_name for obj in minio_client.list_objects("yolo-files", prefix=prefix, recursive=True)]
+    return keys
+
+def remove_segment_objects(task_doc_id):
+    _, errors = bulk_remove_objects(minio_client, "yolo-files", segment_object_keys(task_doc_id))
+    if errors:
+        logger.warning(f"Failed to remove {len(errors)} segment object(s) of task {task_doc_id}: {errors[:20]}")
+
+# 各分段进度写入 segment_progress.<序号>，同一次更新里把总进度设为各段平均值（合并完成前最多 99）
+def segment_progress_update(segment_index):
+    def build(value):
+        return [
+            {'$set': {f'segment_progress.{segment_index}': value}},
+            {'$set': {'progress': {'$min': [99, {'$floor': {'$avg': {
+                '$map': {'input': {'$objectToArray': '$segment_progress'}, 'in': '$$this.v'}
+            }}}]}}},
+        ]
+    return build
+
+# 按关键帧流复制切分（不重新编码），上传分段后以 chord 分发推理任务，最后由 merge_video_segments 拼接
+def dispatch_video_segments(self, params, media_info):
+    segment_seconds = float(os.getenv('VIDEO_SEGMENT_SECONDS', 120))
+    minio_filename = media_info['minio_filename']
+    workdir = f"/tmp/split_{self.request.id}"
+    os.makedirs(workdir, exist_ok=True)
+    local_filename = os.path.join(workdir, f"source{os.path.splitext(minio_filename)[1]}")
+    try:
+        source, _ = open_media_source(minio_client, "yolo-files", minio_filename, local_filename)
+        result = subprocess.run([
+            '/usr/bin/ffmpeg', '-loglevel', 'error', '-i', source,
+            '-map', '0:v:0', '-c', 'copy', '-an',
+            '-f', 'segment', '-segment_time', str(segment_seconds), '-reset_timestamps', '1',
+            '-segment_format_options', 'movflags=+faststart',
+            os.path.join(workdir, 'seg_%04d.mp4')
+        ], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Video split failed: {result.stderr.strip()}")
+
+        segment_files = sorted(f for f in os.listdir(workdir) if f.startswith('seg_'))
+        segment_keys = [f"{segment_prefix(params.inserted_id)}/{f}" for f in segment_files]
+        with ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_DOWNLOAD_WORKERS', 8))) as executor:
+            list(executor.map(
+                lambda item: upload_file_to_minio(minio_client, "yolo-files", os.path.join(workdir, item[0]), item[1]),
+                zip(segment_files, segment_keys)
+            ))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 预先生成任务 id：任务文档改为跟踪合并任务，取消时可以一并撤销所有分段
+    merge_task_id = str(uuid.uuid4())
+    segment_task_ids = [str(uuid.uuid4()) for _ in segment_keys]
+    update_task_status(task_collection, params.inserted_id, {
+        'celery_task_id': merge_task_id,
+        'segment_task_ids': segment_task_ids,
+        'segment_count': len(segment_keys),
+        'segment_progress': {str(i): 0 for i in range(len(segment_keys))},
+        'segments_started_at': time.time(),
+        'progress': 0
+    })
+
+    # 分段沿用原视频任务的优先级
+    task_params = params.model_dump()
+    priority = (self.request.delivery_info or {}).get('priority', DEFAULT_PRIORITY)
+    chord([
+        run_yolo_video_segment.s(task_params, i, key).set(task_id=task_id, priority=priority)
+        for i, (key, task_id) in enumerate(zip(segment_keys, segment_task_ids))
+    ])(merge_video_segments.s(task_params).set(task_id=merge_task_id, priority=priority))
+
+    logger.info(f"Video {params.media_id} split into {len(segment_keys)} segment(s), merge task {merge_task_id}")
+    return {'segments': len(segment_keys), 'merge_task_id': merge_task_id}
+
+@app.task(base=AbortableTask, bind=True, name='run_yolo_video_segment')
+def run_yolo_video_segment(self, task_params, segment_index, segment_key):
+    params = YOLOTaskModel(**task_params)
+    timer = StageTimer('run_yolo_video_segment')
+    local_prefix = f"/tmp/{self.request.id}"
+    try:
+        with timer.stage('download'):
+            source, downloaded = open_media_source(minio_client, "yolo-files", segment_key, f"{local_prefix}.mp4")
+
+        with timer.stage('model_load'):
+            model_info = get_model_info(params.model_id)
+            if not model_info:
+                raise Exception(f"Model with id {params.model_id} not found")
+            model, backend = load_inference_model(model_cache, params.model_id, model_info, params)
+
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise Exception(f"Failed to open segment {segment_key}")
+
+        output_path = f"{local_prefix}_result.mp4"
+        out = FFmpegVideoWriter(output_path, params.width, params.height, cap.get(cv2.CAP_PROP_FPS))
+        detection_writer = DetectionWriter(local_prefix)
+        try:
+            with ProgressReporter(task_collection, {'_id': ObjectId(params.inserted_id)}, build_update=segment_progress_update(segment_index), on_write=segment_progress_publisher(params)) as reporter:
+                frame_count = annotate_frames(cap, model, params, resolve_device(params.device), out, detection_writer, reporter, timer, self.is_aborted)
+                if frame_count is not None:
+                    reporter.update(100)
+            if frame_count is None:
+                raise Exception(f"Segment {segment_index} aborted")
+        except Exception:
+            out.abort()
+            detection_writer.discard()
+            raise
+        finally:
+            cap.release()
+            if downloaded:
+                remove_local_file(f"{local_prefix}.mp4")
+
+        with timer.stage('encode_flush'):
+            out.release()
+
+        prefix = segment_prefix(params.inserted_id)
+        result_key = f"{prefix}/result_{segment_index:04d}.mp4"
+        with timer.stage('upload'):
+            upload_file_to_minio(minio_client, "yolo-files", output_path, result_key)
+            detections = detection_writer.upload(minio_client, "yolo-files", params.inserted_id, keys=(
+                f"{prefix}/index_{segment_index:04d}.npy", f"{prefix}/detections_{segment_index:04d}.bin"
+            ))
+        remove_local_file(output_path)
+
+        # 其他分段已经失败时合并任务不会执行，上传期间可能错过了失败分段的清理，这里再清理一次
+        if task_collection.find_one({'_id': ObjectId(params.inserted_id), 'status': 'FAILURE'}, {'_id': 1}):
+            remove_segment_objects(params.inserted_id)
+
+        return {
+            'index': segment_index,
+            'source': segment_key,
+            'result': result_key,
+            'detections': detections,
+            'frames': frame_count,
+            'backend': backend,
+            'timings': timer.summary(frames=frame_count)
+        }
+    except Exception as e:
+        # chord 中任意分段失败时合并任务不会执行，直接把任务文档标记为失败
+        logger.error(f"Error processing segment {segment_index} of video {params.media_id}: {e}", exc_info=True)
+        update = {'status': 'FAILURE', 'error_message': f"Segment {segment_index}: {e}", 'end_time': time.time()}
+        task = task_collection.find_one_and_update(
+            {'_id': ObjectId(params.inserted_id), 'status': {'$nin': ['FAILURE', 'REVOKED']}},
+            {'$set': update},
+            projection={'parent_id': 1, 'segment_task_ids': 1}
+        )
+        # 第一个失败的分段负责撤销其余分段，避免它们继续占用视频推理队列
+        if task:
+            publish_task_event(params.inserted_id, update, task.get('parent_id'))
+            siblings = [t for t in task.get('segment_task_ids', []) if t != self.request.id]
+            if siblings:
+                app.control.revoke(siblings, terminate=True)
+            release_cached_result(params, e)
+        # merge_video_segments 不会执行，分段对象由失败的分段删除
+        remove_segment_objects(params.inserted_id)
+        raise
+
+@app.task(bind=True, name='merge_video_segments')
+def merge_video_segments(self, segment_results, task_params):
+    params = YOLOTaskModel(**task_params)
+    timer = StageTimer('merge_video_segments')
+    segment_results = sorted(segment_results, key=lambda r: r['index'])
+    workdir = f"/tmp/merge_{self.request.id}"
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        # 并发下载各分段的结果视频和检测结果
+        def download(item):
+            i, segment = item
+            paths = (os.path.join(workdir, f"{i:04d}.mp4"), os.path.join(workdir, f"{i:04d}_index.npy"), os.path.join(workdir, f"{i:04d}_detections.bin"))
+            download_file_from_minio(minio_client, "yolo-files", segment['result'], paths[0])
+            download_file_from_minio(minio_client, "yolo-files", segment['detections']['index'], paths[1])
+            download_file_from_minio(minio_client, "yolo-files", segment['detections']['data'], paths[2])
+            return paths
+
+        with timer.stage('download'), ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_DOWNLOAD_WORKERS', 8))) as executor:
+            parts = list(executor.map(download, enumerate(segment_results)))
+
+        # 所有分段编码参数相同，concat 直接流复制
+        output_filename = f"result_{params.inserted_id}.mp4"
+        output_path = os.path.join(workdir, output_filename)
+        list_path = os.path.join(workdir, 'segments.txt')
+        with open(list_path, 'w') as f:
+            f.writelines(f"file '{video}'\n" for video, _, _ in parts)
+        with timer.stage('concat'):
+            result = subprocess.run([
+                '/usr/bin/ffmpeg', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                '-c', 'copy', '-movflags', '+faststart', '-y', output_path
+            ], capture_output=True, text=True)
+            if result.returncode != 0:
+                raise Exception(f"Segment concat failed: {result.stderr.strip()}")
+
+        index_path, data_path = os.path.join(workdir, 'index.npy'), os.path.join(workdir, 'detections.bin')
+        with timer.stage('detections'):
+            frame_count, detection_count = concat_detections([(index, data) for _, index, data in parts], index_path, data_path)
+
+        index_key, data_key = detection_keys(params.inserted_id)
+        with timer.stage('upload'):
+            upload_file_to_minio(minio_client, "yolo-files", output_path, f"results/{output_filename}")
+            upload_file_to_minio(minio_client, "yolo-files", index_path, index_key)
+            upload_file_to_minio(minio_client, "yolo-files", data_path, data_key)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 汇总耗时：各阶段为所有分段之和，total/fps 为从切分开始的墙钟时间
+    task_doc = task_collection.find_one({'_id': ObjectId(params.inserted_id)}, {'segments_started_at': 1})
+    elapsed = time.time() - (task_doc or {}).get('segments_started_at', time.time())
+    stages = {}
+    for segment in segment_results:
+        for name, seconds in segment['timings']['stages'].items():
+            stages[name] = round(stages.get(name, 0.0) + seconds, 4)
+    for name, seconds in timer.summary()['stages'].items():
+        stages[f"merge_{name}"] = seconds
+    timings = {
+        'stages': stages,
+        'total': round(elapsed, 4),
+        'frames': frame_count,
+        'fps': round(frame_count / elapsed, 2) if elapsed > 0 else None,
+        'segments': len(segment_results)
+    }
+    FRAMES_TOTAL.labels(params.model_id).inc(frame_count)
+    if timings['fps']:
+        VIDEO_FPS.labels(params.model_id).observe(timings['fps'])
+
+    index_detections = {
+        'format': DETECTIONS_FORMAT,
+        'index': index_key,
+        'data': data_key,
+        'frame_count': frame_count,
+        'detection_count': detection_count,
+    }
+    update_task_status(task_collection, params.inserted_id, {
+        'progress': 100,
+        'result_file': f"results/{output_filename}",
+        'detections': index_detections,
+        'timings': timings,
+        'inference_backend': segment_results[0]['backend'] if segment_results else None
+    })
+
+    publish_cached_result(params, f"results/{output_filename}", index_detections)
+
+    # 删除分段源文件和分段结果
+    keys = []
+    for segment in segment_results:
+        keys += [segment['source'], segment['result'], segment['detections']['index'], segment['detections']['data']]
+    _, errors = bulk_remove_objects(minio_client, "yolo-files", keys)
+    if errors:
+        logger.warning(f"Failed to remove {len(errors)} segment object(s): {errors[:20]}")
+
+    logger.debug("Video %s merged from %s segment(s), %s frame(s)", params.media_id, len(segment_results), frame_count)
+    return f"Video {params.media_id} processing completed, result file: results/{output_filename}"
@@ -0,0 +1,135 @@
+import io
+import os
+import shutil
+
+import numpy as np
+
+from apis.logger import get_logger
+from apis.media_source import read_object_range
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# 每条检测记录 22 字节：xyxy 框 (float32 x4)、置信度 (float32)、类别 id (uint16)
+DETECTION_DTYPE = np.dtype([('box', '<f4', (4,)), ('score', '<f4'), ('cls', '<u2')])
+
+DETECTIONS_FORMAT = 'yolo-detections-v1'
+
+
+# 检测结果在 MinIO 上的位置：index.npy 保存每帧的起始记录下标，detections.bin 是定长记录
+def detection_keys(task_doc_id):
+    prefix = f"results/detections/{task_doc_id}"
+    return f"{prefix}/index.npy", f"{prefix}/detections.bin"
+
+
+# 逐帧写入检测结果，记录直接追加到本地文件，长视频也不会占用大量内存
+class DetectionWriter:
+    def __init__(self, local_prefix):
+        self.index_path = f"{local_prefix}_index.npy"
+        self.data_path = f"{local_prefix}_detections.bin"
+        self._offsets = [0]
+        self._file = open(self.data_path, 'wb')
+
+    @property
+    def frame_count(self):
+        return len(self._offsets) - 1
+
+    @property
+    def detection_count(self):
+        return self._offsets[-1]
+
+    def add(self, result):
+        boxes = result.boxes
+        count = 0 if boxes is None else len(boxes)
+        if count:
+            records = np.empty(count, dtype=DETECTION_DTYPE)
+            records['box'] = boxes.xyxy.cpu().numpy()
+            records['score'] = boxes.conf.cpu().numpy()
+            records['cls'] = boxes.cls.cpu().numpy()
+            self._file.write(records.tobytes())
+        self._offsets.append(self._offsets[-1] + count)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            np.save(self.index_path, np.asarray(self._offsets, dtype=np.int64))
+
+    # 上传到 MinIO 并删除本地文件，返回写入任务文档的引用信息
+    # keys 为 (index_key, data_key)，默认使用任务的检测结果路径
+    def upload(self, minio_client, bucket, task_doc_id, keys=None):
+        self.close()
+        index_key, data_key = keys or detection_keys(task_doc_id)
+        minio_client.fput_object(bucket, index_key, self.index_path)
+        minio_client.fput_object(bucket, data_key, self.data_path)
+        self.discard()
+        return {
+            'format': DETECTIONS_FORMAT,
+            'index': index_key,
+            'data': data_key,
+            'frame_count': self.frame_count,
+            'detection_count': self.detection_count,
+        }
+
+    def discard(self):
+        self.close()
+        for path in (self.index_path, self.data_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# 按顺序拼接多个分段的本地检测结果文件，后一段的帧和记录下标依次顺延
+# parts 为 [(index_path, data_path)]，返回 (frame_count, detection_count)
+def concat_detections(parts, index_path, data_path):
+    offsets = [np.zeros(1, dtype=np.int64)]
+    base = 0
+    with open(data_path, 'wb') as out:
+        for part_index, part_data in parts:
+            part_offsets = np.load(part_index)
+            offsets.append(part_offsets[1:] + base)
+            base += int(part_offsets[-1])
+            with open(part_data, 'rb') as f:
+                shutil.copyfileobj(f, out)
+    offsets = np.concatenate(offsets)
+    np.save(index_path, offsets)
+    return len(offsets) - 1, base
+
+
+def load_frame_offsets(minio_client, bucket, index_key):
+    response = minio_client.get_object(bucket, index_key)
+    try:
+        return np.load(io.BytesIO(response.read()))
+    finally:
+        response.close()
+        response.release_conn()
+
+
+# 读取 [start_frame, end_frame) 范围内的检测结果，只对数据文件做一次 Range GET
+def read_detections(minio_client, bucket, detections, start_frame, end_frame, classes=None):
+    offsets = load_frame_offsets(minio_client, bucket, detections['index'])
+    frame_count = len(offsets) - 1
+    start_frame = max(0, min(start_frame, frame_count))
+    end_frame = max(start_frame, min(end_frame, frame_count))
+
+    first, last = int(offsets[start_frame]), int(offsets[end_frame])
+    if last > first:
+        data = read_object_range(
+            minio_client, bucket, detections['data'],
+            first * DETECTION_DTYPE.itemsize, (last - first) * DETECTION_DTYPE.itemsize
+        )
+        records = np.frombuffer(data, dtype=DETECTION_DTYPE)
+    else:
+        records = np.empty(0, dtype=DETECTION_DTYPE)
+
+    frames = []
+    for frame in range(start_frame, end_frame):
+        frame_records = records[offsets[frame] - first:offsets[frame + 1] - first]
+        if classes:
+            frame_records = frame_records[np.isin(frame_records['cls'], classes)]
+        frames.append({
+            'frame': frame,
+            'boxes': frame_records['box'].tolist(),
+            'scores': frame_records['score'].tolist(),
+            'classes': frame_records['cls'].tolist(),
+        })
+
+    return {'frame_count': frame_count, 'start_frame': start_frame, 'end_frame': end_frame, 'frames': frames}
@@ -0,0 +1,74 @@
+import os
+from functools import lru_cache
+
+import torch
+
+from apis.logger import get_logger
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+
+@lru_cache(maxsize=1)
+def cuda_device_count():
+    try:
+        return torch.cuda.device_count() if torch.cuda.is_available() else 0
+    except Exception:
+        return 0
+
+
+# 解析推理设备：任务参数优先，其次是 worker 的 YOLO_DEVICE（默认 auto）
+# auto 在有 GPU 时使用 cuda:0，否则使用 CPU；请求的 GPU 不存在时退回 CPU
+def resolve_device(requested=None):
+    device = (requested or os.getenv('YOLO_DEVICE', 'auto')).strip().lower()
+    if device == 'auto':
+        return 'cuda:0' if cuda_device_count() else 'cpu'
+    if device == 'cpu':
+        return device
+
+    index = device.split(':', 1)[1] if device.startswith('cuda:') else device
+    if index.isdigit() and int(index) < cuda_device_count():
+        return f"cuda:{index}"
+    if device == 'cuda' and cuda_device_count():
+        return 'cuda:0'
+
+    logger.warning(f"Device {device} not available on this worker, falling back to CPU")
+    return 'cpu'
+
+
+# 每个 worker 子进程可用的线程数：总核数按 prefork 进程数平分，避免多个进程争抢同一批核
+def cpu_thread_budget(concurrency):
+    configured = os.getenv('CPU_THREADS_PER_PROCESS')
+    if configured:
+        return max(1, int(configured))
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    return max(1, cores // max(1, concurrency))
+
+
+# 在 worker 子进程启动时调用：CPU 模式下限制 torch/OpenCV 的线程数，可选按进程序号绑定 CPU 核
+def configure_cpu_threads(concurrency, process_index=0):
+    if resolve_device() != 'cpu':
+        return None
+
+    threads = cpu_thread_budget(concurrency)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 已经执行过并行运算后不能再修改
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+    cores = None
+    if os.getenv('CPU_AFFINITY', '0') == '1' and hasattr(os, 'sched_setaffinity'):
+        available = sorted(os.sched_getaffinity(0))
+        start = (process_index * threads) % len(available)
+        cores = [available[(start + i) % len(available)] for i in range(min(threads, len(available)))]
+        os.sched_setaffinity(0, cores)
+
+    logger.info(f"CPU inference: process {process_index} uses {threads} thread(s), affinity {cores or 'unchanged'}")
+    return {'threads': threads, 'cores': cores}
@@ -0,0 +1,206 @@
+import os
+import shutil
+import time
+import importlib.util
+
+import numpy as np
+from ultralytics import YOLO
+
+from apis.logger import get_logger
+from apis.device import resolve_device
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# 导出格式对应的运行时依赖，节点上没有安装时跳过该格式
+BACKEND_RUNTIMES = {
+    'pytorch': 'torch',
+    'onnx': 'onnxruntime',
+    'openvino': 'openvino',
+}
+
+# 导出产物与 PyTorch 结果的一致性低于此值时不会被选用
+MIN_AGREEMENT = float(os.getenv('MODEL_EXPORT_MIN_AGREEMENT', 0.9))
+
+EXPORT_DIR = os.getenv('MODEL_EXPORT_DIR', os.path.join('weights', 'exports'))
+
+
+def parse_sizes(value):
+    sizes = []
+    for item in value.split(','):
+        item = item.strip().lower()
+        if item:
+            width, height = item.split('x')
+            sizes.append((int(width), int(height)))
+    return sizes
+
+
+# 注册模型时导出的格式和输入尺寸（WxH，与任务参数的 width/height 一致）
+def export_config():
+    formats = [f.strip() for f in os.getenv('MODEL_EXPORT_FORMATS', 'onnx,openvino').split(',') if f.strip()]
+    sizes = parse_sizes(os.getenv('MODEL_EXPORT_SIZES', '1920x1088,640x640'))
+    # OpenVINO INT8 量化需要校准数据集（ultralytics 的 data yaml），没有配置时不做量化
+    int8_data = os.getenv('MODEL_EXPORT_INT8_DATA')
+    return formats, sizes, int8_data
+
+
+def runtime_available(backend):
+    module = BACKEND_RUNTIMES.get(backend)
+    return module is not None and importlib.util.find_spec(module) is not None
+
+
+# ---- 选择推理后端 ----
+
+# 同一尺寸下可用的导出产物，按导出时测得的延迟排序
+def candidate_artifacts(model_info, width, height):
+    artifacts = [
+        a for a in model_info.get('exports') or []
+        if a.get('status') == 'ready'
+        and (a['width'], a['height']) == (width, height)
+        and (a.get('agreement') or 0) >= MIN_AGREEMENT
+        and runtime_available(a['format'])
+        and os.path.exists(a['path'])
+    ]
+    return sorted(artifacts, key=lambda a: a['latency_ms'])
+
+
+# 返回 (cache_key, 模型路径, 后端名)
+# GPU 上始终使用 PyTorch；CPU 上在 INFERENCE_BACKENDS 允许的范围内选延迟最低的产物
+def select_backend(model_id, model_info, width, height, device=None):
+    pytorch = (model_id, model_info['model_path'], 'pytorch')
+    if resolve_device(device) != 'cpu':
+        return pytorch
+
+    allowed = [b.strip() for b in os.getenv('INFERENCE_BACKENDS', 'openvino,onnx,pytorch').split(',') if b.strip()]
+    baseline = next((r['latency_ms'] for r in (model_info.get('export_report') or {}).get('results', [])
+                     if r['format'] == 'pytorch' and (r['width'], r['height']) == (width, height)), None)
+    for artifact in candidate_artifacts(model_info, width, height):
+        if artifact['format'] not in allowed:
+            continue
+        if 'pytorch' in allowed and baseline is not None and artifact['latency_ms'] >= baseline:
+            continue
+        suffix = '-int8' if artifact.get('int8') else ''
+        key = f"{model_id}:{artifact['format']}{suffix}:{width}x{height}"
+        return key, artifact['path'], artifact['format']
+    return pytorch
+
+
+# 按任务参数从缓存中取模型，返回 (model, 后端名)
+def load_inference_model(cache, model_id, model_info, params):
+    key, path, backend = select_backend(model_id, model_info, params.width, params.height, params.device)
+    try:
+        # 导出的文件不带任务类型，不指定时 ultralytics 只能猜测
+        if backend != 'pytorch':
+            return cache.get(key, path, task='detect'), backend
+        return cache.get(key, path), backend
+    except Exception as e:
+        if backend == 'pytorch':
+            raise
+        logger.warning(f"Failed to load {backend} artifact for model {model_id}, falling back to PyTorch: {e}")
+        return cache.get(model_id, model_info['model_path']), 'pytorch'
+
+
+# ---- 导出与对比 ----
+
+def box_iou(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+# 以 PyTorch 结果为参照，按同类别 IoU>=0.5 贪心匹配，返回 F1
+def detection_agreement(reference, candidate, iou_threshold=0.5):
+    matched = total_ref = total_cand = 0
+    for ref, cand in zip(reference, candidate):
+        total_ref += len(ref[0])
+        total_cand += len(cand[0])
+        if not len(ref[0]) or not len(cand[0]):
+            continue
+        iou = box_iou(ref[0], cand[0])
+        iou[ref[1][:, None] != cand[1][None, :]] = 0
+        used = set()
+        for i in np.argsort(-iou.max(axis=1)):
+            j = int(np.argmax(iou[i]))
+            if iou[i, j] >= iou_threshold and j not in used:
+                used.add(j)
+                matched += 1
+    if total_ref == 0 and total_cand == 0:
+        return 1.0
+    return 2 * matched / (total_ref + total_cand)
+
+
+def run_model(model, images, width, height, repeats):
+    kwargs = {'imgsz': (height, width), 'device': 'cpu', 'verbose': False}
+    model.predict(images[0], **kwargs)
+    outputs = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        outputs = []
+        for image in images:
+            boxes = model.predict(image, **kwargs)[0].boxes
+            outputs.append((boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy().astype(int)))
+    latency_ms = (time.perf_counter() - start) * 1000 / (repeats * len(images))
+    return outputs, round(latency_ms, 2)
+
+
+def export_artifact(model_path, model_id, export_format, width, height, int8_data=None):
+    kwargs = {'format': export_format, 'imgsz': (height, width), 'device': 'cpu'}
+    if int8_data and export_format == 'openvino':
+        kwargs.update({'int8': True, 'data': int8_data})
+    exported = YOLO(model_path).export(**kwargs)
+
+    # ultralytics 把产物放在权重文件旁边，按模型/格式/尺寸移动到独立目录，避免互相覆盖
+    suffix = '_int8' if kwargs.get('int8') else ''
+    target_dir = os.path.join(EXPORT_DIR, model_id)
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, f"{export_format}{suffix}_{width}x{height}")
+    if os.path.isdir(exported):
+        # OpenVINO 目录名必须以 _openvino_model 结尾，ultralytics 据此识别格式
+        target += '_openvino_model'
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.move(exported, target)
+    else:
+        target += os.path.splitext(exported)[1]
+        shutil.move(exported, target)
+    return target, bool(kwargs.get('int8'))
+
+
+# 为每个格式/尺寸导出产物，并在同一批图片上与 PyTorch 对比延迟和检测结果
+def export_and_compare(model_id, model_path, images, repeats=3):
+    formats, sizes, int8_data = export_config()
+    artifacts = []
+    results = []
+
+    reference_model = YOLO(model_path)
+    for width, height in sizes:
+        reference, baseline_ms = run_model(reference_model, images, width, height, repeats)
+        results.append({'format': 'pytorch', 'width': width, 'height': height, 'int8': False, 'latency_ms': baseline_ms, 'speedup': 1.0, 'agreement': 1.0})
+
+        for export_format in formats:
+            entry = {'format': export_format, 'width': width, 'height': height}
+            if not runtime_available(export_format):
+                artifacts.append({**entry, 'status': 'skipped', 'error': f"{BACKEND_RUNTIMES.get(export_format, export_format)} not installed"})
+                continue
+            try:
+                path, int8 = export_artifact(model_path, model_id, export_format, width, height, int8_data)
+                outputs, latency_ms = run_model(YOLO(path, task='detect'), images, width, height, repeats)
+                agreement = round(detection_agreement(reference, outputs), 4)
+                report = {**entry, 'int8': int8, 'latency_ms': latency_ms, 'speedup': round(baseline_ms / latency_ms, 2) if latency_ms else None, 'agreement': agreement}
+                results.append(report)
+                artifacts.append({**report, 'path': path, 'status': 'ready'})
+                logger.info(f"Model {model_id} exported to {export_format} {width}x{height}: {latency_ms}ms vs {baseline_ms}ms, agreement {agreement}")
+            except Exception as e:
+                logger.error(f"Failed to export model {model_id} to {export_format} {width}x{height}: {e}", exc_info=True)
+                artifacts.append({**entry, 'status': 'failed', 'error': str(e)})
+
+    report = {'created_at': time.time(), 'images': len(images), 'repeats': repeats, 'device': 'cpu', 'results': results}
+    return artifacts, report
+
+
+def remove_exports(model_id):
+    shutil.rmtree(os.path.join(EXPORT_DIR, model_id), ignore_errors=True)
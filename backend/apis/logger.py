@@ -1,5 +1,13 @@
+import os
+import copy
+import json
+import time
+import queue
+import atexit
 import logging
-import logging_loki
+import threading
+
+import requests
 
 class ColoredFormatter(logging.Formatter):
     COLORS = {
@@ -15,28 +23,122 @@ class ColoredFormatter(logging.Formatter):
         log_fmt = self.COLORS.get(record.levelname, self.RESET) + super().format(record) + self.RESET
         return log_fmt
 
+# 非阻塞的 Loki 处理器：日志只放进有界队列，由后台线程按条数/时间批量推送
+# 队列满时直接丢弃并计数，不阻塞推理和请求处理
+class BatchingLokiHandler(logging.Handler):
+    def __init__(self, url, tags, batch_size=500, flush_interval=1.0, queue_size=10000, timeout=5):
+        super().__init__()
+        self.url = url
+        self.tags = tags
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.dropped = 0
+        self._start()
+        # Celery prefork 的子进程不会继承后台线程，fork 后重新启动
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._run, name='loki-shipper', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            # 在调用线程只做最少的工作：合并参数得到消息文本，格式化交给后台线程
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # 丢弃计数由后台线程读取并清零，与 _push 使用同一把锁（Handler 自带的 RLock）
+            with self.lock:
+                self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0, deadline - time.monotonic())
+            try:
+                record = self._queue.get(timeout=timeout)
+                if record is None:
+                    self._push(batch)
+                    return
+                batch.append((record.created, record.levelname, self.format(record)))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._push(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _push(self, batch):
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            batch = batch + [(time.time(), 'WARNING', f"{dropped} log record(s) dropped, Loki queue full")]
+        if not batch:
+            return
+
+        streams = {}
+        for created, level, line in batch:
+            streams.setdefault(level, []).append([str(int(created * 1e9)), line])
+        payload = {
+            "streams": [
+                {"stream": {**self.tags, "level": level.lower()}, "values": values}
+                for level, values in streams.items()
+            ]
+        }
+        try:
+            self._session.post(self.url, data=json.dumps(payload), headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        except Exception:
+            # Loki 不可用时丢弃这一批，不影响业务
+            pass
+
+    def close(self):
+        try:
+            self._queue.put(None, timeout=self.timeout)
+            self._thread.join(self.timeout)
+        except Exception:
+            pass
+        super().close()
+
 # 对 Loki 的配置进行一次性设置
 def setup_logger():
     logger = logging.getLogger(__name__)
 
     # 如果已经有处理器了，不要重复添加
     if not logger.hasHandlers():
+        # 日志级别按环境配置，被过滤掉的日志不会进入队列和格式化
+        level = os.getenv('LOG_LEVEL', 'INFO').upper()
+
         # Loki 配置
-        loki_handler = logging_loki.LokiHandler(
-            url="http://loki:3100/loki/api/v1/push",  # 替换为你的 Loki 实例地址
-            tags={"app": "yolotester_dev-backend-1"},
-            version="1",
+        loki_handler = BatchingLokiHandler(
+            url=os.getenv('LOKI_URL', "http://loki:3100/loki/api/v1/push"),  # 替换为你的 Loki 实例地址
+            tags={"app": os.getenv('LOKI_APP_TAG', "yolotester_dev-backend-1")},
+            batch_size=int(os.getenv('LOKI_BATCH_SIZE', 500)),
+            flush_interval=float(os.getenv('LOKI_FLUSH_INTERVAL', 1.0)),
+            queue_size=int(os.getenv('LOKI_QUEUE_SIZE', 10000)),
         )
-
-        # 清空日志处理器的旧消息
-        loki_handler.flush()
+        loki_handler.setLevel(os.getenv('LOKI_LOG_LEVEL', level).upper())
+        atexit.register(loki_handler.close)
 
         # 设置日志格式
         stream_handler = logging.StreamHandler()
         formatter = ColoredFormatter('[%(lineno)d:%(filename)s] %(funcName)s()\n%(message)s')
 
         # 将格式器添加到处理器
-        loki_handler.setFormatter(formatter)
+        loki_handler.setFormatter(logging.Formatter('[%(lineno)d:%(filename)s] %(funcName)s() %(message)s'))
         stream_handler.setFormatter(formatter)
 
         # 将处理器添加到 logger
@@ -44,11 +146,10 @@ def setup_logger():
         logger.addHandler(stream_handler)
 
         # 设置日志级别
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(level)
 
     return logger
 
 # 对外提供 logger 对象
 def get_logger():
     return setup_logger()
-
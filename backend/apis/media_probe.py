@@ -0,0 +1,173 @@
+import io
+import os
+import json
+import tempfile
+import subprocess
+from datetime import timedelta
+
+from PIL import Image
+
+from apis.logger import get_logger
+from apis.media_source import ISO_BMFF_EXTENSIONS, read_object_range, iter_top_level_boxes
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# 图片先读头部这么多字节，JPEG 的 EXIF/内嵌缩略图较大时放大到 IMAGE_PROBE_MAX_BYTES 再试一次
+IMAGE_PROBE_BYTES = 64 * 1024
+IMAGE_PROBE_MAX_BYTES = 1024 * 1024
+
+# 视频读取头部和尾部的字节数（尾部用于 ts/avi 等需要从文件末尾估算时长或读取索引的容器）
+VIDEO_HEAD_BYTES = 512 * 1024
+VIDEO_TAIL_BYTES = 512 * 1024
+
+# moov 超过此大小时不再按范围读取，直接交给 ffprobe 读预签名 URL
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+# EXIF 方向为 5~8 时图片需要旋转 90 度，显示宽高互换
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+# 上传时写入媒体文档的视频元数据字段，convert_video/run_yolo_video 直接使用，不再重复探测
+VIDEO_METADATA_FIELDS = ('width', 'height', 'duration', 'vcodec', 'pix_fmt', 'profile', 'acodec', 'fps', 'frame_count')
+
+
+def parse_rate(value):
+    try:
+        numerator, denominator = (value or '').split('/')
+        return float(numerator) / float(denominator) if float(denominator) else None
+    except ValueError:
+        return None
+
+
+def run_ffprobe(source):
+    result = subprocess.run([
+        'ffprobe', '-v', 'quiet', '-print_format', 'json',
+        '-show_format', '-show_streams', source
+    ], capture_output=True, text=True)
+    return json.loads(result.stdout or '{}')
+
+
+# 从 ffprobe 的输出中整理视频元数据
+def video_metadata(probe):
+    streams = probe.get('streams', [])
+    video_stream = next((s for s in streams if s['codec_type'] == 'video'), None)
+    if video_stream is None:
+        raise Exception("No video stream found")
+    audio_stream = next((s for s in streams if s['codec_type'] == 'audio'), None)
+
+    duration = float(probe.get('format', {}).get('duration') or video_stream.get('duration') or 0)
+    fps = parse_rate(video_stream.get('avg_frame_rate')) or parse_rate(video_stream.get('r_frame_rate'))
+    # mp4/mov 的 nb_frames 来自 stts 表，其他容器没有时按时长估算
+    frame_count = int(video_stream.get('nb_frames') or 0) or (round(duration * fps) if fps else None)
+
+    return {
+        'width': int(video_stream['width']),
+        'height': int(video_stream['height']),
+        'duration': duration,
+        'vcodec': video_stream['codec_name'],
+        'pix_fmt': video_stream.get('pix_fmt'),
+        'profile': video_stream.get('profile'),
+        'acodec': audio_stream['codec_name'] if audio_stream else None,
+        'fps': round(fps, 3) if fps else None,
+        'frame_count': frame_count,
+    }
+
+
+def probe_video(source):
+    return video_metadata(run_ffprobe(source))
+
+
+def has_video_metadata(media_info):
+    return all(field in media_info for field in VIDEO_METADATA_FIELDS)
+
+
+# ---- 只读头部的探测 ----
+
+def image_metadata(data):
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        image_format = image.format
+        try:
+            orientation = image.getexif().get(EXIF_ORIENTATION)
+        except Exception:
+            orientation = None
+    if orientation in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    return {'width': width, 'height': height, 'image_format': image_format}
+
+
+# PIL 打开图片时只解析文件头，不解码像素
+def probe_image_object(minio_client, bucket, object_name, size):
+    length = min(IMAGE_PROBE_BYTES, size)
+    while True:
+        data = read_object_range(minio_client, bucket, object_name, 0, length)
+        try:
+            return image_metadata(data)
+        except Exception:
+            if length >= min(IMAGE_PROBE_MAX_BYTES, size):
+                raise
+            length = min(IMAGE_PROBE_MAX_BYTES, size)
+
+
+# 按 box 头逐个跳转定位 moov：头部之外的 box 每次只读 16 字节
+def locate_moov(minio_client, bucket, object_name, size, head):
+    offset = 0
+    while offset + 8 <= size:
+        if offset + 16 <= len(head):
+            header = head[offset:offset + 16]
+        else:
+            header = read_object_range(minio_client, bucket, object_name, offset, min(16, size - offset))
+        box = next(iter_top_level_boxes(header + b'\0' * (16 - len(header))), None)
+        if box is None:
+            return None
+        box_type, _, box_size = box
+        if box_size is None:
+            box_size = size - offset
+        if box_type == 'moov':
+            return offset, box_size
+        offset += box_size
+    return None
+
+
+# 在与原文件同样大小的稀疏文件中只填入头部、moov（或尾部）的字节，ffprobe 读取它们就能得到全部元数据
+def probe_video_object(minio_client, bucket, object_name, size):
+    extension = os.path.splitext(object_name)[1].lower()
+    head = read_object_range(minio_client, bucket, object_name, 0, min(VIDEO_HEAD_BYTES, size))
+    ranges = [(0, head)]
+
+    if extension in ISO_BMFF_EXTENSIONS:
+        moov = locate_moov(minio_client, bucket, object_name, size, head)
+        if moov is None or moov[1] > MAX_MOOV_BYTES:
+            return None
+        offset, length = moov
+        if offset + length > len(head):
+            ranges.append((offset, read_object_range(minio_client, bucket, object_name, offset, length)))
+    elif size > len(head):
+        tail_offset = max(len(head), size - VIDEO_TAIL_BYTES)
+        ranges.append((tail_offset, read_object_range(minio_client, bucket, object_name, tail_offset, size - tail_offset)))
+
+    with tempfile.NamedTemporaryFile(suffix=extension) as f:
+        f.truncate(size)
+        for offset, data in ranges:
+            f.seek(offset)
+            f.write(data)
+        f.flush()
+        return video_metadata(run_ffprobe(f.name))
+
+
+# 上传完成后调用，返回写入媒体文档的元数据；头部探测失败的视频退回 ffprobe 读取预签名 URL（同样是按需的范围读取）
+def probe_media_object(minio_client, bucket, object_name, content_type, size):
+    if content_type.startswith('image/'):
+        return probe_image_object(minio_client, bucket, object_name, size)
+    if not content_type.startswith('video/'):
+        return {}
+
+    try:
+        metadata = probe_video_object(minio_client, bucket, object_name, size)
+        if metadata:
+            return metadata
+    except Exception as e:
+        logger.debug("Header probe of %s failed, probing via URL: %s", object_name, e)
+    url = minio_client.presigned_get_object(bucket, object_name, expires=timedelta(minutes=10))
+    return probe_video(url)
@@ -0,0 +1,86 @@
+import os
+import struct
+from datetime import timedelta
+
+from apis.logger import get_logger
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# ISO BMFF 容器（mp4/mov），顺序解码前必须先拿到 moov
+ISO_BMFF_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.3gp'}
+
+# 检查 moov 位置时读取的头部字节数
+HEADER_PROBE_BYTES = 256 * 1024
+
+
+def stream_input_enabled():
+    return os.getenv('STREAM_INPUT', '1') == '1'
+
+
+# 读取对象的一段字节（Range GET）
+def read_object_range(minio_client, bucket, object_name, offset, length):
+    response = minio_client.get_object(bucket, object_name, offset=offset, length=length)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+# 遍历 ISO BMFF 顶层 box，返回 (type, offset, size)，数据不够时停止
+def iter_top_level_boxes(data):
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            if offset + 16 > len(data):
+                return
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            # box 一直延续到文件末尾
+            yield box_type.decode('latin-1'), offset, None
+            return
+        if size < header:
+            return
+        yield box_type.decode('latin-1'), offset, size
+        offset += size
+
+
+# 判断 mp4/mov 是否 faststart（moov 在 mdat 之前）
+def moov_before_mdat(header_bytes):
+    for box_type, _, _ in iter_top_level_boxes(header_bytes):
+        if box_type == 'moov':
+            return True
+        if box_type == 'mdat':
+            return False
+    return False
+
+
+# 判断对象能否不落盘、直接顺序解码
+def is_streamable(minio_client, bucket, object_name):
+    extension = os.path.splitext(object_name)[1].lower()
+    if extension not in ISO_BMFF_EXTENSIONS:
+        # mkv/webm/ts/avi 等容器可以顺序解码
+        return True
+    try:
+        header = read_object_range(minio_client, bucket, object_name, 0, HEADER_PROBE_BYTES)
+    except Exception as e:
+        logger.warning(f"Failed to read header of {object_name}: {e}")
+        return False
+    return moov_before_mdat(header)
+
+
+# 返回解码器的输入：可流式读取时为预签名 GET URL，否则下载到 local_filename
+# 返回 (source, downloaded)，downloaded 为 True 时调用方负责删除本地文件
+def open_media_source(minio_client, bucket, object_name, local_filename, expires_in_seconds=6 * 3600):
+    if stream_input_enabled() and is_streamable(minio_client, bucket, object_name):
+        url = minio_client.presigned_get_object(bucket, object_name, expires=timedelta(seconds=expires_in_seconds))
+        logger.debug("Streaming %s from MinIO", object_name)
+        return url, False
+
+    minio_client.fget_object(bucket, object_name, local_filename)
+    logger.debug("Downloaded %s to %s", object_name, local_filename)
+    return local_filename, True
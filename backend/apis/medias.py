@@ -1,16 +1,16 @@
-import os
-import io
 import time
 from fastapi import Body, HTTPException, APIRouter, BackgroundTasks,Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from models.models import media_collection
 from pydantic import Field,BaseModel
 from bson.objectid import ObjectId
-from apis.celery_worker import convert_video
-from PIL import Image
+from apis.celery_worker import convert_video, delete_subtree, collect_object_keys, OBJECT_KEY_PROJECTION, hash_media, request_thumbnails
 from apis.logger import get_logger
 from apis.minio_client_setup import setup_minio_client
-from apis.utils import get_folder_info
+from apis.media_probe import probe_media_object
+from apis.result_cache import etag_content_hash
+from apis.utils import get_folder_info, run_blocking, paginate, build_ancestors, ancestors_path, update_folder, parse_projection, stream_documents, cache_new_folder, delete_selected
 
 # 获取全局配置的 logger
 logger = get_logger()
@@ -20,14 +20,6 @@ minio_wrap = setup_minio_client()
 
 router = APIRouter()
 
-def get_image_dimensions(file_content: bytes):
-    try:
-        with Image.open(io.BytesIO(file_content)) as img:
-            return img.size  # Returns (width, height)
-    except Exception as e:
-        logger.debug(f"Error getting image dimensions: {str(e)}")
-        return None
-
 # 定义文件元数据的 Pydantic 模型
 class FileMetadata(BaseModel):
     name: str
@@ -39,7 +31,7 @@ class FileMetadata(BaseModel):
     minio_filename: str
     description: Optional[str] = None
 
-def process_file_upload(meta:FileMetadata, media_id: str):
+async def process_file_upload(meta:FileMetadata, media_id: str):
     try:
         # 创建媒体记录，包含新的 name 和 description 字段
         media_info = {
@@ -47,15 +39,33 @@ def process_file_upload(meta:FileMetadata, media_id: str):
             "celery_task_id": None
         }
 
-        # 如果是图片，获取并存储宽度和高度
-        # if meta.type.startswith('image/'):
-        #     dimensions = get_image_dimensions(file_content)
-        #     if dimensions:
-        #         media_info["width"], media_info["height"] = dimensions
+        try:
+            stat = await run_blocking(minio_wrap.client.stat_object, minio_wrap.bucket, meta.minio_filename)
+        except Exception as e:
+            logger.warning(f"Failed to stat {meta.minio_filename}: {e}")
+            stat = None
+
+        # 宽高、时长、编码、帧率和帧数：只按范围读取文件头（必要时加上 moov 或文件尾），后续任务不再探测
+        try:
+            media_info.update(await run_blocking(
+                probe_media_object, minio_wrap.client, minio_wrap.bucket, meta.minio_filename, meta.type, stat.size if stat else meta.size
+            ))
+        except Exception as e:
+            logger.warning(f"Failed to probe metadata of {meta.minio_filename}: {e}")
+
+        # 内容哈希用于结果缓存：单段上传直接使用 ETag（即 MD5），否则交给 worker 计算
+        try:
+            content_hash = etag_content_hash(stat.etag) if stat else None
+            if content_hash:
+                media_info["content_hash"] = content_hash
+            else:
+                await run_blocking(hash_media.delay, media_id, meta.minio_filename)
+        except Exception as e:
+            logger.warning(f"Failed to get content hash of {meta.minio_filename}: {e}")
 
         logger.debug(media_info)
 
-        media_collection.update_one(
+        await media_collection.update_one(
             {'_id': ObjectId(media_id)},
             {'$set': media_info}
         )
@@ -63,17 +73,19 @@ def process_file_upload(meta:FileMetadata, media_id: str):
         # 如果是视频文件，启动转码任务
         if meta.type.startswith('video/'):
             # 启动转码任务
-            task = convert_video.delay(media_id)
-            media_collection.update_one(
+            task = await run_blocking(convert_video.delay, media_id)
+            await media_collection.update_one(
                 {'_id': ObjectId(media_id)},
                 {'$set': {'celery_task_id': task.id}}
             )
             return {"media_id": media_id, "message": "Video uploaded successfully, conversion started"}
         else:
+            # 图片缩略图成批生成，视频在转换完成后生成
+            await run_blocking(request_thumbnails, media_id)
             return {"media_id": media_id, "message": "Image uploaded successfully"}
 
     except Exception as e:
-        logger.debug(f"Error in process_file_upload: {str(e)}")
+        logger.debug("Error in process_file_upload: %s", str(e))
         return {"error": str(e)}
 
 # Pydantic 模型，用于请求文件列表
@@ -89,7 +101,7 @@ async def generate_presigned_urls(data: FileName):
     for file_name in data.files:
         try:
             # 使用 timedelta 来指定过期时间
-            presigned_url = minio_wrap.generate_presigned_put_url(file_name, expires_in_seconds=3600)
+            presigned_url = await run_blocking(minio_wrap.generate_presigned_put_url, file_name, expires_in_seconds=3600)
             presigned_urls[file_name] = presigned_url
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -102,10 +114,12 @@ async def upload_file(
     meta: FileMetadata
 ):
     try:
-        result = media_collection.insert_one({
+        ancestors = await build_ancestors(media_collection, meta.parent_id)
+        result = await media_collection.insert_one({
             "name": meta.name,
             "description": meta.description if meta.description else "",
             "parent_id": meta.parent_id,
+            "ancestors": ancestors,
             "full_path": meta.full_path,
             "progress": 0,
             "status": "SUCCESS",
@@ -127,27 +141,27 @@ async def upload_file(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/all-medias", response_model=List[dict])
-async def get_all_medias():
-    try:
-        # 获取所有media文档
-        cursor = media_collection.find().sort('_id', -1)
-
-        # 将cursor转换为列表并准备响应
-        medias = []
-        for media in cursor:
-            media['_id'] = str(media['_id'])  # 将ObjectId转换为字符串
-            medias.append(media)
+@router.get("/all-medias")
+async def get_all_medias(
+    fmt: str = Query('json', alias='format', pattern='^(json|ndjson)$'),
+    fields: Optional[str] = None,
+    batch_size: int = Query(500, ge=1, le=10000)
+):
+    # 获取所有media文档，按批次流式返回，fields 为逗号分隔的字段投影
+    # 查询在开始迭代时才执行，错误由 stream_documents 写入响应末尾
+    cursor = media_collection.find({}, parse_projection(fields)).sort('_id', -1)
 
-        return medias
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    media_type = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return StreamingResponse(stream_documents(cursor, fmt, batch_size), media_type=media_type)
 
 @router.get("/medias")
 async def get_medias(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
-    folder_id: Optional[str] = None
+    folder_id: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    with_total: bool = True
 ):
     try:
 
@@ -157,36 +171,21 @@ async def get_medias(
                 raise HTTPException(status_code=400, detail="400: Invalid folder ID")
 
             # If folder_id is provided, fetch the folder and its contents
-            folder = media_collection.find_one({"_id": ObjectId(folder_id), "media_type": "folder"})
+            folder = await media_collection.find_one({"_id": ObjectId(folder_id), "media_type": "folder"})
             if not folder:
                 raise HTTPException(status_code=404, detail="404: Parent Folder not found")
 
-            # Find all media items in the file list and subfolders
-            cursor = media_collection.find({"parent_id": folder_id})
-
-        else:
-            # If folder_id is not provided, fetch the root folder contents
-            cursor = media_collection.find({"parent_id": "root"})
-
-        # Calculate skip value for pagination
-        skip = (page - 1) * page_size
-        cursor = cursor.sort('_id', -1).skip(skip).limit(page_size)
-
-        # Convert cursor to list and prepare the response
-        medias = []
-        for media in cursor:
-            media['_id'] = str(media['_id'])  # Convert ObjectId to string
-            medias.append(media)
-
-        # Get total count of documents
-        total_count = media_collection.count_documents({"parent_id": "root"}) if not folder_id or folder_id == "root" else len(medias)
+        # after/before 为游标分页，否则按页码分页；总数来自带缓存的计数
+        result = await paginate(media_collection, {"parent_id": folder_id or "root"}, page, page_size, after, before, with_total)
 
         return {
-            "medias": medias,
-            "page": page,
+            "medias": result["items"],
+            "page": result["page"],
             "page_size": page_size,
-            "total_pages": (total_count + page_size - 1) // page_size,
-            "total_count": total_count
+            "total_pages": result["total_pages"],
+            "total_count": result["total_count"],
+            "next_cursor": result["next_cursor"],
+            "prev_cursor": result["prev_cursor"]
         }
     except HTTPException as http_exc:
         raise http_exc
@@ -196,30 +195,26 @@ async def get_medias(
 @router.delete("/delete_medias")
 async def delete_medias(ids: List[str] = Body(...)):
     try:
-        # Convert string ids to ObjectId
-        logger.debug(f'ids = {ids}')
-        object_ids = [ObjectId(id) for id in ids]
-
-        # Find the documents to get MinIO filenames before deletion
-        medias_to_delete = media_collection.find({"_id": {"$in": object_ids}})
- 
-        minio_filenames = []
-        for media in medias_to_delete:
-            logger.debug(f'current media : {media}') 
-            if 'minio_filename' in media:
-                minio_filenames.append(media['minio_filename'])
-
-        # Delete the documents from MongoDB
-        result = media_collection.delete_many({"_id": {"$in": object_ids}})
-        logger.debug(f'filenames : {minio_filenames}')
-
-        # Delete the files from MinIO
-        minio_wrap.delete_files(minio_filenames)
+        logger.debug('Deleting %d media(s)', len(ids))
+        if not all(ObjectId.is_valid(id) for id in ids):
+            raise HTTPException(status_code=400, detail="Invalid media ID")
+
+        deleted_count, folder_ids, keys = await delete_selected(
+            media_collection, ids, OBJECT_KEY_PROJECTION, lambda doc: collect_object_keys('medias', doc)
+        )
+
+        # 文件夹的子树和所有 MinIO 对象在后台任务中删除，通过 /delete_jobs/{job_id} 查询进度
+        job = None
+        if folder_ids or keys:
+            job = await run_blocking(delete_subtree.delay, 'medias', folder_ids, keys)
 
         return {
-            "deleted_count": result.deleted_count,
-            "message": f"Successfully deleted {result.deleted_count} media(s)"
+            "deleted_count": deleted_count,
+            "job_id": job.id if job else None,
+            "message": f"Successfully deleted {deleted_count} media(s)"
         }
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -233,22 +228,14 @@ class FolderCreateRequest(BaseModel):
 @router.post("/medias_create_new_folder")
 async def medias_create_new_folder(folder: FolderCreateRequest):
     try:
-        parent_id = folder.parent_id
-        path_list = []
-        while parent_id != 'root':
-            parent = media_collection.find_one({"_id": ObjectId(parent_id), "media_type": "folder"})
-            # 如果文件夹不存在，返回 404
-            if not parent:
-                raise HTTPException(status_code=404, detail="Parent Folder not found")
-            
-            path_list.append(parent.get('original_filename'))
-            parent_id = parent['parent_id']
+        # 父文件夹不存在时返回 404
+        ancestors = await build_ancestors(media_collection, folder.parent_id)
 
         # 添加根节点 /A/B/C/D/filename
-        full_path = os.sep.join([''] + path_list[::-1] + [folder.name])
+        full_path = ancestors_path(ancestors, folder.name)
 
         # 检查是否已经存在相同 full_path 且类型为 folder 的记录
-        existing_folder = media_collection.find_one({"full_path": full_path, "media_type": "folder"})
+        existing_folder = await media_collection.find_one({"full_path": full_path, "media_type": "folder"})
         if existing_folder:
             msg = {
                 "message": "Folder with the same name already exists, creation failed.",
@@ -259,10 +246,11 @@ async def medias_create_new_folder(folder: FolderCreateRequest):
             return msg
 
         # 如果不存在同名文件夹，创建新文件夹
-        result = media_collection.insert_one({
+        result = await media_collection.insert_one({
             "name": folder.name,
             "description": folder.description,
             "parent_id": folder.parent_id,  # 添加了 parent_id 字段
+            "ancestors": ancestors,
             "full_path": full_path,
             "progress": 100,
             "status": "SUCCESS",
@@ -281,6 +269,7 @@ async def medias_create_new_folder(folder: FolderCreateRequest):
             "end_time": folder.upload_time,
             "error_message": ""
         })
+        await cache_new_folder(media_collection, str(result.inserted_id), folder.name, folder.parent_id, ancestors)
 
         msg = {
             "message": "Folder created successfully",
@@ -298,7 +287,21 @@ class FolderWrap(BaseModel):
 @router.post("/get_medias_parent_info_by_folder_id")
 async def get_medias_parent_info_by_folder_id(folder_wrap: FolderWrap):
     try:
-        return get_folder_info(media_collection, folder_wrap.folderId)
+        return await get_folder_info(media_collection, folder_wrap.folderId)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 重命名或移动文件夹的请求体，字段为空表示不修改
+class FolderUpdateRequest(BaseModel):
+    name: Optional[str] = None
+    parent_id: Optional[str] = None
+
+@router.put("/medias_folder/{folder_id}")
+async def medias_update_folder(folder_id: str, folder: FolderUpdateRequest):
+    try:
+        return await update_folder(media_collection, folder_id, folder.name, folder.parent_id)
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -323,9 +326,9 @@ class MediaItem(BaseModel):
 async def get_medias_by_parent_id(folder: FolderWrap):
     try:
         folder_id = folder.folderId
-        logger.debug(f'folder_id is : {folder_id}')
-        medias = list(media_collection.find({"parent_id": folder_id}))
-        logger.debug(f'medias : {medias}')
+        logger.debug("folder_id is : %s", folder_id)
+        medias = await media_collection.find({"parent_id": folder_id}).to_list(length=None)
+        logger.debug('%d media(s) found', len(medias))
         if not medias:
             raise HTTPException(status_code=404, detail="No media items found")
         for media in medias:
@@ -0,0 +1,123 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# Celery prefork 下每个子进程各自记录指标，需要在导入 prometheus_client 之前准备好多进程目录
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+TASK_STAGE_SECONDS = Histogram(
+    'yolo_task_stage_seconds', 'Duration of one stage of a Celery task',
+    ['task', 'stage'], buckets=STAGE_BUCKETS
+)
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    'yolo_task_queue_wait_seconds', 'Time between enqueue and task start',
+    ['task'], buckets=STAGE_BUCKETS
+)
+TASKS_TOTAL = Counter(
+    'yolo_tasks_total', 'Finished Celery tasks',
+    ['task', 'model_id', 'state']
+)
+FRAMES_TOTAL = Counter(
+    'yolo_frames_processed_total', 'Video frames run through inference',
+    ['model_id']
+)
+VIDEO_FPS = Histogram(
+    'yolo_video_fps', 'End-to-end frames per second of video tasks',
+    ['model_id'], buckets=(1, 2, 5, 10, 15, 20, 25, 30, 45, 60, 90, 120, 240)
+)
+MODEL_CACHE_EVENTS = Counter(
+    'yolo_model_cache_events_total', 'Model cache hits, misses and evictions',
+    ['event']
+)
+MODEL_CACHE_BYTES = Gauge(
+    'yolo_model_cache_bytes', 'Estimated memory held by cached models',
+    multiprocess_mode='livesum'
+)
+MODEL_CACHE_MODELS = Gauge(
+    'yolo_model_cache_models', 'Number of cached models',
+    multiprocess_mode='livesum'
+)
+READ_CACHE_EVENTS = Counter(
+    'yolo_read_cache_events_total', 'Read-through cache lookups (local hit, shared hit, miss) and invalidations',
+    ['cache', 'event']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'api_request_seconds', 'FastAPI request latency',
+    ['method', 'route', 'status'], buckets=STAGE_BUCKETS
+)
+
+
+# 按阶段累计耗时：同一阶段可以多次进入（如逐帧推理），每次都记入直方图
+class StageTimer:
+    def __init__(self, task_name):
+        self.task_name = task_name
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            TASK_STAGE_SECONDS.labels(self.task_name, name).observe(elapsed)
+
+    # 写入任务文档的耗时汇总
+    def summary(self, frames=None):
+        total = time.perf_counter() - self.started
+        summary = {
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'total': round(total, 4),
+        }
+        if frames is not None:
+            summary['frames'] = frames
+            summary['fps'] = round(frames / total, 2) if total > 0 else None
+        return summary
+
+
+# timer 为 None 时不计时，方便在可选计时的辅助函数中使用
+def stage(timer, name):
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+# 多进程模式下汇总所有进程写入的指标
+def metrics_registry():
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+# 清理上次运行留下的多进程指标文件，只在主进程启动时调用
+def reset_multiprocess_dir():
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return
+    for filename in os.listdir(PROMETHEUS_MULTIPROC_DIR):
+        if filename.endswith('.db'):
+            os.remove(os.path.join(PROMETHEUS_MULTIPROC_DIR, filename))
+
+
+def start_metrics_server(port):
+    start_http_server(port, registry=metrics_registry())
+
+
+def mark_process_dead(pid):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -1,5 +1,7 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
 from datetime import timedelta
 from .logger import get_logger
@@ -10,25 +12,46 @@ logger = get_logger()
 
 # minio_client_setup.py
 
+# S3 多对象删除接口每次最多 1000 个 key
+REMOVE_OBJECTS_BATCH_SIZE = 1000
+
+# 批量删除对象：每 1000 个 key 一次请求，多个批次并行执行
+# progress_callback(removed_count) 在每个批次完成后调用，返回 (removed_count, errors)
+def bulk_remove_objects(client, bucket, keys, max_workers=None, progress_callback=None):
+    keys = list(dict.fromkeys(k for k in keys if k))
+    batches = [keys[i:i + REMOVE_OBJECTS_BATCH_SIZE] for i in range(0, len(keys), REMOVE_OBJECTS_BATCH_SIZE)]
+    max_workers = max_workers or int(os.getenv('MINIO_DELETE_WORKERS', 4))
+
+    def remove_batch(batch):
+        # remove_objects 是惰性的，必须遍历返回的错误才会真正发送请求
+        errors = list(client.remove_objects(bucket, [DeleteObject(k) for k in batch]))
+        return len(batch) - len(errors), [f"{e.name}: {e.message}" for e in errors]
+
+    removed_count = 0
+    all_errors = []
+    if not batches:
+        return removed_count, all_errors
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for removed, errors in executor.map(remove_batch, batches):
+            removed_count += removed
+            all_errors.extend(errors)
+            if progress_callback:
+                progress_callback(removed_count)
+
+    return removed_count, all_errors
+
 class MinioClientWrapper:
     def __init__(self, client, bucket):
         self.client = client
         self.bucket = bucket
 
-    # 新增 delete_files 方法
+    # 新增 delete_files 方法，使用批量删除接口
     def delete_files(self, filenames):
-        deleted_count = 0
-
-        for filename in filenames:
-            try:
-                # folder 的 filename 为空
-                if filename and filename != '':
-                    logger.debug(f'filename : {filename}')
-                    self.client.remove_object(self.bucket, filename)
-                    logger.debug(f"File {filename} deleted successfully.")
-                    deleted_count += 1
-            except S3Error as e:
-                logger.debug(f"Error deleting file {filename} from MinIO: {str(e)}")
+        # folder 的 filename 为空
+        deleted_count, errors = bulk_remove_objects(self.client, self.bucket, [f for f in filenames if f])
+        for error in errors:
+            logger.debug("Error deleting file from MinIO: %s", error)
 
         return {
             "deleted_count": deleted_count,
@@ -45,7 +68,7 @@ class MinioClientWrapper:
             )
             return presigned_url
         except S3Error as e:
-            logger.debug(f"Error generating presigned URL for file {file_name}: {str(e)}")
+            logger.debug("Error generating presigned URL for file %s: %s", file_name, str(e))
             return None
 
 def setup_minio_client():
@@ -82,11 +105,11 @@ def setup_minio_client():
     try:
         if not minio_client.bucket_exists(minio_bucket):
             minio_client.make_bucket(minio_bucket)
-            logger.debug(f"Bucket '{minio_bucket}' created successfully.")
+            logger.debug("Bucket '%s' created successfully.", minio_bucket)
         else:
             print(f"Bucket '{minio_bucket}' already exists.")
     except S3Error as e:
-        logger.debug(f"Error occurred while creating MinIO bucket '{minio_bucket}':", e)
+        logger.debug("Error occurred while creating MinIO bucket '%s': %s", minio_bucket, e)
 
     # 返回封装好的 Minio 客户端和 bucket
     return MinioClientWrapper(minio_client, minio_bucket)
@@ -0,0 +1,139 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from ultralytics import YOLO
+
+from apis.logger import get_logger
+from apis.device import resolve_device
+from apis.metrics import MODEL_CACHE_BYTES, MODEL_CACHE_EVENTS, MODEL_CACHE_MODELS
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# 缓存占用上限（字节），默认 4GB
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+
+# 权重文件指纹：文件被覆盖/重新上传后 mtime 或 size 会变化
+def weight_fingerprint(model_path):
+    stat = os.stat(model_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# 估算模型常驻内存，拿不到参数时退回权重文件大小
+def estimate_model_bytes(model, model_path):
+    try:
+        module = model.model
+        total = sum(p.numel() * p.element_size() for p in module.parameters())
+        total += sum(b.numel() * b.element_size() for b in module.buffers())
+        if total > 0:
+            return total
+    except Exception:
+        pass
+    # 导出的 OpenVINO 模型是一个目录
+    if os.path.isdir(model_path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(model_path) for f in files)
+    return os.path.getsize(model_path)
+
+
+# 进程内的 YOLO 模型缓存，按 model_id 保存，权重文件指纹变化时重新加载
+class ModelCache:
+    def __init__(self, max_bytes=None, loader=YOLO):
+        if max_bytes is None:
+            max_bytes = int(os.getenv('MODEL_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+        self._loader = loader
+        self._lock = threading.Lock()
+        # model_id -> (fingerprint, model, nbytes)，按最近使用排序
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # load_kwargs 传给 loader，如导出的 ONNX/OpenVINO 文件需要 task='detect'
+    def get(self, model_id, model_path, **load_kwargs):
+        fingerprint = weight_fingerprint(model_path)
+
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(model_id)
+                self.hits += 1
+                MODEL_CACHE_EVENTS.labels('hit').inc()
+                return entry[1]
+
+            # 权重已更新，旧模型作废
+            if entry is not None:
+                self._remove(model_id)
+
+            self.misses += 1
+            MODEL_CACHE_EVENTS.labels('miss').inc()
+            model = self._loader(model_path, **load_kwargs)
+            nbytes = estimate_model_bytes(model, model_path)
+            self._entries[model_id] = (fingerprint, model, nbytes)
+            self._total_bytes += nbytes
+            self._evict()
+            self._publish()
+
+            # _stats() 需要遍历缓存，只在输出 DEBUG 日志时计算
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Model %s loaded into cache (%d bytes), stats: %s", model_id, nbytes, self._stats())
+            return model
+
+    def preload(self, model_id, model_path, imgsz=(640, 640), device=None):
+        model = self.get(model_id, model_path)
+        warmup(model, imgsz, device)
+        return model
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self._publish()
+
+    def stats(self):
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'models': len(self._entries),
+            'bytes': self._total_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+    def _publish(self):
+        MODEL_CACHE_BYTES.set(self._total_bytes)
+        MODEL_CACHE_MODELS.set(len(self._entries))
+
+    def _remove(self, model_id):
+        _, _, nbytes = self._entries.pop(model_id)
+        self._total_bytes -= nbytes
+
+    # 超出预算时淘汰最久未使用的模型，但至少保留刚加载的那个
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            model_id = next(iter(self._entries))
+            self._remove(model_id)
+            self.evictions += 1
+            MODEL_CACHE_EVENTS.labels('eviction').inc()
+            logger.debug("Model %s evicted from cache", model_id)
+
+
+# 用空白图跑一次推理，提前完成 CUDA 初始化和算子选择
+def warmup(model, imgsz=(640, 640), device=None):
+    height, width = imgsz
+    device = resolve_device(device)
+    dummy = np.zeros((height, width, 3), dtype=np.uint8)
+    model.predict(dummy, imgsz=(height, width), device=device, verbose=False)
+
+
+# 每个 worker 子进程一个缓存实例
+model_cache = ModelCache()
@@ -6,6 +6,11 @@ import time
 import os
 import yaml
 from models.models import model_collection
+from apis.utils import run_blocking
+from apis.celery_worker import export_model
+from apis.inference_backends import export_config, remove_exports
+from apis.result_cache import file_content_hash
+from apis.read_cache import model_docs, model_list, MODEL_LIST_KEY
 
 router = APIRouter()
 
@@ -29,11 +34,20 @@ class ModelResponse(BaseModel):
     created_at: float
     classes: List[str]
     default_detect_classes: List[str]
+    export_status: Optional[str] = None
 
     class Config:
         populate_by_name = True
         protected_namespaces = ()
 
+# 模型文档和列表很少变化，读取走读穿透缓存，修改后显式失效
+async def get_cached_model(model_id: str):
+    return await model_docs.aget(model_id, lambda: model_collection.find_one({"_id": ObjectId(model_id)}))
+
+async def invalidate_model(*model_ids: str):
+    await model_docs.ainvalidate(*model_ids)
+    await model_list.ainvalidate(MODEL_LIST_KEY)
+
 def save_upload_file(upload_file: UploadFile, destination: str):
     try:
         with open(destination, "wb") as buffer:
@@ -74,7 +88,7 @@ async def create_model(
     # Save model file
     model_filename = f"{name}_{int(time.time())}.pt"
     model_path = os.path.join("weights", model_filename)
-    save_upload_file(model_file, model_path)
+    await run_blocking(save_upload_file, model_file, model_path)
 
     # Parse YAML file
     yaml_content = await yaml_file.read()
@@ -85,12 +99,20 @@ async def create_model(
         "description": description,
         "created_at": time.time(),
         "model_path": model_path,
+        "weights_hash": await run_blocking(file_content_hash, model_path),
         "classes": parsed_data["classes"],
         "default_detect_classes": parsed_data["default_detect_classes"]
     }
 
-    result = model_collection.insert_one(model_data)
-    created_model = model_collection.find_one({"_id": result.inserted_id})
+    # 有配置导出格式时，后台导出 ONNX / OpenVINO 产物
+    if export_config()[0]:
+        model_data["export_status"] = "PENDING"
+
+    result = await model_collection.insert_one(model_data)
+    await model_list.ainvalidate(MODEL_LIST_KEY)
+    if export_config()[0]:
+        await run_blocking(export_model.apply_async, args=[str(result.inserted_id)])
+    created_model = await model_collection.find_one({"_id": result.inserted_id})
 
     return ModelResponse(
         _id=str(created_model["_id"]),
@@ -98,12 +120,13 @@ async def create_model(
         description=created_model["description"],
         created_at=created_model["created_at"],
         classes=created_model["classes"],
-        default_detect_classes=created_model["default_detect_classes"]
+        default_detect_classes=created_model["default_detect_classes"],
+        export_status=created_model.get("export_status")
     )
 
 @router.get("/models/{model_id}", response_model=ModelResponse)
 async def get_model(model_id: str):
-    model = model_collection.find_one({"_id": ObjectId(model_id)})
+    model = await get_cached_model(model_id)
     if model is None:
         raise HTTPException(status_code=404, detail="Model not found")
     return ModelResponse(
@@ -112,28 +135,60 @@ async def get_model(model_id: str):
         description=model["description"],
         created_at=model["created_at"],
         classes=model["classes"],
-        default_detect_classes=model["default_detect_classes"]
+        default_detect_classes=model["default_detect_classes"],
+        export_status=model.get("export_status")
     )
 
 @router.put("/models/{model_id}", response_model=ModelResponse)
 async def update_model(model_id: str, model_update: ModelUpdate):
     update_data = {k: v for k, v in model_update.dict().items() if v is not None}
-    result = model_collection.update_one(
+    result = await model_collection.update_one(
         {"_id": ObjectId(model_id)},
         {"$set": update_data}
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Model not found")
-    updated_model = model_collection.find_one({"_id": ObjectId(model_id)})
+    await invalidate_model(model_id)
+    updated_model = await get_cached_model(model_id)
     return ModelResponse(
         _id=str(updated_model["_id"]),
         name=updated_model["name"],
         description=updated_model["description"],
         created_at=updated_model["created_at"],
         classes=updated_model["classes"],
-        default_detect_classes=updated_model["default_detect_classes"]
+        default_detect_classes=updated_model["default_detect_classes"],
+        export_status=updated_model.get("export_status")
     )
 
+# 重新导出（如修改了 MODEL_EXPORT_SIZES 或安装了新的运行时）
+@router.post("/models/{model_id}/export")
+async def export_model_artifacts(model_id: str):
+    result = await model_collection.update_one(
+        {"_id": ObjectId(model_id)},
+        {"$set": {"export_status": "PENDING"}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Model not found")
+    await invalidate_model(model_id)
+    task = await run_blocking(export_model.apply_async, args=[model_id])
+    return {"task_id": task.id, "export_status": "PENDING"}
+
+# 导出产物和速度/精度对比报告
+@router.get("/models/{model_id}/exports")
+async def get_model_exports(model_id: str):
+    model = await model_collection.find_one(
+        {"_id": ObjectId(model_id)},
+        {"export_status": 1, "export_error": 1, "exports": 1, "export_report": 1}
+    )
+    if model is None:
+        raise HTTPException(status_code=404, detail="Model not found")
+    return {
+        "export_status": model.get("export_status"),
+        "export_error": model.get("export_error"),
+        "exports": model.get("exports", []),
+        "report": model.get("export_report")
+    }
+
 class BulkDeleteModel(BaseModel):
     model_ids: List[str]
 
@@ -144,16 +199,18 @@ async def bulk_delete_models(delete_data: BulkDeleteModel):
 
     for model_id in delete_data.model_ids:
         try:
-            model = model_collection.find_one({"_id": ObjectId(model_id)})
+            model = await model_collection.find_one({"_id": ObjectId(model_id)})
             if model is None:
                 errors.append(f"Model with ID {model_id} not found")
                 continue
             
             # Delete the model file
             if os.path.exists(model["model_path"]):
-                os.remove(model["model_path"])
+                await run_blocking(os.remove, model["model_path"])
+            await run_blocking(remove_exports, model_id)
             
-            result = model_collection.delete_one({"_id": ObjectId(model_id)})
+            result = await model_collection.delete_one({"_id": ObjectId(model_id)})
+            await invalidate_model(model_id)
             if result.deleted_count > 0:
                 deleted_count += 1
             else:
@@ -169,7 +226,7 @@ async def bulk_delete_models(delete_data: BulkDeleteModel):
 
 @router.get("/models", response_model=List[ModelResponse])
 async def list_models():
-    models = list(model_collection.find().sort('_id', -1))
+    models = await model_list.aget(MODEL_LIST_KEY, lambda: model_collection.find().sort('_id', -1).to_list(length=None))
     
     model_responses = [
         ModelResponse(
@@ -178,7 +235,8 @@ async def list_models():
             description=model["description"],
             created_at=model["created_at"],
             classes=model["classes"],
-            default_detect_classes=model["default_detect_classes"]
+            default_detect_classes=model["default_detect_classes"],
+            export_status=model.get("export_status")
         ) for model in models
     ]
 
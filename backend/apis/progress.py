@@ -0,0 +1,80 @@
+import os
+import threading
+
+from apis.logger import get_logger
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+
+# 合并写入的进度上报器：只在百分比变化时记录，后台线程按最小间隔写入 MongoDB
+# build_update(value) 可以返回自定义的更新文档（如聚合管道），默认 $set 到 field
+# on_write(value) 在每次写入成功后调用，用于推送进度事件
+class ProgressReporter:
+    def __init__(self, collection, query, field='progress', min_interval_ms=None, build_update=None, on_write=None):
+        if min_interval_ms is None:
+            min_interval_ms = int(os.getenv('PROGRESS_MIN_INTERVAL_MS', 500))
+        self.collection = collection
+        self.query = query
+        self.field = field
+        self.build_update = build_update or (lambda value: {'$set': {field: value}})
+        self.on_write = on_write
+        self.min_interval = min_interval_ms / 1000
+        self.write_count = 0
+
+        self._lock = threading.Lock()
+        self._pending = None
+        self._written = None
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='progress-reporter', daemon=True)
+        self._thread.start()
+
+    def update(self, progress):
+        progress = int(progress)
+        with self._lock:
+            if progress == self._pending:
+                return
+            self._pending = progress
+        self._wake.set()
+
+    # 停止后台线程并同步写入最后一次进度，成功、失败、中止都必须调用
+    def close(self, final=None):
+        if final is not None:
+            self.update(final)
+        self._closed.set()
+        self._wake.set()
+        self._thread.join()
+        self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed.is_set():
+                break
+            self._flush()
+            # 两次写入之间至少间隔 min_interval，期间的更新只保留最新值
+            self._closed.wait(self.min_interval)
+
+    def _flush(self):
+        with self._lock:
+            value = self._pending
+        if value is None or value == self._written:
+            return
+        try:
+            self.collection.update_one(self.query, self.build_update(value))
+            self._written = value
+            self.write_count += 1
+        except Exception as e:
+            logger.warning(f"Failed to write progress {value} for {self.query}: {e}")
+            return
+        if self.on_write:
+            self.on_write(value)
@@ -0,0 +1,214 @@
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+from bson import json_util
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from apis.logger import get_logger
+from apis.metrics import READ_CACHE_EVENTS
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# 进程内缓存的有效期（秒）：其他进程修改后，本进程最多读到这么久的旧数据
+LOCAL_TTL = float(os.getenv('READ_CACHE_LOCAL_TTL', 10))
+# Redis 共享层的有效期（秒），修改时显式删除
+SHARED_TTL = int(os.getenv('READ_CACHE_SHARED_TTL', 300))
+MAX_ENTRIES = int(os.getenv('READ_CACHE_MAX_ENTRIES', 1024))
+
+_MISSING = object()
+
+
+def read_cache_enabled():
+    return os.getenv('READ_CACHE', '1') == '1'
+
+
+# 为空时只使用进程内缓存
+def shared_redis_url():
+    return os.getenv('READ_CACHE_REDIS_URL')
+
+
+# 读穿透缓存：进程内 TTL + 可选的 Redis 共享层，未命中时调用 loader 读取 MongoDB
+# loader 返回 None（文档不存在）时不缓存，新建的文档可以立即读到
+# 同步接口 get/invalidate 供 worker 使用，异步接口 aget/ainvalidate 供 API 使用
+class ReadThroughCache:
+    def __init__(self, name, local_ttl=None, shared_ttl=None, max_entries=None):
+        self.name = name
+        self.local_ttl = LOCAL_TTL if local_ttl is None else local_ttl
+        self.shared_ttl = SHARED_TTL if shared_ttl is None else shared_ttl
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self._lock = threading.Lock()
+        # key -> (过期时间, 值)，按最近使用排序
+        self._entries = OrderedDict()
+        self._redis = None
+        self._async_redis = None
+
+    def shared_key(self, key):
+        return f"read_cache:{self.name}:{key}"
+
+    # ---- 进程内层 ----
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.local_ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _drop_local(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def _record(self, event, count=1):
+        READ_CACHE_EVENTS.labels(self.name, event).inc(count)
+
+    # 调用方可能修改返回的文档，每次返回副本
+    def _hit(self, key, event):
+        value = self._get_local(key)
+        if value is _MISSING:
+            return _MISSING
+        self._record(event)
+        return copy.deepcopy(value)
+
+    # ---- 同步接口（worker） ----
+
+    def _sync_client(self):
+        if self._redis is None and shared_redis_url():
+            self._redis = Redis.from_url(shared_redis_url())
+        return self._redis
+
+    def get(self, key, loader):
+        if not read_cache_enabled():
+            return loader()
+        value = self._hit(key, 'hit')
+        if value is not _MISSING:
+            return value
+
+        client = self._sync_client()
+        if client is not None:
+            try:
+                raw = client.get(self.shared_key(key))
+                if raw is not None:
+                    value = json_util.loads(raw)
+                    self._set_local(key, value)
+                    self._record('shared_hit')
+                    return copy.deepcopy(value)
+            except Exception as e:
+                logger.warning(f"Read cache {self.name}: shared lookup failed: {e}")
+
+        self._record('miss')
+        value = loader()
+        if value is not None:
+            self._set_local(key, value)
+            if client is not None:
+                try:
+                    client.set(self.shared_key(key), json_util.dumps(value), ex=self.shared_ttl)
+                except Exception as e:
+                    logger.warning(f"Read cache {self.name}: shared store failed: {e}")
+            value = copy.deepcopy(value)
+        return value
+
+    def invalidate(self, *keys):
+        keys = [str(k) for k in keys]
+        if not keys:
+            return
+        self._drop_local(keys)
+        self._record('invalidate', len(keys))
+        client = self._sync_client()
+        if client is not None:
+            try:
+                client.delete(*[self.shared_key(k) for k in keys])
+            except Exception as e:
+                logger.warning(f"Read cache {self.name}: shared invalidation failed: {e}")
+
+    # ---- 异步接口（API） ----
+
+    def _async_client(self):
+        if self._async_redis is None and shared_redis_url():
+            self._async_redis = AsyncRedis.from_url(shared_redis_url())
+        return self._async_redis
+
+    async def aget(self, key, loader):
+        if not read_cache_enabled():
+            return await loader()
+        value = self._hit(key, 'hit')
+        if value is not _MISSING:
+            return value
+
+        client = self._async_client()
+        if client is not None:
+            try:
+                raw = await client.get(self.shared_key(key))
+                if raw is not None:
+                    value = json_util.loads(raw)
+                    self._set_local(key, value)
+                    self._record('shared_hit')
+                    return copy.deepcopy(value)
+            except Exception as e:
+                logger.warning(f"Read cache {self.name}: shared lookup failed: {e}")
+
+        self._record('miss')
+        value = await loader()
+        if value is not None:
+            self._set_local(key, value)
+            if client is not None:
+                try:
+                    await client.set(self.shared_key(key), json_util.dumps(value), ex=self.shared_ttl)
+                except Exception as e:
+                    logger.warning(f"Read cache {self.name}: shared store failed: {e}")
+            value = copy.deepcopy(value)
+        return value
+
+    # 写入方已经有最新的值时直接放入缓存（如新建的文件夹）
+    async def aput(self, key, value):
+        if not read_cache_enabled():
+            return
+        self._set_local(key, value)
+        client = self._async_client()
+        if client is not None:
+            try:
+                await client.set(self.shared_key(key), json_util.dumps(value), ex=self.shared_ttl)
+            except Exception as e:
+                logger.warning(f"Read cache {self.name}: shared store failed: {e}")
+
+    async def ainvalidate(self, *keys):
+        keys = [str(k) for k in keys]
+        if not keys:
+            return
+        self._drop_local(keys)
+        self._record('invalidate', len(keys))
+        client = self._async_client()
+        if client is not None:
+            try:
+                await client.delete(*[self.shared_key(k) for k in keys])
+            except Exception as e:
+                logger.warning(f"Read cache {self.name}: shared invalidation failed: {e}")
+
+
+# 模型文档按 model_id 缓存，模型列表整体缓存在 MODEL_LIST_KEY 下
+MODEL_LIST_KEY = 'all'
+model_docs = ReadThroughCache('model')
+model_list = ReadThroughCache('model_list')
+
+# 文件夹信息按 "<集合名>:<folder_id>" 缓存
+folder_infos = ReadThroughCache('folder_info')
+
+
+def folder_info_key(collection_name, folder_id):
+    return f"{collection_name}:{folder_id}"
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import hashlib
+
+from bson.objectid import ObjectId
+from minio.commonconfig import CopySource
+
+from apis.logger import get_logger
+from apis.detections import detection_keys
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# 缓存条目：_id 为缓存键
+# state=running 表示有任务正在计算（单飞的 leader），followers 为等待同一结果的任务文档
+# state=ready 表示结果可用，result_file/detections 指向 leader 任务的产物
+RUNNING = 'running'
+READY = 'ready'
+
+# running 条目的存活上限；leader 失败或 worker 丢失时由 API 定期清理（见 tasks.sweep_result_cache），不必等到超时
+INFLIGHT_TIMEOUT = int(os.getenv('RESULT_CACHE_INFLIGHT_TIMEOUT', 6 * 3600))
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def result_cache_enabled():
+    return os.getenv('RESULT_CACHE', '1') == '1'
+
+
+# 单段上传的对象 ETag 就是内容的 MD5，分段上传的 ETag 带 "-<分段数>" 后缀，需要自己计算
+def etag_content_hash(etag):
+    etag = (etag or '').strip('"')
+    if len(etag) == 32 and '-' not in etag:
+        return f"md5:{etag}"
+    return None
+
+
+def object_content_hash(minio_client, bucket, object_name):
+    digest = hashlib.md5()
+    response = minio_client.get_object(bucket, object_name)
+    try:
+        for chunk in response.stream(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    finally:
+        response.close()
+        response.release_conn()
+    return f"md5:{digest.hexdigest()}"
+
+
+def file_content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+# 缓存键：媒体内容 + 权重内容 + 影响推理结果的参数
+def result_cache_key(media_hash, weights_hash, params, media_type):
+    payload = {
+        'media': media_hash,
+        'weights': weights_hash,
+        'media_type': media_type,
+        'conf': round(float(params.conf), 6),
+        'imgsz': [params.width, params.height],
+        'augment': bool(params.augment),
+        'classes': sorted(params.detect_class_indices),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def inflight_expired(entry, now=None):
+    return entry.get('state') == RUNNING and (now or time.time()) - entry.get('started_at', 0) > INFLIGHT_TIMEOUT
+
+
+# 服务端复制结果文件和检测结果，新任务拥有独立的对象，删除任意一个任务互不影响
+def copy_result_objects(minio_client, bucket, result_file, detections, task_doc_id):
+    new_result_file = f"results/result_{task_doc_id}{os.path.splitext(result_file)[1]}"
+    minio_client.copy_object(bucket, new_result_file, CopySource(bucket, result_file))
+
+    new_detections = None
+    if detections:
+        index_key, data_key = detection_keys(task_doc_id)
+        minio_client.copy_object(bucket, index_key, CopySource(bucket, detections['index']))
+        minio_client.copy_object(bucket, data_key, CopySource(bucket, detections['data']))
+        new_detections = {**detections, 'index': index_key, 'data': data_key}
+    return new_result_file, new_detections
+
+
+# ---- worker 端（同步 pymongo） ----
+
+# leader 任务完成：条目标记为 ready，并把结果复制给所有等待中的任务
+# notify(query, update) 在更新等待中的任务后调用，用于推送状态事件
+def publish_result(cache_collection, task_collection, minio_client, bucket, key, task_doc_id, result_file, detections, notify=None):
+    entry = cache_collection.find_one_and_update(
+        {'_id': key, 'task_doc_id': task_doc_id},
+        {'$set': {'state': READY, 'result_file': result_file, 'detections': detections, 'finished_at': time.time()}},
+    )
+    if entry is None:
+        return 0
+
+    followers = entry.get('followers', [])
+    for follower_id in followers:
+        try:
+            new_result_file, new_detections = copy_result_objects(minio_client, bucket, result_file, detections, follower_id)
+            update = {'status': 'SUCCESS', 'progress': 100, 'result_file': new_result_file, 'cached_from': task_doc_id, 'end_time': time.time()}
+            if new_detections:
+                update['detections'] = new_detections
+        except Exception as e:
+            logger.error(f"Failed to copy cached result to task {follower_id}: {e}", exc_info=True)
+            update = {'status': 'FAILURE', 'error_message': f"Failed to copy shared result: {e}", 'end_time': time.time()}
+        task_collection.update_one({'_id': ObjectId(follower_id)}, {'$set': update})
+        if notify:
+            notify({'_id': ObjectId(follower_id)}, update)
+    if followers:
+        logger.debug("Shared result of task %s with %s waiting task(s)", task_doc_id, len(followers))
+    return len(followers)
+
+
+# leader 任务失败或中止：删除条目让后续请求重新计算，等待中的任务同样标记失败
+def release_result(cache_collection, task_collection, key, task_doc_id, error, notify=None):
+    entry = cache_collection.find_one_and_delete({'_id': key, 'task_doc_id': task_doc_id, 'state': RUNNING})
+    if entry is None:
+        return
+    followers = entry.get('followers', [])
+    if followers:
+        query = {'_id': {'$in': [ObjectId(f) for f in followers]}}
+        update = {'status': 'FAILURE', 'error_message': f"Shared task {task_doc_id} failed: {error}", 'end_time': time.time()}
+        task_collection.update_many(query, {'$set': update})
+        if notify:
+            notify(query, update)
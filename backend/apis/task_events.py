@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import asyncio
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from apis.logger import get_logger
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# worker 把任务的进度和状态变化发布到同一个频道，每个 API 进程只订阅一次，再分发给各自的 WebSocket/SSE 连接
+CHANNEL = 'task_events'
+
+# 推送给前端的字段，其余更新（检测结果、耗时统计等）不推送
+EVENT_FIELDS = ('status', 'progress', 'error_message', 'result_file', 'start_time', 'end_time', 'segment_count')
+
+TERMINAL_STATES = {'SUCCESS', 'FAILURE', 'REVOKED'}
+
+# 连接空闲时发送心跳的间隔（秒），让代理不断开连接，也让服务端及时发现客户端已断开
+HEARTBEAT_SECONDS = float(os.getenv('TASK_EVENTS_HEARTBEAT', 15))
+
+
+def task_events_enabled():
+    return os.getenv('TASK_EVENTS', '1') == '1'
+
+
+def events_redis_url():
+    return os.getenv('TASK_EVENTS_REDIS_URL', 'redis://redis:6379/0')
+
+
+def build_event(task_id, update, parent_id=None):
+    fields = {k: v for k, v in update.items() if k in EVENT_FIELDS}
+    if not fields:
+        return None
+    return {'task_id': str(task_id), 'parent_id': parent_id, **fields, 'time': time.time()}
+
+
+# ---- worker 端（同步 redis） ----
+
+_redis = None
+
+
+def redis_client():
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(events_redis_url())
+    return _redis
+
+
+# 发布失败只记录日志，不影响任务本身
+def publish_task_event(task_id, update, parent_id=None):
+    event = build_event(task_id, update, parent_id)
+    if event is None or not task_events_enabled():
+        return
+    try:
+        redis_client().publish(CHANNEL, json.dumps(event, default=str))
+    except Exception as e:
+        logger.debug("Failed to publish event for task %s: %s", task_id, e)
+
+
+# update_many 之后按查询条件找出受影响的文档并逐个发布
+def publish_task_updates(task_collection, query, update):
+    if build_event('', update) is None or not task_events_enabled():
+        return
+    for doc in task_collection.find(query, {'parent_id': 1}):
+        publish_task_event(doc['_id'], update, doc.get('parent_id'))
+
+
+# ---- API 端（redis.asyncio） ----
+
+# 一个客户端连接的订阅：按任务 id 或文件夹（parent_id）过滤
+# 同一任务在发送前的多次更新合并成一条，慢客户端不会积压进度消息
+class TaskSubscription:
+    def __init__(self):
+        self.task_ids = set()
+        self.folder_ids = set()
+        self.closed = False
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def add(self, task_ids=(), folder_id=None):
+        self.task_ids.update(task_ids)
+        if folder_id:
+            self.folder_ids.add(folder_id)
+
+    def remove(self, task_ids=(), folder_id=None):
+        self.task_ids.difference_update(task_ids)
+        self.folder_ids.discard(folder_id)
+
+    def matches(self, event):
+        return event['task_id'] in self.task_ids or event.get('parent_id') in self.folder_ids
+
+    def push(self, event):
+        self._pending.setdefault(event['task_id'], {}).update(event)
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    # 等待下一批事件，超时返回空列表（用于心跳）
+    async def next_batch(self, timeout=HEARTBEAT_SECONDS):
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        events, self._pending = list(self._pending.values()), {}
+        return events
+
+
+class TaskEventHub:
+    def __init__(self):
+        self.subscriptions = set()
+        self._redis = None
+        self._listener = None
+
+    async def start(self):
+        self._redis = AsyncRedis.from_url(events_redis_url())
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+        for subscription in self.subscriptions:
+            subscription.close()
+        if self._redis:
+            await self._redis.aclose()
+
+    def subscribe(self):
+        subscription = TaskSubscription()
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, event):
+        for subscription in self.subscriptions:
+            if subscription.matches(event):
+                subscription.push(event)
+
+    # API 自己修改任务状态时（如撤销等待共享结果的任务）也走同一个频道，其他 API 进程的连接同样能收到
+    async def publish(self, task_id, update, parent_id=None):
+        event = build_event(task_id, update, parent_id)
+        if event is None or self._redis is None:
+            return
+        try:
+            await self._redis.publish(CHANNEL, json.dumps(event, default=str))
+        except Exception as e:
+            logger.debug("Failed to publish event for task %s: %s", task_id, e)
+
+    # update_many 之后按查询条件找出受影响的文档并逐个发布（异步 MongoDB 集合）
+    async def publish_updates(self, task_collection, query, update):
+        if build_event('', update) is None:
+            return
+        async for doc in task_collection.find(query, {'parent_id': 1}):
+            await self.publish(doc['_id'], update, doc.get('parent_id'))
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Task event subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+
+task_event_hub = TaskEventHub()
@@ -1,16 +1,28 @@
 import os
+import json
 import time
+import uuid
+import asyncio
 from typing import List,Optional
-from models.models import task_collection,media_collection
+from models.models import task_collection,media_collection,model_collection,result_cache_collection
+from pymongo.errors import DuplicateKeyError
 from celery.result import AsyncResult
 from bson.objectid import ObjectId
-from fastapi import APIRouter, HTTPException, Query 
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from .minio_client_setup import setup_minio_client
 from .logger import get_logger
-from .utils import get_folder_info
-from .celery_task_meta import YOLOTaskModel,TaskParams
-from .celery_worker import run_yolo_image, run_yolo_video
+from .utils import get_folder_info, run_blocking, paginate, build_ancestors, ancestors_path, update_folder, cache_new_folder, delete_selected
+from .celery_task_meta import YOLOTaskModel,TaskParams,BatchTaskParams
+from .celery_worker import run_yolo_image, run_yolo_video, run_yolo_image_batch, delete_subtree, collect_object_keys, OBJECT_KEY_PROJECTION
+from .models import get_cached_model, invalidate_model
+from .detections import read_detections
+from .worker_profiles import video_priority
+from .task_events import task_event_hub, build_event, EVENT_FIELDS, TERMINAL_STATES
+from .result_cache import (
+    RUNNING, READY, result_cache_enabled, result_cache_key, inflight_expired, copy_result_objects, file_content_hash
+)
 
 # 获取全局配置的 logger
 logger = get_logger()
@@ -22,8 +34,7 @@ router = APIRouter()
 
 @router.get("/task_status/{task_id}")
 async def get_task_status(task_id: str):
-    task_result = AsyncResult(task_id)
-    task_info = task_collection.find_one({'_id': ObjectId(task_id)})
+    task_info = await task_collection.find_one({'_id': ObjectId(task_id)})
     if task_info:
         result = {
             "task_id": task_id,
@@ -35,18 +46,146 @@ async def get_task_status(task_id: str):
             "error": task_info.get('error')
         }
     else:
+        # AsyncResult 的属性访问会同步读取 Redis
+        task_result = AsyncResult(task_id)
+        status, task_result_value = await run_blocking(lambda: (task_result.status, task_result.result))
         result = {
             "task_id": task_id,
-            "task_status": task_result.status,
-            "task_result": task_result.result
+            "task_status": status,
+            "task_result": task_result_value
         }
     return result
 
+# ---- 推送任务进度（替代轮询 /task_status） ----
+
+# 订阅时先返回当前状态：指定的任务，以及文件夹内尚未结束的任务
+async def task_snapshot(task_ids, folder_id=None):
+    query = []
+    object_ids = [ObjectId(t) for t in task_ids if ObjectId.is_valid(t)]
+    if object_ids:
+        query.append({'_id': {'$in': object_ids}})
+    if folder_id:
+        query.append({'parent_id': folder_id, 'status': {'$nin': list(TERMINAL_STATES)}})
+    if not query:
+        return []
+    projection = {field: 1 for field in (*EVENT_FIELDS, 'parent_id')}
+    docs = await task_collection.find({'$or': query}, projection).to_list(length=None)
+    events = [build_event(doc['_id'], doc, doc.get('parent_id')) for doc in docs]
+    return [e for e in events if e]
+
+def parse_task_ids(value):
+    return [t for t in (value or '').split(',') if t]
+
+# WebSocket：客户端发送 {"action": "subscribe" | "unsubscribe", "task_ids": [...], "folder_id": "..."}
+# 服务端推送 {"events": [...]}，空列表为心跳
+@router.websocket("/ws/task_events")
+async def task_events_websocket(websocket: WebSocket, task_ids: Optional[str] = None, folder_id: Optional[str] = None):
+    await websocket.accept()
+    subscription = task_event_hub.subscribe()
+
+    async def subscribe(ids, folder):
+        subscription.add(ids, folder)
+        for event in await task_snapshot(ids, folder):
+            subscription.push(event)
+
+    async def receive():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                ids = message.get('task_ids') or []
+                if message.get('action') == 'unsubscribe':
+                    subscription.remove(ids, message.get('folder_id'))
+                else:
+                    await subscribe(ids, message.get('folder_id'))
+        except (WebSocketDisconnect, ValueError):
+            # 客户端断开或发送了无法解析的消息，结束推送
+            pass
+        finally:
+            subscription.close()
+
+    receiver = None
+    try:
+        await subscribe(parse_task_ids(task_ids), folder_id)
+        receiver = asyncio.create_task(receive())
+        while not subscription.closed:
+            events = await subscription.next_batch()
+            if not subscription.closed:
+                await websocket.send_json({'events': events})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if receiver:
+            receiver.cancel()
+        task_event_hub.unsubscribe(subscription)
+
+# SSE：不支持 WebSocket 的环境使用，订阅内容由查询参数固定
+@router.get("/task_events")
+async def task_events_stream(request: Request, task_ids: Optional[str] = None, folder_id: Optional[str] = None):
+    ids = parse_task_ids(task_ids)
+    if not ids and not folder_id:
+        raise HTTPException(status_code=400, detail="task_ids or folder_id is required")
+    subscription = task_event_hub.subscribe()
+    subscription.add(ids, folder_id)
+    for event in await task_snapshot(ids, folder_id):
+        subscription.push(event)
+
+    async def stream():
+        try:
+            while not subscription.closed and not await request.is_disconnected():
+                events = await subscription.next_batch()
+                if not events:
+                    yield ": keep-alive\n\n"
+                for event in events:
+                    yield f"data: {json.dumps(event, default=str)}\n\n"
+        finally:
+            task_event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 查询后台删除任务的进度
+@router.get("/delete_jobs/{job_id}")
+async def get_delete_job(job_id: str):
+    job = AsyncResult(job_id)
+    state, info = await run_blocking(lambda: (job.state, job.info))
+    if isinstance(info, Exception):
+        info = {"error": str(info)}
+    return {"job_id": job_id, "state": state, "progress": info or {}}
+
 @router.post("/terminate_task/{task_id}")
 async def terminate_task(task_id: str):
+    task_doc = await task_collection.find_one(
+        {'celery_task_id': task_id},
+        {'segment_task_ids': 1, 'cache_key': 1, 'parent_id': 1, 'shared_with': 1, 'status': 1}
+    )
+    # 等待共享结果的任务没有自己的 Celery 任务：只退出等待列表，leader 和其他等待者不受影响
+    if task_doc and task_doc.get('shared_with'):
+        if task_doc.get('status') != 'PENDING':
+            raise HTTPException(status_code=400, detail=f"Task {task_id} is not running or doesn't exist.")
+        await result_cache_collection.update_one(
+            {'_id': task_doc['cache_key'], 'task_doc_id': task_doc['shared_with']},
+            {'$pull': {'followers': str(task_doc['_id'])}}
+        )
+        # leader 可能刚好完成并已复制结果，只撤销仍在等待的任务
+        update = {'status': 'REVOKED', 'end_time': time.time()}
+        revoked = await task_collection.update_one({'_id': task_doc['_id'], 'status': 'PENDING'}, {'$set': update})
+        if revoked.modified_count:
+            await task_event_hub.publish(task_doc['_id'], update, task_doc.get('parent_id'))
+        return {"message": f"Task {task_id} has been aborted."}
+
     task = AsyncResult(task_id)
-    if task.state in ['PENDING', 'RUNNING', 'RETRY']:
-        task.revoke(terminate=True)
+    state = await run_blocking(lambda: task.state)
+    if state in ['PENDING', 'RUNNING', 'RETRY']:
+        await run_blocking(task.revoke, terminate=True)
+        # 撤销单飞的 leader 时释放缓存条目，等待它的任务一并标记为撤销
+        if task_doc and task_doc.get('cache_key'):
+            await release_inflight(task_doc['cache_key'], str(task_doc['_id']), {'status': 'REVOKED'})
+        # 分段处理的长视频：任务文档跟踪的是合并任务，同时撤销所有分段任务
+        if task_doc and task_doc.get('segment_task_ids'):
+            for segment_task_id in task_doc['segment_task_ids']:
+                await run_blocking(AsyncResult(segment_task_id).revoke, terminate=True)
+            update = {'status': 'REVOKED', 'end_time': time.time()}
+            await task_collection.update_one({'_id': task_doc['_id']}, {'$set': update})
+            await task_event_hub.publish(task_doc['_id'], update, task_doc.get('parent_id'))
         return {"message": f"Task {task_id} has been aborted."}
     else:
         raise HTTPException(status_code=400, detail=f"Task {task_id} is not running or doesn't exist.")
@@ -55,44 +194,34 @@ async def terminate_task(task_id: str):
 async def get_tasks(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
-    folder_id: Optional[str] = None
+    folder_id: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    with_total: bool = True
 ):
     try:
-        logger.debug(f"folder_id : {folder_id}")
+        logger.debug("folder_id : %s", folder_id)
         if folder_id != "root":
             # Check if folder_id is 'root' or a valid ObjectId
             if not ObjectId.is_valid(folder_id):
                 raise HTTPException(status_code=400, detail="400: Invalid folder ID")
 
             # Fetch tasks associated with the provided folder_id
-            folder = task_collection.find_one({"_id": ObjectId(folder_id), "media_type": "folder"})
+            folder = await task_collection.find_one({"_id": ObjectId(folder_id), "media_type": "folder"})
             if not folder:
                 raise HTTPException(status_code=404, detail="404: Parent Folder not found")
 
-            cursor = task_collection.find({"parent_id": folder_id})
-        else:
-            # If folder_id is not provided, fetch the root folder contents
-            cursor = task_collection.find({"parent_id": "root"})
-
-        # Calculate skip value for pagination
-        skip = (page - 1) * page_size
-        cursor = cursor.sort('_id', -1).skip(skip).limit(page_size)
-
-        # Convert cursor to list and prepare the response
-        tasks = []
-        for task in cursor:
-            task['_id'] = str(task['_id'])  # Convert ObjectId to string
-            tasks.append(task)
-
-        # Get total count of documents
-        total_count = task_collection.count_documents({"parent_id": folder_id}) if folder_id != "root" else task_collection.count_documents({"parent_id": "root"})
+        # after/before 为游标分页，否则按页码分页；总数来自带缓存的计数
+        result = await paginate(task_collection, {"parent_id": folder_id or "root"}, page, page_size, after, before, with_total)
 
         return {
-            "tasks": tasks,
-            "page": page,
+            "tasks": result["items"],
+            "page": result["page"],
             "page_size": page_size,
-            "total_pages": (total_count + page_size - 1) // page_size,
-            "total_count": total_count
+            "total_pages": result["total_pages"],
+            "total_count": result["total_count"],
+            "next_cursor": result["next_cursor"],
+            "prev_cursor": result["prev_cursor"]
         }
     except HTTPException as http_exc:
         raise http_exc
@@ -100,33 +229,68 @@ async def get_tasks(
         raise HTTPException(status_code=500, detail=f"500: {str(e)}")
 
 
+# 单次请求最多返回的帧数
+MAX_DETECTION_FRAMES = 1000
+
+# 按帧范围和类别读取任务的检测结果，只读取需要的那一段数据
+@router.get("/tasks/{task_id}/detections")
+async def get_task_detections(
+    task_id: str,
+    start_frame: int = Query(0, ge=0),
+    end_frame: Optional[int] = Query(None, ge=0),
+    classes: Optional[List[int]] = Query(None)
+):
+    if not ObjectId.is_valid(task_id):
+        raise HTTPException(status_code=400, detail="Invalid task ID")
+
+    task_info = await task_collection.find_one({'_id': ObjectId(task_id)}, {'detections': 1})
+    if not task_info:
+        raise HTTPException(status_code=404, detail="Task not found")
+    detections = task_info.get('detections')
+    if not detections:
+        raise HTTPException(status_code=404, detail="No detections recorded for this task")
+
+    if end_frame is None:
+        end_frame = start_frame + MAX_DETECTION_FRAMES
+    if end_frame - start_frame > MAX_DETECTION_FRAMES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_DETECTION_FRAMES} frames per request")
+
+    try:
+        return await run_blocking(read_detections, minio_wrap.client, minio_wrap.bucket, detections, start_frame, end_frame, classes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.delete("/delete_tasks")
 async def delete_tasks(ids: List[str]):
     try:
-        # Convert string ids to ObjectId
-        logger.debug(f'ids = {ids}')
-        object_ids = [ObjectId(id) for id in ids]
-
-        # Find the documents to get MinIO filenames before deletion
-        task_to_delete = task_collection.find({"_id": {"$in": object_ids}})
- 
-        minio_filenames = []
-        for task in task_to_delete:
-            logger.debug(f'current task : {task}') 
-            if 'minio_filename' in task:
-                minio_filenames.append(task['minio_filename'])
-
-        # Delete the documents from MongoDB
-        result = task_collection.delete_many({"_id": {"$in": object_ids}})
-        logger.debug(f'filenames : {minio_filenames}')
-
-        # Delete the files from MinIO
-        minio_wrap.delete_files(minio_filenames)
+        logger.debug('Deleting %d task(s)', len(ids))
+        if not all(ObjectId.is_valid(id) for id in ids):
+            raise HTTPException(status_code=400, detail="Invalid task ID")
+
+        # 分段处理过的任务另外记录下来，由后台任务按前缀删除分段对象
+        segmented = []
+        def collect_keys(doc):
+            if doc.get('segment_count'):
+                segmented.append(str(doc['_id']))
+            return collect_object_keys('tasks', doc)
+
+        deleted_count, folder_ids, keys = await delete_selected(task_collection, ids, OBJECT_KEY_PROJECTION, collect_keys)
+        # 结果缓存指向被删除任务的产物，一并失效；running 条目由定期清理释放，等待的任务会收到失败状态
+        await result_cache_collection.delete_many({'task_doc_id': {'$in': ids}, 'state': READY})
+        await result_cache_collection.update_many({'followers': {'$in': ids}}, {'$pull': {'followers': {'$in': ids}}})
+
+        # 文件夹的子树和所有 MinIO 对象在后台任务中删除，通过 /delete_jobs/{job_id} 查询进度
+        job = None
+        if folder_ids or keys or segmented:
+            job = await run_blocking(delete_subtree.delay, 'tasks', folder_ids, keys, segmented)
 
         return {
-            "deleted_count": result.deleted_count,
-            "message": f"Successfully deleted {result.deleted_count} task(s)"
+            "deleted_count": deleted_count,
+            "job_id": job.id if job else None,
+            "message": f"Successfully deleted {deleted_count} task(s)"
         }
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -155,22 +319,19 @@ class TaskFolderCreateRequest(BaseModel):
     error:str = '' 
 
 # 获取完整路径的函数
-def get_full_path(parent_id: str, task_collection) -> str:
-    path_list = []
-    while parent_id != 'root':
-        parent = task_collection.find_one({"_id": ObjectId(parent_id), "media_type": "folder"})
-        if not parent:
-            raise HTTPException(status_code=404, detail="Parent Folder not found")
-        path_list.append(parent.get('original_filename'))
-        parent_id = parent['parent_id']
-    return os.sep.join([''] + path_list[::-1])
+async def get_full_path(parent_id: str, task_collection) -> str:
+    return ancestors_path(await build_ancestors(task_collection, parent_id))
 
 # 创建新文件夹的API
 @router.post("/task_create_new_folder")
 async def task_create_new_folder(folder: TaskFolderCreateRequest):
     try:
+        # 任务文件夹的 full_path 与 update_folder 一致，由 ancestors 推导
+        ancestors = await build_ancestors(task_collection, folder.parent_id)
+        full_path = ancestors_path(ancestors, folder.original_filename)
+
         # 检查是否已经存在相同名称的文件夹
-        existing_folder = task_collection.find_one({"full_path": folder.full_path, "media_type": "folder"})
+        existing_folder = await task_collection.find_one({"full_path": full_path, "media_type": "folder"})
         if existing_folder:
             return {
                 "message": "Folder with the same name already exists, creation failed.",
@@ -178,10 +339,14 @@ async def task_create_new_folder(folder: TaskFolderCreateRequest):
                 "flag": False  # 文件夹已存在，设置 flag 为 False
             }
 
-        logger.warning('create new task folder', folder.model_dump())
+        folder_doc = folder.model_dump()
+        folder_doc['ancestors'] = ancestors
+        folder_doc['full_path'] = full_path
+        logger.warning(f'create new task folder {folder_doc}')
         # 插入新文件夹到数据库
-        result = task_collection.insert_one(folder.model_dump())
-        
+        result = await task_collection.insert_one(folder_doc)
+        await cache_new_folder(task_collection, str(result.inserted_id), folder_doc['original_filename'], folder.parent_id, folder_doc['ancestors'])
+
         return {
             "message": "Folder created successfully",
             "folder_id": str(result.inserted_id),
@@ -201,15 +366,136 @@ class FolderWrap(BaseModel):
 @router.post("/get_task_parent_info_by_folder_id")
 async def get_task_parent_info_by_folder_id(folder_wrap: FolderWrap):
     try:
-        return get_folder_info(task_collection, folder_wrap.folderId)
+        return await get_folder_info(task_collection, folder_wrap.folderId)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 重命名或移动任务文件夹的请求体，字段为空表示不修改
+class TaskFolderUpdateRequest(BaseModel):
+    name: Optional[str] = None
+    parent_id: Optional[str] = None
+
+@router.put("/task_folder/{folder_id}")
+async def task_update_folder(folder_id: str, folder: TaskFolderUpdateRequest):
+    try:
+        return await update_folder(task_collection, folder_id, folder.name, folder.parent_id)
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 缓存键需要媒体和权重的内容哈希，旧模型没有记录权重哈希时补算一次
+async def get_result_cache_key(media_info, taskParams):
+    if not result_cache_enabled() or not media_info.get('content_hash'):
+        return None
+    model_info = await get_cached_model(taskParams.model_id)
+    if not model_info:
+        return None
+    weights_hash = model_info.get('weights_hash')
+    if not weights_hash:
+        weights_hash = await run_blocking(file_content_hash, model_info['model_path'])
+        await model_collection.update_one({'_id': model_info['_id']}, {'$set': {'weights_hash': weights_hash}})
+        await invalidate_model(taskParams.model_id)
+    return result_cache_key(media_info['content_hash'], weights_hash, taskParams, media_info['media_type'])
+
+# 删除 leader 的 running 条目，等待它的任务按 update 结束（撤销或失败）
+async def release_inflight(cache_key, task_doc_id, update):
+    entry = await result_cache_collection.find_one_and_delete({'_id': cache_key, 'task_doc_id': task_doc_id, 'state': RUNNING})
+    if entry and entry.get('followers'):
+        query = {'_id': {'$in': [ObjectId(f) for f in entry['followers']]}}
+        update = {**update, 'end_time': time.time()}
+        await task_collection.update_many(query, {'$set': update})
+        await task_event_hub.publish_updates(task_collection, query, update)
+    return entry
+
+# leader 已不在计算：超时、任务文档已删除或已结束，或 Celery 报告失败/撤销（如 worker 进程被杀）
+async def leader_lost(entry):
+    if inflight_expired(entry):
+        return True
+    leader = await task_collection.find_one({'_id': ObjectId(entry['task_doc_id'])}, {'status': 1})
+    if leader is None or leader.get('status') in TERMINAL_STATES:
+        return True
+    state = await run_blocking(lambda: AsyncResult(entry['celery_task_id']).state)
+    return state in ('FAILURE', 'REVOKED')
+
+async def release_if_lost(entry):
+    if not await leader_lost(entry):
+        return False
+    logger.warning(f"Leader task {entry['task_doc_id']} of cached result {entry['_id']} is lost, releasing its waiting tasks")
+    await release_inflight(entry['_id'], entry['task_doc_id'], {
+        'status': 'FAILURE', 'error_message': f"Shared task {entry['task_doc_id']} stopped before finishing"
+    })
+    return True
+
+# 定期清理 leader 已丢失的 running 条目，等待的任务不用等到 RESULT_CACHE_INFLIGHT_TIMEOUT
+RESULT_CACHE_SWEEP_INTERVAL = float(os.getenv('RESULT_CACHE_SWEEP_INTERVAL', 60))
+
+async def sweep_result_cache():
+    while True:
+        await asyncio.sleep(RESULT_CACHE_SWEEP_INTERVAL)
+        try:
+            async for entry in result_cache_collection.find({'state': RUNNING}, {'task_doc_id': 1, 'celery_task_id': 1, 'started_at': 1, 'state': 1}):
+                await release_if_lost(entry)
+        except Exception as e:
+            logger.warning(f"Result cache sweep failed: {e}")
+
+# 命中缓存时复制已有结果；同样的任务正在执行时加入等待列表；否则成为 leader
+# 返回给客户端的响应，成为 leader 时返回 None
+async def share_cached_result(cache_key, task_doc_id, celery_task_id):
+    for _ in range(3):
+        entry = await result_cache_collection.find_one({'_id': cache_key})
+        now = time.time()
+
+        if entry is not None and entry['state'] == RUNNING and await release_if_lost(entry):
+            continue
+
+        if entry is None:
+            leader = {'_id': cache_key, 'state': RUNNING, 'task_doc_id': task_doc_id, 'celery_task_id': celery_task_id, 'started_at': now, 'followers': []}
+            try:
+                await result_cache_collection.insert_one(leader)
+                return None
+            except DuplicateKeyError:
+                continue
+
+        if entry['state'] == READY:
+            try:
+                result_file, detections = await run_blocking(
+                    copy_result_objects, minio_wrap.client, minio_wrap.bucket, entry['result_file'], entry.get('detections'), task_doc_id
+                )
+            except Exception as e:
+                # 产物已不存在，作废条目后重新计算
+                logger.warning(f"Cached result {cache_key} is no longer available: {e}")
+                await result_cache_collection.delete_one({'_id': cache_key, 'task_doc_id': entry['task_doc_id']})
+                continue
+            update = {'status': 'SUCCESS', 'progress': 100, 'result_file': result_file, 'cached_from': entry['task_doc_id'], 'start_time': now, 'end_time': now}
+            if detections:
+                update['detections'] = detections
+            await task_collection.update_one({'_id': ObjectId(task_doc_id)}, {'$set': update})
+            await task_event_hub.publish_updates(task_collection, {'_id': ObjectId(task_doc_id)}, update)
+            logger.debug("Task %s served from result cache of task %s", task_doc_id, entry['task_doc_id'])
+            return {"task_id": None, "task_doc_id": task_doc_id, "cached": True}
+
+        # 正在执行：只有条目仍在运行时才能加入，避免错过 leader 的完成通知
+        joined = await result_cache_collection.update_one(
+            {'_id': cache_key, 'state': RUNNING, 'task_doc_id': entry['task_doc_id']},
+            {'$addToSet': {'followers': task_doc_id}}
+        )
+        if joined.matched_count == 0:
+            continue
+        # 等待的任务使用自己的 id，不暴露 leader 的 Celery 任务，撤销时只影响自己
+        await task_collection.update_one(
+            {'_id': ObjectId(task_doc_id)},
+            {'$set': {'celery_task_id': celery_task_id, 'shared_with': entry['task_doc_id']}}
+        )
+        logger.debug("Task %s waits for identical task %s", task_doc_id, entry['task_doc_id'])
+        return {"task_id": celery_task_id, "task_doc_id": task_doc_id, "shared_with": entry['task_doc_id']}
+    return None
+
 @router.post("/run_yolo")
 async def api_run_yolo(taskParams: TaskParams):
-    media_info = media_collection.find_one({'_id': ObjectId(taskParams.media_id)})
+    media_info = await media_collection.find_one({'_id': ObjectId(taskParams.media_id)})
 
-    logger.debug(taskParams)
+    logger.debug('%s', taskParams)
     task_doc = {
         'media_id': taskParams.media_id,
         'media_type': media_info['media_type'],
@@ -224,17 +510,27 @@ async def api_run_yolo(taskParams: TaskParams):
         'augment': taskParams.augment,
         'inserted_time': time.time(),
         'parent_id': taskParams.parent_id,
+        'ancestors': await build_ancestors(task_collection, taskParams.parent_id),
         'full_path': media_info['full_path']
     }
     try:
-        result = task_collection.insert_one(task_doc)
-        logger.info(f"Document inserted with task_item: {task_doc}")
+        result = await task_collection.insert_one(task_doc)
+        logger.info("Document inserted with task_item: %s", task_doc)
     except Exception as e:
         logger.error(f"Error inserting document {task_doc} into task_collection: {e}", exc_info=True)
         raise
 
     logger.debug(taskParams)
 
+    # 相同媒体、权重和参数的结果直接复用，进行中的相同任务只执行一次
+    celery_task_id = str(uuid.uuid4())
+    cache_key = await get_result_cache_key(media_info, taskParams)
+    if cache_key:
+        await task_collection.update_one({'_id': result.inserted_id}, {'$set': {'cache_key': cache_key}})
+        shared = await share_cached_result(cache_key, str(result.inserted_id), celery_task_id)
+        if shared:
+            return shared
+
     yolo_task_params = YOLOTaskModel(
         inserted_id=str(result.inserted_id),
         media_id=taskParams.media_id,
@@ -243,7 +539,10 @@ async def api_run_yolo(taskParams: TaskParams):
         conf=taskParams.conf,
         width=taskParams.width,
         height=taskParams.height,
-        augment=taskParams.augment
+        augment=taskParams.augment,
+        device=taskParams.device,
+        cache_key=cache_key,
+        parent_id=taskParams.parent_id
     )
 
     logger.debug(yolo_task_params)
@@ -253,10 +552,76 @@ async def api_run_yolo(taskParams: TaskParams):
         logger.debug('yolo image begin .....')
         
         # 调用 Celery 任务，将 task_params 转换为字典并作为参数传递
-        task = run_yolo_image.apply_async(args=[yolo_task_params.model_dump()])
+        task = await run_blocking(run_yolo_image.apply_async, args=[yolo_task_params.model_dump()], task_id=celery_task_id)
         logger.warning(task)
     elif media_info['media_type'] == "video":
         logger.debug('yolo video begin .....')
-        task = run_yolo_video.apply_async(args=[yolo_task_params.model_dump()])
+        # 长视频优先级较低，短任务可以插队
+        task = await run_blocking(run_yolo_video.apply_async, args=[yolo_task_params.model_dump()], task_id=celery_task_id, priority=video_priority(media_info.get('duration')))
     
-    return {"task_id": task.id, "task_doc_id": str(result.inserted_id)}
\ No newline at end of file
+    return {"task_id": task.id, "task_doc_id": str(result.inserted_id)}
+
+# 每个 Celery 批量任务最多包含的图片数，大文件夹会拆成多个批次分给不同 worker
+BATCH_TASK_MAX_ITEMS = int(os.getenv('BATCH_TASK_MAX_ITEMS', 256))
+
+@router.post("/run_yolo_batch")
+async def api_run_yolo_batch(batchParams: BatchTaskParams):
+    media_ids = [ObjectId(media_id) for media_id in batchParams.media_ids]
+    media_infos = await media_collection.find({'_id': {'$in': media_ids}, 'media_type': 'image'}).to_list(length=None)
+    if not media_infos:
+        raise HTTPException(status_code=404, detail="No images found")
+
+    skipped = len(set(batchParams.media_ids)) - len(media_infos)
+    inserted_time = time.time()
+    ancestors = await build_ancestors(task_collection, batchParams.parent_id)
+    batches = []
+    for start in range(0, len(media_infos), BATCH_TASK_MAX_ITEMS):
+        chunk = media_infos[start:start + BATCH_TASK_MAX_ITEMS]
+        # 预先生成 celery_task_id，保证整批失败时信号处理器能找到这些文档
+        celery_task_id = str(uuid.uuid4())
+        task_docs = [{
+            'media_id': str(media_info['_id']),
+            'media_type': media_info['media_type'],
+            'original_filename': media_info['original_filename'],
+            'minio_filename': media_info['minio_filename'],
+            'model_id': batchParams.model_id,
+            'detect_classes': batchParams.detect_classes,
+            'status': 'PENDING',
+            'conf': batchParams.conf,
+            'width': batchParams.width,
+            'height': batchParams.height,
+            'augment': batchParams.augment,
+            'inserted_time': inserted_time,
+            'parent_id': batchParams.parent_id,
+            'ancestors': ancestors,
+            'full_path': media_info['full_path'],
+            'celery_task_id': celery_task_id
+        } for media_info in chunk]
+
+        result = await task_collection.insert_many(task_docs)
+
+        yolo_task_params = [
+            YOLOTaskModel(
+                inserted_id=str(inserted_id),
+                media_id=task_doc['media_id'],
+                model_id=batchParams.model_id,
+                detect_class_indices=batchParams.detect_class_indices,
+                conf=batchParams.conf,
+                width=batchParams.width,
+                height=batchParams.height,
+                augment=batchParams.augment,
+                device=batchParams.device,
+                parent_id=batchParams.parent_id
+            ).model_dump()
+            for inserted_id, task_doc in zip(result.inserted_ids, task_docs)
+        ]
+
+        task = await run_blocking(
+            run_yolo_image_batch.apply_async,
+            args=[yolo_task_params, batchParams.batch_size],
+            task_id=celery_task_id
+        )
+        batches.append({"task_id": task.id, "task_doc_ids": [str(i) for i in result.inserted_ids]})
+
+    logger.debug("Image batch submitted: %s image(s) in %s batch(es), %s skipped", len(media_infos), len(batches), skipped)
+    return {"batches": batches, "skipped_count": skipped}
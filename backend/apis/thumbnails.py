@@ -0,0 +1,153 @@
+import io
+import os
+import subprocess
+
+from PIL import Image, ImageOps
+from redis import Redis
+
+from apis.logger import get_logger
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+# 缩略图最长边（像素），small 用于列表网格，medium 用于预览
+THUMBNAIL_SIZES = {'small': 256, 'medium': 768}
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'webp').lower()
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 80))
+
+# 视频雪碧图：columns x rows 个关键帧，每格宽 SPRITE_TILE_WIDTH
+SPRITE_COLUMNS = int(os.getenv('SPRITE_COLUMNS', 5))
+SPRITE_ROWS = int(os.getenv('SPRITE_ROWS', 5))
+SPRITE_TILE_WIDTH = int(os.getenv('SPRITE_TILE_WIDTH', 160))
+
+# 上传的媒体先进入 Redis 待处理列表，由一个延迟执行的任务成批取出处理
+# 取出的 id 先移到本批的处理列表，批处理结束后才删除，worker 中途退出时任务重新投递后继续处理
+PENDING_KEY = 'thumbnails:pending'
+SCHEDULED_KEY = 'thumbnails:scheduled'
+PROCESSING_KEY_PREFIX = 'thumbnails:processing:'
+BATCH_SIZE = int(os.getenv('THUMBNAIL_BATCH_SIZE', 50))
+BATCH_DELAY = float(os.getenv('THUMBNAIL_BATCH_DELAY', 2))
+
+_redis = None
+
+
+def thumbnails_enabled():
+    return os.getenv('THUMBNAILS', '1') == '1'
+
+
+def redis_client():
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(os.getenv('THUMBNAIL_REDIS_URL', 'redis://redis:6379/1'))
+    return _redis
+
+
+def thumbnail_extension():
+    return 'jpg' if THUMBNAIL_FORMAT in ('jpg', 'jpeg') else 'webp'
+
+
+def thumbnail_key(media_id, name):
+    return f"thumbs/{media_id}/{name}.{thumbnail_extension()}"
+
+
+def encode_image(image):
+    buffer = io.BytesIO()
+    if thumbnail_extension() == 'jpg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    else:
+        image.save(buffer, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+# 图片缩略图：JPEG 用 draft 模式在解码时直接按 1/2、1/4、1/8 缩小，不需要解码整张原图
+def image_thumbnails(data):
+    image = Image.open(io.BytesIO(data))
+    largest = max(THUMBNAIL_SIZES.values())
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+
+    thumbnails = {}
+    for name, size in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        thumbnails[name] = encode_image(image)
+    return thumbnails
+
+
+def run_ffmpeg(args):
+    result = subprocess.run(['/usr/bin/ffmpeg', '-loglevel', 'error', '-y', *args], capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+
+
+# 海报帧：在 10% 处向前 seek（只解码到最近的关键帧之后一帧）
+def video_poster(source, duration, output_path):
+    size = THUMBNAIL_SIZES['medium']
+    run_ffmpeg([
+        '-ss', str(max(0.0, (duration or 0) * 0.1)), '-i', source,
+        '-frames:v', '1',
+        '-vf', f"scale='min({size},iw)':-2",
+        output_path
+    ])
+
+
+# 雪碧图：只解码关键帧，均匀抽取 columns*rows 帧拼成一张图，前端按格子显示拖动预览
+def video_sprite(source, duration, output_path):
+    tiles = SPRITE_COLUMNS * SPRITE_ROWS
+    interval = max((duration or 0) / tiles, 0.04)
+    run_ffmpeg([
+        '-skip_frame', 'nokey', '-i', source,
+        '-vf', f"fps=1/{interval:.3f},scale={SPRITE_TILE_WIDTH}:-2,tile={SPRITE_COLUMNS}x{SPRITE_ROWS}",
+        '-frames:v', '1',
+        output_path
+    ])
+    with Image.open(output_path) as sprite:
+        tile_height = sprite.height // SPRITE_ROWS
+    return {
+        'columns': SPRITE_COLUMNS,
+        'rows': SPRITE_ROWS,
+        'interval': round(interval, 3),
+        'tile_width': SPRITE_TILE_WIDTH,
+        'tile_height': tile_height,
+    }
+
+
+# ---- 成批调度 ----
+
+# 把媒体加入待处理列表；第一个加入的请求负责安排一次延迟执行的批处理任务
+def enqueue_thumbnails(media_id, schedule):
+    client = redis_client()
+    client.rpush(PENDING_KEY, media_id)
+    if client.set(SCHEDULED_KEY, 1, nx=True, ex=int(BATCH_DELAY * 10) + 60):
+        schedule(BATCH_DELAY)
+
+
+def processing_key(batch_id):
+    return f"{PROCESSING_KEY_PREFIX}{batch_id}"
+
+
+# 在一个事务中用 LMOVE 把最多 count 个 id 移到本批的处理列表；处理列表已有 id 时说明任务被重新投递，继续处理这些 id
+def take_pending(batch_id, count=BATCH_SIZE):
+    client = redis_client()
+    key = processing_key(batch_id)
+    ids = client.lrange(key, 0, -1)
+    if not ids:
+        pipeline = client.pipeline()
+        for _ in range(count):
+            pipeline.lmove(PENDING_KEY, key, 'LEFT', 'RIGHT')
+        ids = [i for i in pipeline.execute() if i is not None]
+    return [i.decode() for i in ids]
+
+
+# 本批处理完后：列表还有剩余就继续安排下一批，否则清除调度标记
+def finish_batch(batch_id, schedule):
+    client = redis_client()
+    client.delete(processing_key(batch_id))
+    if client.llen(PENDING_KEY):
+        schedule(0)
+    else:
+        client.delete(SCHEDULED_KEY)
+        # 删除标记和新媒体入队之间可能交错，再检查一次
+        if client.llen(PENDING_KEY) and client.set(SCHEDULED_KEY, 1, nx=True, ex=int(BATCH_DELAY * 10) + 60):
+            schedule(0)
@@ -1,32 +1,62 @@
+import os
+import re
+import json
+import time
+import base64
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
 from fastapi import HTTPException
 from .logger import get_logger
+from .read_cache import folder_infos, folder_info_key
 
 # 获取全局配置的 logger
 logger = get_logger()
 
-def get_folder_info(collection, folder_id):
+# 有界线程池，API 中阻塞的 MinIO/Celery/文件 IO 调用放到这里执行，避免卡住事件循环
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BLOCKING_IO_THREADS', 16)),
+    thread_name_prefix='blocking-io'
+)
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
+
+# 文件夹信息很少变化，经过读穿透缓存；重命名/移动/删除文件夹时失效
+async def get_folder_info(collection, folder_id):
     if folder_id == 'root':
         return {'folder_id': 'root', 'folder_name':'root', 'parent_id': '', 'parent_name': '', 'parent_path': ''}
 
     if not ObjectId.is_valid(folder_id):
         raise HTTPException(status_code=400, detail="Invalid folder ID")
 
-    folder = collection.find_one({"_id": ObjectId(folder_id), "media_type": "folder"})
-
-    if not folder:
+    info = await folder_infos.aget(folder_info_key(collection.name, folder_id), lambda: load_folder_info(collection, folder_id))
+    if info is None:
         logger.error('Folder not found')
         raise HTTPException(status_code=404, detail="Folder not found")
+    return info
+
+async def load_folder_info(collection, folder_id):
+    folder = await collection.find_one({"_id": ObjectId(folder_id), "media_type": "folder"})
+    if not folder:
+        return None
 
     parent_id = folder.get("parent_id", "root")
-    folder_name = folder.get("original_filename")
+    ancestors = folder.get('ancestors')
+    if parent_id != 'root' and ancestors is None:
+        # 尚未迁移的旧文档，按 parent_id 向上查找
+        ancestors = await build_ancestors(collection, parent_id)
+    return build_folder_info(folder_id, folder.get("original_filename"), parent_id, ancestors)
 
+def build_folder_info(folder_id, folder_name, parent_id, ancestors):
     if parent_id != 'root':
-        parent = collection.find_one({"_id": ObjectId(parent_id), "media_type": "folder"})
-        if not parent:
-            raise HTTPException(status_code=404, detail="Parent Folder not found")
-        parent_name = parent.get('original_filename')
-        parent_path = parent.get('full_path')
+        parent_name = ancestors[-1]['name']
+        parent_path = ancestors_path(ancestors)
     else:
         parent_name = 'root'
         parent_path = 'root'
@@ -37,4 +67,233 @@ def get_folder_info(collection, folder_id):
         "parent_id": parent_id,
         "parent_name": parent_name,
         "parent_path": parent_path,
-    }
\ No newline at end of file
+    }
+
+# 新建文件夹时直接写入缓存，进入新文件夹不需要再读库
+async def cache_new_folder(collection, folder_id, folder_name, parent_id, ancestors):
+    await folder_infos.aput(folder_info_key(collection.name, folder_id), build_folder_info(folder_id, folder_name, parent_id, ancestors))
+
+# 每个文档的 ancestors 字段保存从根到父文件夹的 [{id, name}]，路径和面包屑只需读一次
+def ancestors_path(ancestors, name=None):
+    names = [a['name'] for a in ancestors] + ([name] if name is not None else [])
+    return os.sep.join([''] + names)
+
+# 计算 parent_id 下新文档的 ancestors：读父文件夹一次，父文件夹缺少 ancestors 时才逐级向上查找
+async def build_ancestors(collection, parent_id):
+    if parent_id == 'root':
+        return []
+
+    if not ObjectId.is_valid(parent_id):
+        raise HTTPException(status_code=400, detail="Invalid folder ID")
+
+    parent = await collection.find_one({"_id": ObjectId(parent_id), "media_type": "folder"}, {"original_filename": 1, "parent_id": 1, "ancestors": 1})
+    if not parent:
+        raise HTTPException(status_code=404, detail="Parent Folder not found")
+
+    parent_ancestors = parent.get('ancestors')
+    if parent_ancestors is None:
+        parent_ancestors = await build_ancestors(collection, parent.get('parent_id', 'root'))
+    return parent_ancestors + [{'id': parent_id, 'name': parent.get('original_filename')}]
+
+# 重命名或移动文件夹：更新文件夹自身以及整个子树的 ancestors 和 full_path
+async def update_folder(collection, folder_id, name=None, parent_id=None):
+    if not ObjectId.is_valid(folder_id):
+        raise HTTPException(status_code=400, detail="Invalid folder ID")
+
+    folder = await collection.find_one({"_id": ObjectId(folder_id), "media_type": "folder"})
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    name = name if name is not None else folder.get('original_filename')
+    old_ancestors = folder.get('ancestors')
+    if old_ancestors is None:
+        old_ancestors = await build_ancestors(collection, folder.get('parent_id', 'root'))
+
+    if parent_id is None or parent_id == folder.get('parent_id', 'root'):
+        parent_id = folder.get('parent_id', 'root')
+        new_ancestors = old_ancestors
+    else:
+        new_ancestors = await build_ancestors(collection, parent_id)
+        # 不能移动到自身或自己的子文件夹下
+        if parent_id == folder_id or any(a['id'] == folder_id for a in new_ancestors):
+            raise HTTPException(status_code=400, detail="Cannot move a folder into itself")
+
+    full_path = ancestors_path(new_ancestors, name)
+    existing_folder = await collection.find_one({"full_path": full_path, "media_type": "folder", "_id": {"$ne": ObjectId(folder_id)}})
+    if existing_folder:
+        raise HTTPException(status_code=409, detail="Folder with the same name already exists")
+
+    # 只有媒体文件夹有 name 字段，任务文件夹只使用 original_filename
+    folder_update = {"original_filename": name, "parent_id": parent_id, "ancestors": new_ancestors, "full_path": full_path}
+    if collection.name == 'medias':
+        folder_update["name"] = name
+    await collection.update_one({"_id": ObjectId(folder_id)}, {"$set": folder_update})
+
+    # 子树中所有文档：用新的前缀替换 ancestors 中本文件夹及之前的部分
+    depth = len(old_ancestors)
+    new_prefix = new_ancestors + [{'id': folder_id, 'name': name}]
+    await collection.update_many(
+        {"ancestors.id": folder_id},
+        [{"$set": {"ancestors": {"$concatArrays": [
+            new_prefix,
+            {"$slice": ["$ancestors", depth + 1, {"$max": [{"$size": "$ancestors"}, 1]}]}
+        ]}}}]
+    )
+
+    # 子树中的媒体文件：full_path 以本文件夹旧路径开头的，替换为新路径（/run_yolo 会把它复制到新任务）
+    # 任务的 full_path 复制自媒体路径，与任务文件夹层级无关，这里不改写
+    old_full_path = folder.get('full_path') or ancestors_path(old_ancestors, folder.get('original_filename'))
+    if collection.name == 'medias' and old_full_path != full_path:
+        await collection.update_many(
+            {"ancestors.id": folder_id, "media_type": {"$ne": "folder"}, "full_path": {"$regex": f"^{re.escape(old_full_path)}({re.escape(os.sep)}|$)"}},
+            [{"$set": {"full_path": {"$concat": [
+                full_path,
+                {"$substrCP": ["$full_path", len(old_full_path), {"$strLenCP": "$full_path"}]}
+            ]}}}]
+        )
+
+    # 子文件夹的 full_path 由 ancestors 推导
+    operations = []
+    sub_folder_ids = []
+    async for sub_folder in collection.find({"ancestors.id": folder_id, "media_type": "folder"}, {"ancestors": 1, "original_filename": 1}):
+        sub_folder_ids.append(str(sub_folder["_id"]))
+        operations.append(UpdateOne(
+            {"_id": sub_folder["_id"]},
+            {"$set": {"full_path": ancestors_path(sub_folder["ancestors"], sub_folder.get("original_filename"))}}
+        ))
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+
+    # 本文件夹及所有子文件夹的名称/父路径都可能变化
+    await folder_infos.ainvalidate(*[folder_info_key(collection.name, i) for i in [folder_id] + sub_folder_ids])
+
+    return {"folder_id": folder_id, "name": name, "parent_id": parent_id, "full_path": full_path, "ancestors": new_ancestors}
+
+# 同步删除所选文档，API 返回时列表中已经看不到它们；返回删除数量、其中的文件夹 id 和关联的 MinIO 对象
+# 文件夹的子树和对象删除较慢，由调用方交给后台任务
+async def delete_selected(collection, ids, projection, collect_keys):
+    object_ids = [ObjectId(i) for i in ids]
+    folder_ids = []
+    keys = []
+    async for doc in collection.find({"_id": {"$in": object_ids}}, projection):
+        if doc.get('media_type') == 'folder':
+            folder_ids.append(str(doc['_id']))
+        keys.extend(collect_keys(doc))
+
+    result = await collection.delete_many({"_id": {"$in": object_ids}})
+    await folder_infos.ainvalidate(*[folder_info_key(collection.name, i) for i in folder_ids])
+    return result.deleted_count, folder_ids, keys
+
+# 游标分页的 token：对排序键 _id 做 base64 编码，对客户端不透明
+def encode_cursor(object_id):
+    return base64.urlsafe_b64encode(ObjectId(object_id).binary).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        return ObjectId(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (InvalidId, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# 文件夹计数缓存，避免每次翻页都执行 count_documents
+# 按最近使用排序，超过条数上限时淘汰最久未用的条目，过期条目读到时删除
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', 30))
+COUNT_CACHE_MAX_ENTRIES = int(os.getenv('COUNT_CACHE_MAX_ENTRIES', 1024))
+_count_cache = OrderedDict()
+
+async def cached_count(collection, query):
+    key = (collection.name, tuple(sorted(query.items())))
+    cached = _count_cache.get(key)
+    now = time.monotonic()
+    if cached:
+        if now - cached[1] < COUNT_CACHE_TTL:
+            _count_cache.move_to_end(key)
+            return cached[0]
+        del _count_cache[key]
+    count = await collection.count_documents(query)
+    _count_cache[key] = (count, now)
+    _count_cache.move_to_end(key)
+    while len(_count_cache) > COUNT_CACHE_MAX_ENTRIES:
+        _count_cache.popitem(last=False)
+    return count
+
+# 按 _id 倒序分页：传 after/before 时使用游标分页，否则按页码分页（兼容旧接口）
+async def paginate(collection, query, page=1, page_size=10, after=None, before=None, with_total=True):
+    if after and before:
+        raise HTTPException(status_code=400, detail="Only one of after/before can be set")
+
+    if after:
+        cursor = collection.find({**query, '_id': {'$lt': decode_cursor(after)}}).sort('_id', -1)
+    elif before:
+        cursor = collection.find({**query, '_id': {'$gt': decode_cursor(before)}}).sort('_id', 1)
+    else:
+        cursor = collection.find(query).sort('_id', -1).skip((page - 1) * page_size)
+
+    # 多取一条用于判断是否还有下一页
+    items = await cursor.limit(page_size + 1).to_list(length=None)
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if before:
+        items.reverse()
+
+    if before:
+        has_next, has_prev = True, has_more
+    elif after:
+        has_next, has_prev = has_more, True
+    else:
+        has_next, has_prev = has_more, page > 1
+
+    next_cursor = encode_cursor(items[-1]['_id']) if items and has_next else None
+    prev_cursor = encode_cursor(items[0]['_id']) if items and has_prev else None
+
+    for item in items:
+        item['_id'] = str(item['_id'])
+
+    total_count = await cached_count(collection, query) if with_total else None
+    return {
+        "items": items,
+        "page": None if (after or before) else page,
+        "page_size": page_size,
+        "total_pages": (total_count + page_size - 1) // page_size if total_count is not None else None,
+        "total_count": total_count,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+    }
+
+# 把逗号分隔的字段列表转换为 MongoDB projection，None 表示返回全部字段
+def parse_projection(fields):
+    if not fields:
+        return None
+    return {field.strip(): 1 for field in fields.split(',') if field.strip()}
+
+# 逐批从游标读取文档并输出为 NDJSON 或 JSON 数组的片段，内存占用与集合大小无关
+async def stream_documents(cursor, fmt='json', batch_size=500):
+    cursor = cursor.batch_size(batch_size)
+    ndjson = fmt == 'ndjson'
+    first = True
+    chunk = [] if ndjson else ['[']
+
+    def append(doc):
+        nonlocal first
+        line = json.dumps(doc, default=str, ensure_ascii=False)
+        if ndjson:
+            chunk.append(line + '\n')
+        else:
+            chunk.append(line if first else ',' + line)
+        first = False
+
+    # 响应头已经发出，出错时无法再改状态码：记录日志，并以 {"error": ...} 作为最后一条记录结束输出
+    try:
+        async for doc in cursor:
+            doc['_id'] = str(doc['_id'])
+            append(doc)
+            if len(chunk) >= batch_size:
+                yield ''.join(chunk)
+                chunk = []
+    except Exception as e:
+        logger.error("Failed to stream documents: %s", e)
+        append({"error": str(e)})
+
+    if not ndjson:
+        chunk.append(']')
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,91 @@
+import os
+import queue
+import subprocess
+import threading
+
+from apis.logger import get_logger
+
+# 获取全局配置的 logger
+logger = get_logger()
+
+_STOP = object()
+
+
+# 把 BGR 帧通过 stdin 直接送进一个 ffmpeg libx264 进程，一次编码得到可在浏览器播放的 mp4
+# 推理循环和编码之间用有界队列隔开，编码慢时推理会被阻塞而不是无限占用内存
+class FFmpegVideoWriter:
+    def __init__(self, output_path, width, height, fps, preset=None, crf=None, queue_size=None):
+        preset = preset or os.getenv('VIDEO_ENCODER_PRESET', 'veryfast')
+        crf = crf if crf is not None else int(os.getenv('VIDEO_ENCODER_CRF', 23))
+        queue_size = queue_size or int(os.getenv('VIDEO_ENCODER_QUEUE_SIZE', 32))
+
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.frame_count = 0
+
+        command = [
+            '/usr/bin/ffmpeg', '-loglevel', 'error', '-nostats',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}', '-r', str(fps or 25),
+            '-i', 'pipe:0',
+            '-an',
+            '-c:v', 'libx264', '-preset', preset, '-crf', str(crf),
+            '-profile:v', 'high', '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',  # Optimize for web streaming
+            '-y', output_path
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='ffmpeg-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        if self._error is not None:
+            raise Exception(f"Video encoding failed: {self._error}")
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} does not match encoder size {self.width}x{self.height}")
+        self._queue.put(frame)
+        self.frame_count += 1
+
+    # 写完所有帧并等待 ffmpeg 结束，失败时抛出异常
+    def release(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        _, stderr = self._process.communicate()
+        if self._error is not None or self._process.returncode != 0:
+            message = self._error or stderr.decode(errors='replace').strip()
+            raise Exception(f"Video encoding failed: {message}")
+        logger.debug("Encoded %s frames to %s", self.frame_count, self.output_path)
+
+    # 中止编码并删除未完成的输出文件
+    def abort(self):
+        self._process.kill()
+        # 清空队列让写线程退出
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._process.wait()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _STOP:
+                break
+            if self._error is not None:
+                continue
+            try:
+                self._process.stdin.write(frame.tobytes())
+            except (BrokenPipeError, OSError) as e:
+                self._error = str(e)
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
@@ -0,0 +1,73 @@
+import os
+
+from kombu import Queue
+
+# 队列划分：转码（ffmpeg，CPU 密集）、图片推理（短任务）、视频推理（长任务）、缩略图（低优先级）
+# 删除、哈希等零散任务留在默认的 celery 队列，由转码 worker 顺带处理
+DEFAULT_QUEUE = 'celery'
+TRANSCODE_QUEUE = 'transcode'
+IMAGE_QUEUE = 'image-inference'
+VIDEO_QUEUE = 'video-inference'
+THUMBNAIL_QUEUE = 'thumbnails'
+
+TASK_QUEUES = [Queue(name) for name in (DEFAULT_QUEUE, TRANSCODE_QUEUE, IMAGE_QUEUE, VIDEO_QUEUE, THUMBNAIL_QUEUE)]
+
+# Redis broker 的优先级：0 最高，9 最低，同一 worker 消费多个队列时先取高优先级的消息
+HIGHEST_PRIORITY = 0
+DEFAULT_PRIORITY = 5
+LOWEST_PRIORITY = 9
+
+TASK_ROUTES = {
+    'convert_video': {'queue': TRANSCODE_QUEUE},
+    'merge_video_segments': {'queue': TRANSCODE_QUEUE},
+    'run_yolo_image': {'queue': IMAGE_QUEUE, 'priority': HIGHEST_PRIORITY},
+    'run_yolo_image_batch': {'queue': IMAGE_QUEUE, 'priority': 2},
+    'run_yolo_video': {'queue': VIDEO_QUEUE},
+    'run_yolo_video_segment': {'queue': VIDEO_QUEUE},
+    # 导出时对比各后端的延迟，必须在实际执行推理的节点上测量
+    'export_model': {'queue': VIDEO_QUEUE, 'priority': LOWEST_PRIORITY},
+    'generate_thumbnails': {'queue': THUMBNAIL_QUEUE, 'priority': LOWEST_PRIORITY},
+}
+
+BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+
+
+# 视频越长优先级越低，几小时的视频不会挡住短视频；时长未知时按默认优先级
+def video_priority(duration):
+    if not duration:
+        return DEFAULT_PRIORITY
+    if duration < 60:
+        return 3
+    if duration < 600:
+        return 6
+    return 8
+
+
+# worker 启动配置，通过 WORKER_PROFILE 选择；未设置时消费所有队列（单 worker 部署）
+# 长任务的 prefetch 为 1，避免一个 worker 预取多个长视频而让其他 worker 空闲
+WORKER_PROFILES = {
+    'transcode': {'queues': [TRANSCODE_QUEUE, DEFAULT_QUEUE], 'concurrency': 2, 'prefetch_multiplier': 1},
+    'image-inference': {'queues': [IMAGE_QUEUE], 'concurrency': 4, 'prefetch_multiplier': 4},
+    'video-inference': {'queues': [VIDEO_QUEUE], 'concurrency': 2, 'prefetch_multiplier': 1},
+    # 单块 GPU 同时处理图片和视频，靠优先级让图片任务先执行
+    'inference': {'queues': [IMAGE_QUEUE, VIDEO_QUEUE], 'concurrency': 4, 'prefetch_multiplier': 1},
+    'thumbnails': {'queues': [THUMBNAIL_QUEUE], 'concurrency': 2, 'prefetch_multiplier': 1},
+    'all': {'queues': [q.name for q in TASK_QUEUES], 'concurrency': 4, 'prefetch_multiplier': 1},
+}
+
+
+# 返回当前 worker 的配置，WORKER_CONCURRENCY / WORKER_PREFETCH_MULTIPLIER 可以覆盖默认值
+def worker_profile(name=None):
+    name = name or os.getenv('WORKER_PROFILE') or 'all'
+    if name not in WORKER_PROFILES:
+        raise Exception(f"Unknown worker profile {name}, expected one of {', '.join(WORKER_PROFILES)}")
+    profile = dict(WORKER_PROFILES[name], name=name)
+    if os.getenv('WORKER_CONCURRENCY'):
+        profile['concurrency'] = int(os.getenv('WORKER_CONCURRENCY'))
+    if os.getenv('WORKER_PREFETCH_MULTIPLIER'):
+        profile['prefetch_multiplier'] = int(os.getenv('WORKER_PREFETCH_MULTIPLIER'))
+    return profile
@@ -0,0 +1,118 @@
+# 对热点查询执行 explain，任何一个查询计划出现 COLLSCAN 时以非零状态退出
+# 用法（在 backend 目录下）：
+#   python3 -m benchmarks.check_query_plans --mongo-url mongodb://localhost:27018/
+#   python3 -m benchmarks.check_query_plans --db yolo_bench --seed 200000 --ensure-indexes
+import argparse
+import json
+import sys
+import time
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from models.indexes import COLLECTION_INDEXES
+
+# (集合, 说明, find 命令参数)
+HOT_QUERIES = [
+    (collection, description, command)
+    for collection in ('medias', 'tasks')
+    for description, command in [
+        ('list folder page', {'filter': {'parent_id': 'root'}, 'sort': {'_id': -1}, 'limit': 10}),
+        ('folder name check', {'filter': {'full_path': '/bench/folder', 'media_type': 'folder'}, 'limit': 1}),
+        ('celery signal update', {'filter': {'celery_task_id': 'bench-task-id'}, 'limit': 1}),
+    ]
+] + [
+    ('medias', 'count folder items', {'count': True, 'query': {'parent_id': 'root'}}),
+    ('tasks', 'count folder items', {'count': True, 'query': {'parent_id': 'root'}}),
+]
+
+
+def find_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(find_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(find_stages(item))
+    return stages
+
+
+def explain(db, collection, command):
+    command = dict(command)
+    if command.pop('count', False):
+        explain_command = {'count': collection, **command}
+    else:
+        explain_command = {'find': collection, **command}
+    return db.command('explain', explain_command, verbosity='executionStats')
+
+
+# 往基准测试库里写入合成数据：大部分文档在子文件夹，少量在根目录
+def seed(db, count):
+    for collection in ('medias', 'tasks'):
+        db[collection].delete_many({})
+        folder_ids = [str(ObjectId()) for _ in range(100)]
+        batch = []
+        for i in range(count):
+            batch.append({
+                'parent_id': 'root' if i % 1000 == 0 else folder_ids[i % len(folder_ids)],
+                'full_path': f'/bench/{i}',
+                'media_type': 'folder' if i % 50 == 0 else 'image',
+                'celery_task_id': f'task-{i}',
+                'original_filename': f'{i}.jpg',
+            })
+            if len(batch) == 10000:
+                db[collection].insert_many(batch)
+                batch = []
+        if batch:
+            db[collection].insert_many(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-url', default='mongodb://mongo:27017/')
+    parser.add_argument('--db', default='yolo_tasks')
+    parser.add_argument('--seed', type=int, default=0, help='写入合成数据的文档数（会清空集合，只在测试库使用）')
+    parser.add_argument('--ensure-indexes', action='store_true')
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_url)[args.db]
+
+    if args.seed:
+        seed(db, args.seed)
+    if args.ensure_indexes:
+        for collection, indexes in COLLECTION_INDEXES.items():
+            if indexes:
+                db[collection].create_indexes(indexes)
+
+    failures = []
+    report = []
+    for collection, description, command in HOT_QUERIES:
+        start = time.perf_counter()
+        result = explain(db, collection, command)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stages = find_stages(result.get('queryPlanner', {}).get('winningPlan', {}))
+        stats = result.get('executionStats', {})
+        entry = {
+            'collection': collection,
+            'query': description,
+            'stages': stages,
+            'docs_examined': stats.get('totalDocsExamined'),
+            'keys_examined': stats.get('totalKeysExamined'),
+            'execution_ms': stats.get('executionTimeMillis'),
+            'explain_ms': round(elapsed_ms, 1),
+        }
+        report.append(entry)
+        if 'COLLSCAN' in stages:
+            failures.append(entry)
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        print(f"{len(failures)} hot-path query plan(s) fall back to COLLSCAN", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# 并发请求某个 API 端点并统计延迟分布，用于比较改动前后的尾延迟
+# 用法（在 backend 目录下，先启动 backend 和本地 Mongo）：
+#   python3 -m benchmarks.concurrent_requests --url "http://localhost:8008/api/medias?folder_id=root" --requests 500
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def fire(client, url, latencies, errors):
+    start = time.perf_counter()
+    try:
+        response = await client.get(url)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    except Exception as e:
+        errors.append(str(e))
+
+
+async def run(url, total, concurrency, timeout):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def limited():
+            async with semaphore:
+                await fire(client, url, latencies, errors)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    report = {
+        'url': url,
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0,
+    }
+    if latencies:
+        report.update({
+            'mean_ms': round(statistics.mean(latencies), 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(max(latencies), 1),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8008/api/medias?folder_id=root')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help='把结果写入 JSON 文件，方便前后对比')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.url, args.requests, args.concurrency, args.timeout))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
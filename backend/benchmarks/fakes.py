@@ -0,0 +1,57 @@
+# 离线基准测试用的本地替身：用文件系统模拟 MinIO，接口与 worker 里用到的 minio.Minio 方法一致
+import io
+import os
+import shutil
+from types import SimpleNamespace
+
+
+class LocalObject(io.BytesIO):
+    def release_conn(self):
+        pass
+
+
+class FilesystemMinio:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, bucket, object_name):
+        return os.path.join(self.root, bucket, object_name)
+
+    def fget_object(self, bucket, object_name, file_path, **kwargs):
+        shutil.copyfile(self._path(bucket, object_name), file_path)
+
+    def fput_object(self, bucket, object_name, file_path, **kwargs):
+        path = self._path(bucket, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(file_path, path)
+
+    def put_object(self, bucket, object_name, data, length, **kwargs):
+        path = self._path(bucket, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data.read(length) if length >= 0 else data.read())
+
+    def get_object(self, bucket, object_name, offset=0, length=0, **kwargs):
+        with open(self._path(bucket, object_name), 'rb') as f:
+            f.seek(offset)
+            return LocalObject(f.read(length) if length else f.read())
+
+    def stat_object(self, bucket, object_name, **kwargs):
+        path = self._path(bucket, object_name)
+        return SimpleNamespace(object_name=object_name, size=os.path.getsize(path))
+
+    # ffmpeg/cv2 可以直接读本地路径，用它代替预签名 URL
+    def presigned_get_object(self, bucket, object_name, **kwargs):
+        return self._path(bucket, object_name)
+
+    def remove_objects(self, bucket, delete_objects):
+        for obj in delete_objects:
+            try:
+                os.remove(self._path(bucket, obj._name))
+            except FileNotFoundError:
+                pass
+        return iter(())
+
+    def object_size(self, bucket, object_name):
+        return os.path.getsize(self._path(bucket, object_name))
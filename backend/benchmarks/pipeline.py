@@ -0,0 +1,328 @@
+# 离线端到端基准：在只有 CPU 的机器上跑真实的 run_yolo_image / run_yolo_image_batch / run_yolo_video / convert_video
+# MinIO 用本地文件系统替身，Mongo 默认用 mongomock（也可以指定本地 mongod），Celery 使用 eager 模式
+# 每个用例在独立的子进程里执行，峰值 RSS 互不影响
+# 用法（在 backend 目录下，需要 ffmpeg 和 pip install -r benchmarks/requirements.txt）：
+#   python3 -m benchmarks.pipeline --output bench.json
+#   python3 -m benchmarks.pipeline --baseline bench.json --threshold 10
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(BACKEND_DIR, 'benchmarks', '.cache')
+BUCKET = 'yolo-files'
+CASES = ('image', 'image_batch', 'video', 'convert')
+
+# 越大越好的指标，其余指标越小越好
+HIGHER_IS_BETTER = ('images_per_second', 'frames_per_second')
+COMPARED_METRICS = HIGHER_IS_BETTER + ('seconds', 'peak_rss_mb')
+
+
+# 没有指定权重时，用 yolov8n 结构和固定随机种子生成一个小权重文件，不需要联网下载
+def default_weights():
+    path = os.path.join(CACHE_DIR, 'yolov8n-random.pt')
+    if not os.path.exists(path):
+        import torch
+        from ultralytics import YOLO
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        torch.manual_seed(0)
+        YOLO('yolov8n.yaml').save(path)
+    return path
+
+
+def make_images(directory, count, width, height):
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        image = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        for _ in range(8):
+            x, y = int(rng.integers(0, width - 64)), int(rng.integers(0, height - 64))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(image, (x, y), (x + int(rng.integers(16, 64)), y + int(rng.integers(16, 64))), color, -1)
+        path = os.path.join(directory, f'bench_{i}.jpg')
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+# faststart=False 时生成 moov 在末尾的 mpeg4 文件，走下载和完整转码路径
+def make_video(path, seconds, width, height, fps, faststart=True):
+    codec = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart'] if faststart else ['-c:v', 'mpeg4']
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}',
+        '-f', 'lavfi', '-i', 'sine=frequency=440',
+        '-t', str(seconds), *codec, '-c:a', 'aac', '-shortest', path
+    ], check=True)
+    return path
+
+
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB；子进程（ffmpeg）单独统计
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(children, 1)
+
+
+def sum_stages(timings_list):
+    stages = {}
+    for timings in timings_list:
+        for name, seconds in (timings or {}).get('stages', {}).items():
+            stages[name] = round(stages.get(name, 0.0) + seconds, 4)
+    return stages
+
+
+# 在子进程中执行：替换 worker 模块里的客户端，然后以 eager 模式调用真实任务
+def run_case(case, options):
+    workdir = tempfile.mkdtemp(prefix=f'bench_{case}_')
+    os.chdir(workdir)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['RESULT_DIR'] = os.path.join(workdir, 'results')
+    os.environ['STREAM_INPUT'] = '1' if options['stream_input'] else '0'
+    os.environ['YOLO_DEVICE'] = options['device']
+    # 基准测试没有 Redis，不发布任务事件，也不生成缩略图（只测量转码和推理本身）
+    os.environ['TASK_EVENTS'] = '0'
+    os.environ['THUMBNAILS'] = '0'
+    sys.path.insert(0, BACKEND_DIR)
+
+    from bson.objectid import ObjectId
+
+    from apis import celery_worker
+    from apis.device import configure_cpu_threads
+    from benchmarks.fakes import FilesystemMinio
+
+    if options['mongo_url']:
+        from pymongo import MongoClient
+        db = MongoClient(options['mongo_url'])[f'yolo_bench_{os.getpid()}']
+    else:
+        import mongomock
+        db = mongomock.MongoClient()['yolo_bench']
+
+    storage = FilesystemMinio(os.path.join(workdir, 'minio'))
+    celery_worker.minio_client = storage
+    celery_worker.task_collection = db['tasks']
+    celery_worker.media_collection = db['medias']
+    celery_worker.model_collection = db['models']
+    celery_worker.app.conf.update(
+        task_always_eager=True,
+        task_eager_propagates=True,
+        broker_url='memory://',
+        result_backend='cache+memory://',
+    )
+
+    # eager 模式不会触发 worker_process_init，这里按单进程分配 CPU 线程
+    configure_cpu_threads(options['concurrency'])
+    model_id = str(db['models'].insert_one({'name': 'bench', 'model_path': options['weights']}).inserted_id)
+
+    def add_media(local_path, media_type):
+        object_name = f"bench/{os.path.basename(local_path)}"
+        storage.fput_object(BUCKET, object_name, local_path)
+        return str(db['medias'].insert_one({
+            'minio_filename': object_name,
+            'media_type': media_type,
+            'original_filename': os.path.basename(local_path),
+        }).inserted_id)
+
+    def task_params(media_id):
+        inserted_id = str(db['tasks'].insert_one({'media_id': media_id, 'status': 'PENDING'}).inserted_id)
+        return {
+            'media_id': media_id,
+            'model_id': model_id,
+            'inserted_id': inserted_id,
+            'width': options['imgsz'][0],
+            'height': options['imgsz'][1],
+        }
+
+    report = {'case': case}
+    if case in ('image', 'image_batch'):
+        width, height = options['image_size']
+        media_ids = [add_media(p, 'image') for p in make_images(workdir, options['images'], width, height)]
+        # 第一次推理包含模型加载和算子初始化，单独预热，不计入吞吐
+        celery_worker.run_yolo_image.apply(args=[task_params(media_ids[0])])
+
+        params_list = [task_params(m) for m in media_ids]
+        start = time.perf_counter()
+        if case == 'image':
+            for params in params_list:
+                celery_worker.run_yolo_image.apply(args=[params]).get()
+        else:
+            celery_worker.run_yolo_image_batch.apply(args=[params_list, options['batch_size']]).get()
+        seconds = time.perf_counter() - start
+
+        docs = list(db['tasks'].find({'_id': {'$in': [ObjectId(p['inserted_id']) for p in params_list]}}))
+        failed = [d for d in docs if d.get('status') != 'SUCCESS']
+        # 批量任务每个文档记录的是整批耗时，只取一份
+        timings = [docs[0].get('timings')] if case == 'image_batch' and docs else [d.get('timings') for d in docs]
+        report.update({
+            'items': len(params_list),
+            'failed': len(failed),
+            'seconds': round(seconds, 3),
+            'images_per_second': round(len(params_list) / seconds, 2),
+            'stages': sum_stages(timings),
+        })
+
+    elif case == 'video':
+        width, height = options['video_size']
+        path = make_video(os.path.join(workdir, 'bench.mp4'), options['video_seconds'], width, height, options['fps'])
+        media_id = add_media(path, 'video')
+        celery_worker.model_cache.preload(model_id, options['weights'], imgsz=(options['imgsz'][1], options['imgsz'][0]), device=options['device'])
+
+        params = task_params(media_id)
+        start = time.perf_counter()
+        celery_worker.run_yolo_video.apply(args=[params]).get()
+        seconds = time.perf_counter() - start
+
+        doc = db['tasks'].find_one({'_id': ObjectId(params['inserted_id'])})
+        timings = doc.get('timings') or {}
+        frames = timings.get('frames', 0)
+        report.update({
+            'frames': frames,
+            'failed': 0 if doc.get('status') == 'SUCCESS' else 1,
+            'seconds': round(seconds, 3),
+            'frames_per_second': round(frames / seconds, 2) if seconds else 0,
+            'stages': sum_stages([timings]),
+        })
+
+    elif case == 'convert':
+        width, height = options['video_size']
+        path = make_video(os.path.join(workdir, 'bench_source.mp4'), options['video_seconds'], width, height, options['fps'], faststart=False)
+        media_id = add_media(path, 'video')
+        db['medias'].update_one({'_id': ObjectId(media_id)}, {'$set': {'celery_task_id': 'bench-convert'}})
+
+        start = time.perf_counter()
+        celery_worker.convert_video.apply(args=[media_id], task_id='bench-convert').get()
+        seconds = time.perf_counter() - start
+
+        doc = db['medias'].find_one({'_id': ObjectId(media_id)})
+        frames = int(options['video_seconds'] * options['fps'])
+        report.update({
+            'frames': frames,
+            'failed': 0 if doc.get('progress') == 100 else 1,
+            'seconds': round(seconds, 3),
+            'frames_per_second': round(frames / seconds, 2) if seconds else 0,
+            'mode': (doc.get('conversion') or {}).get('mode'),
+            'stages': sum_stages([doc.get('timings')]),
+        })
+
+    own, children = peak_rss_mb()
+    report['peak_rss_mb'] = own
+    report['children_peak_rss_mb'] = children
+    return report
+
+
+# 与基线比较，变化超过阈值（百分比）且方向变差的指标记为回归
+def compare(results, baseline, threshold):
+    baseline_cases = {r['case']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        previous = baseline_cases.get(result['case'])
+        if not previous:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change < -threshold if metric in HIGHER_IS_BETTER else change > threshold
+            result.setdefault('change_pct', {})[metric] = round(change, 1)
+            if worse:
+                regressions.append({'case': result['case'], 'metric': metric, 'baseline': old, 'current': new, 'change_pct': round(change, 1)})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', default=','.join(CASES), help=f"逗号分隔，可选 {', '.join(CASES)}")
+    parser.add_argument('--weights', help='YOLO 权重文件，默认生成随机初始化的 yolov8n')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--concurrency', type=int, default=1, help='模拟的 prefork 进程数，决定 CPU 线程预算')
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--image-size', type=parse_size, default=(1280, 720))
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--video-seconds', type=float, default=10)
+    parser.add_argument('--video-size', type=parse_size, default=(1280, 720))
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--imgsz', type=parse_size, default=(640, 384), help='推理尺寸 WxH')
+    parser.add_argument('--no-stream-input', dest='stream_input', action='store_false')
+    parser.add_argument('--mongo-url', help='使用本地 mongod 而不是 mongomock')
+    parser.add_argument('--output', help='把结果写入 JSON 文件')
+    parser.add_argument('--baseline', help='之前保存的 JSON 结果，用于回归比较')
+    parser.add_argument('--threshold', type=float, default=10, help='回归阈值（百分比）')
+    args = parser.parse_args()
+
+    options = {
+        'weights': os.path.abspath(args.weights) if args.weights else default_weights(),
+        'device': args.device,
+        'concurrency': args.concurrency,
+        'images': args.images,
+        'image_size': args.image_size,
+        'batch_size': args.batch_size,
+        'video_seconds': args.video_seconds,
+        'video_size': args.video_size,
+        'fps': args.fps,
+        'imgsz': args.imgsz,
+        'stream_input': args.stream_input,
+        'mongo_url': args.mongo_url,
+    }
+
+    results = []
+    for case in [c.strip() for c in args.cases.split(',') if c.strip()]:
+        if case not in CASES:
+            parser.error(f"unknown case: {case}")
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            result = executor.submit(run_case, case, options).result()
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.time(),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'options': options,
+        'results': results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        report['baseline_commit'] = baseline.get('commit')
+        report['regressions'] = regressions
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold}%", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
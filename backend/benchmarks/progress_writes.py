@@ -0,0 +1,62 @@
+# 对比逐帧写入与 ProgressReporter 合并写入的 MongoDB 写次数
+# 用法（在 backend 目录下）：python3 -m benchmarks.progress_writes --frames 3000 --fps 30
+import argparse
+import threading
+import time
+
+from apis.progress import ProgressReporter
+
+
+# 只统计 update_one 调用次数的集合替身，模拟一次数据库往返的延迟
+class CountingCollection:
+    def __init__(self, latency_ms=2):
+        self.latency = latency_ms / 1000
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def update_one(self, query, update):
+        time.sleep(self.latency)
+        with self._lock:
+            self.writes += 1
+
+
+def run_per_frame(frames, frame_time, collection):
+    start = time.perf_counter()
+    for frame_count in range(1, frames + 1):
+        time.sleep(frame_time)
+        collection.update_one({}, {'$set': {'progress': int(frame_count / frames * 100)}})
+    return time.perf_counter() - start
+
+
+def run_reporter(frames, frame_time, collection, min_interval_ms):
+    start = time.perf_counter()
+    with ProgressReporter(collection, {}, min_interval_ms=min_interval_ms) as reporter:
+        for frame_count in range(1, frames + 1):
+            time.sleep(frame_time)
+            reporter.update(frame_count / frames * 100)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--fps', type=float, default=30, help='模拟的推理速度（帧/秒）')
+    parser.add_argument('--latency-ms', type=float, default=2, help='模拟的单次写入延迟')
+    parser.add_argument('--interval-ms', type=int, default=500)
+    args = parser.parse_args()
+
+    frame_time = 1 / args.fps
+
+    before = CountingCollection(args.latency_ms)
+    before_seconds = run_per_frame(args.frames, frame_time, before)
+
+    after = CountingCollection(args.latency_ms)
+    after_seconds = run_reporter(args.frames, frame_time, after, args.interval_ms)
+
+    print(f"frames: {args.frames}, fps: {args.fps}, interval: {args.interval_ms}ms")
+    print(f"per-frame update : {before.writes:6d} writes, {before_seconds:.2f}s")
+    print(f"ProgressReporter : {after.writes:6d} writes, {after_seconds:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
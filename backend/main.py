@@ -1,13 +1,37 @@
 # main.py
 
-from fastapi import FastAPI
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from apis.models import router as model_router
-from apis.tasks import router as task_router
+from apis.tasks import router as task_router, sweep_result_cache
 from apis.medias import router as media_router
+from apis.logger import get_logger
+from models.models import db
+from models.indexes import ensure_indexes
+from apis.metrics import HTTP_REQUEST_SECONDS, metrics_registry
+from apis.task_events import task_event_hub
+from prometheus_client import make_asgi_app
+
+logger = get_logger()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建索引（已存在时不做任何事）
+    created = await ensure_indexes(db)
+    logger.info(f"MongoDB indexes ensured: {created}")
+    # 订阅 worker 发布的任务事件，分发给 WebSocket/SSE 连接
+    await task_event_hub.start()
+    # 清理 leader 已丢失的结果缓存条目，让等待它的任务及时失败
+    sweeper = asyncio.create_task(sweep_result_cache())
+    yield
+    sweeper.cancel()
+    await task_event_hub.stop()
 
 # 创建FastAPI应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,4 +43,21 @@ app.add_middleware(
 
 app.include_router(model_router, prefix="/api")
 app.include_router(task_router, prefix="/api")
-app.include_router(media_router, prefix="/api")
\ No newline at end of file
+app.include_router(media_router, prefix="/api")
+
+# 按路由模板记录请求耗时，避免路径参数造成标签爆炸
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        if route is not None:
+            HTTP_REQUEST_SECONDS.labels(request.method, route.path, str(status)).observe(time.perf_counter() - start)
+
+# Prometheus 抓取端点
+app.mount("/metrics", make_asgi_app(registry=metrics_registry()))
@@ -0,0 +1,47 @@
+# 为已有的 medias / tasks 文档回填 ancestors 字段，并按 ancestors 修正文件夹的 full_path
+# 从根目录逐层向下处理，每个文件夹只需一次 update_many，可重复执行
+# 用法（在 backend 目录下）：python3 -m migrations.backfill_ancestors --mongo-url mongodb://mongo:27017/
+import argparse
+import os
+
+from pymongo import MongoClient, UpdateOne
+
+
+def backfill(collection):
+    updated = 0
+    # (parent_id, 该 parent 下文档的 ancestors)
+    queue = [('root', [])]
+    while queue:
+        parent_id, ancestors = queue.pop()
+        result = collection.update_many({'parent_id': parent_id}, {'$set': {'ancestors': ancestors}})
+        updated += result.modified_count
+
+        operations = []
+        for folder in collection.find({'parent_id': parent_id, 'media_type': 'folder'}, {'original_filename': 1}):
+            name = folder.get('original_filename')
+            operations.append(UpdateOne(
+                {'_id': folder['_id']},
+                {'$set': {'full_path': os.sep.join([''] + [a['name'] for a in ancestors] + [name])}}
+            ))
+            queue.append((str(folder['_id']), ancestors + [{'id': str(folder['_id']), 'name': name}]))
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+
+    orphans = collection.count_documents({'ancestors': {'$exists': False}})
+    return updated, orphans
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-url', default='mongodb://mongo:27017/')
+    parser.add_argument('--db', default='yolo_tasks')
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_url)[args.db]
+    for name in ('medias', 'tasks'):
+        updated, orphans = backfill(db[name])
+        print(f"{name}: {updated} document(s) updated, {orphans} orphaned document(s) without a reachable parent")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# 各集合热点查询所需的索引，启动时幂等创建
+# - parent_id + _id：/medias、/tasks 按文件夹分页并按 _id 倒序
+# - full_path + media_type：创建文件夹时的同名检查
+# - celery_task_id：Celery 信号处理器按任务 id 更新状态
+# - ancestors.id：按文件夹查询整个子树（移动、重命名、删除）
+# - result_cache.task_doc_id：删除任务时让指向其产物的缓存条目失效
+# - result_cache.state：定期查找 leader 已丢失的 running 条目
+COLLECTION_INDEXES = {
+    'medias': [
+        IndexModel([('parent_id', ASCENDING), ('_id', DESCENDING)], name='parent_id_id'),
+        IndexModel([('full_path', ASCENDING), ('media_type', ASCENDING)], name='full_path_media_type'),
+        IndexModel([('celery_task_id', ASCENDING)], name='celery_task_id'),
+        IndexModel([('ancestors.id', ASCENDING)], name='ancestors_id'),
+    ],
+    'tasks': [
+        IndexModel([('parent_id', ASCENDING), ('_id', DESCENDING)], name='parent_id_id'),
+        IndexModel([('full_path', ASCENDING), ('media_type', ASCENDING)], name='full_path_media_type'),
+        IndexModel([('celery_task_id', ASCENDING)], name='celery_task_id'),
+        IndexModel([('ancestors.id', ASCENDING)], name='ancestors_id'),
+    ],
+    'models': [],
+    'result_cache': [
+        IndexModel([('task_doc_id', ASCENDING)], name='task_doc_id'),
+        IndexModel([('state', ASCENDING)], name='state'),
+    ],
+}
+
+
+async def ensure_indexes(db):
+    created = {}
+    for collection_name, indexes in COLLECTION_INDEXES.items():
+        if indexes:
+            created[collection_name] = await db[collection_name].create_indexes(indexes)
+    return created
@@ -1,8 +1,9 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 
-# 创建MongoDB客户端
-mongo_client = MongoClient('mongodb://mongo:27017/')
+# 创建MongoDB客户端（异步驱动，API 路由中直接 await，不阻塞事件循环）
+mongo_client = AsyncMongoClient('mongodb://mongo:27017/')
 db = mongo_client['yolo_tasks']
 task_collection = db['tasks']
 media_collection = db['medias']
-model_collection = db['models']
\ No newline at end of file
+model_collection = db['models']
+result_cache_collection = db['result_cache']
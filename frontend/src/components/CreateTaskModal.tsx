@@ -54,6 +54,11 @@ const CreateTaskModal = ({
                 throw new Error('Failed to fetch medias');
             }
             const data = await response.json();
+            // If streaming fails midway, the server ends the array with an {error} element
+            const last = data[data.length - 1];
+            if (last && last.error) {
+                throw new Error(last.error);
+            }
             setMedias(data);
         } catch (error) {
             console.error('Error fetching medias:', error);
@@ -92,8 +92,9 @@ const MediaItem: React.FC<MediaItemProps> = ({
                     />
                 ) : media.media_type === 'image' ? (
                     <img
-                        src={`${process.env.REACT_APP_API_URL}/yolo-files/${media.minio_filename}`}
+                        src={`${process.env.REACT_APP_API_URL}/yolo-files/${media.thumbnails?.small ?? media.minio_filename}`}
                         alt={media.name}
+                        loading="lazy"
                         style={{
                             width: '100px',
                             height: '100px',
@@ -105,6 +106,8 @@ const MediaItem: React.FC<MediaItemProps> = ({
                 ) : media.media_type === 'video' ? (
                     <video
                         src={`${process.env.REACT_APP_API_URL}/yolo-files/${media.minio_filename}`}
+                        poster={media.thumbnails?.small ? `${process.env.REACT_APP_API_URL}/yolo-files/${media.thumbnails.small}` : undefined}
+                        preload={media.thumbnails?.small ? 'none' : 'metadata'}
                         style={{
                             width: '100px',
                             height: '100px',
@@ -0,0 +1,45 @@
+import { useEffect, useRef } from "react";
+import { TaskEvent } from "../interface";
+
+const RECONNECT_DELAY_MS = 3000;
+
+const taskEventsUrl = (folderId: string) => {
+  const base = (process.env.REACT_APP_API_URL || window.location.origin).replace(/^http/, "ws");
+  return `${base}/api/ws/task_events?folder_id=${encodeURIComponent(folderId)}`;
+};
+
+// 订阅文件夹内任务的进度和状态变化（WebSocket 推送，断开后自动重连），替代定时轮询
+const useTaskEvents = (folderId: string, onEvents: (events: TaskEvent[]) => void) => {
+  const handlerRef = useRef(onEvents);
+  handlerRef.current = onEvents;
+
+  useEffect(() => {
+    let socket: WebSocket | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(taskEventsUrl(folderId));
+      socket.onmessage = (message) => {
+        const data = JSON.parse(message.data);
+        if (data.events && data.events.length) {
+          handlerRef.current(data.events);
+        }
+      };
+      socket.onclose = () => {
+        if (!closed) {
+          retry = setTimeout(connect, RECONNECT_DELAY_MS);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      socket?.close();
+    };
+  }, [folderId]);
+};
+
+export default useTaskEvents;
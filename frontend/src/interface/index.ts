@@ -101,6 +101,26 @@ export interface Task {
   error?: string;
 }
 
+// 服务端推送的任务进度/状态变化，只包含发生变化的字段
+export interface TaskEvent {
+  task_id: string;
+  parent_id?: string | null;
+  status?: Task["status"];
+  progress?: number;
+  error_message?: string;
+  result_file?: string;
+  start_time?: number;
+  end_time?: number;
+  time: number;
+}
+
+// 删除接口的返回：所选文档已同步删除，文件夹子树和文件由 job_id 对应的后台任务清理
+export interface DeleteResult {
+  deleted_count: number;
+  job_id: string | null;
+  message: string;
+}
+
 // 可以添加一些辅助类型
 export type TaskStatus = Task["status"];
 export type FileType = Task["media_type"];
@@ -165,10 +185,22 @@ export interface Media {
   width: number;
   height: number;
   duration: number;
+  fps?: number | null;
+  frame_count?: number | null;
   status: "PENDING" | "RUNNING" | "SUCCESS" | "FAILURE" | "REVOKED";
   progress: number;
   celery_task_id: string;
   start_time: number;
   error_message: string;
   end_time: number;
+  thumbnails?: { small?: string; medium?: string };
+  poster?: string;
+  sprite?: {
+    key: string;
+    columns: number;
+    rows: number;
+    interval: number;
+    tile_width: number;
+    tile_height: number;
+  };
 }
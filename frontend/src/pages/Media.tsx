@@ -5,7 +5,7 @@ import {
     Dialog, DialogActions, DialogContent, DialogContentText, DialogTitle,
     Modal, TextField
 } from '@mui/material';
-import { ITaskRequest, Media, Model, Task } from '../interface';
+import { DeleteResult, ITaskRequest, Media, Model, Task } from '../interface';
 import UploadMediaModal from '../components/UploadMediaModal';
 import RunWithModelModal from '../components/RunWithModelModal';
 import FilePathDisplay from '../components/FilePathDisplay';
@@ -307,6 +307,8 @@ const MediaManagement = () => {
                 body: JSON.stringify(selectedMedias),
             });
             if (response.ok) {
+                const result: DeleteResult = await response.json();
+                console.log(result.message);
                 fetchMediaItems(currentFolderId);
                 setSelectedMedias([]);
             } else {
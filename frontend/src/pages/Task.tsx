@@ -21,7 +21,8 @@ import {
   DialogActions,
   Chip,
 } from "@mui/material";
-import { Task, Model, Media } from "../interface";
+import { Task, Model, Media, TaskEvent, DeleteResult } from "../interface";
+import useTaskEvents from "../hooks/useTaskEvents";
 import CreateTaskModal from "../components/CreateTaskModal";
 import RerunTaskModal from "../components/RerunTaskModal";
 import NavigateToParentButton from '../components/button/NavigateToParentButton';
@@ -71,6 +72,8 @@ const TaskManagement = () => {
         }
       );
       if (response.ok) {
+        const result: DeleteResult = await response.json();
+        console.log(result.message);
         setSelectedTasks([]);
         await fetchTasks();
       } else {
@@ -133,6 +136,14 @@ const TaskManagement = () => {
     fetchModels();
   }, [currentFolderId]);
 
+  // 服务端推送的进度和状态合并到当前页的任务
+  const handleTaskEvents = useCallback((events: TaskEvent[]) => {
+    const updates = new Map(events.map(({ task_id, parent_id, time, ...fields }) => [task_id, fields]));
+    setTasks((prev) => prev && prev.map((task) => (updates.has(task._id) ? { ...task, ...updates.get(task._id) } : task)));
+  }, []);
+
+  useTaskEvents(currentFolderId, handleTaskEvents);
+
   const handleRerun = (task: Task, event: React.MouseEvent) => {
     // 阻止事件冒泡到 TableRow 的 onClick
     event.stopPropagation();
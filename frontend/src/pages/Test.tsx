@@ -1,11 +1,12 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import {
     Table, TableBody, TableCell, TableContainer, TableHead, TableRow, Paper,
     Button, Modal, Box, TextField, CircularProgress, Pagination, Select, MenuItem, Typography,
     FormControl, InputLabel, Checkbox, FormControlLabel, Divider, Dialog, DialogTitle, DialogContent, DialogActions,
     Chip
 } from '@mui/material';
-import { Task, CreateTaskInput, Model } from '../interface';
+import { Task, CreateTaskInput, Model, DeleteResult, TaskEvent } from '../interface';
+import useTaskEvents from '../hooks/useTaskEvents';
 import CreateTaskModal from '../components/CreateTaskModal';
 import RerunTaskModal from '../components/RerunTaskModal';
 import videojs from 'video.js';
@@ -50,6 +51,8 @@ const Test = () => {
                 body: JSON.stringify(selectedTasks),
             });
             if (response.ok) {
+                const result: DeleteResult = await response.json();
+                console.log(result.message);
                 setSelectedTasks([]);
                 await fetchTasks();
             } else {
@@ -144,10 +147,13 @@ const Test = () => {
         return new Date(timestamp * 1000).toLocaleString();
     };
 
-    useEffect(() => {
-        const intervalId = setInterval(fetchTasks, 1000); // Fetch tasks every second
-        return () => clearInterval(intervalId);
-    }, [page, limit]);
+    // 服务端推送的进度和状态合并到当前页的任务（/api/tasks 不带 folder_id 时返回根目录的任务）
+    const handleTaskEvents = useCallback((events: TaskEvent[]) => {
+        const updates = new Map(events.map(({ task_id, parent_id, time, ...fields }) => [task_id, fields]));
+        setTasks(prev => prev && prev.map(task => (updates.has(task._id) ? { ...task, ...updates.get(task._id) } : task)));
+    }, []);
+
+    useTaskEvents('root', handleTaskEvents);
 
     const fetchTasks = async () => {
         const response = await fetch(`${process.env.REACT_APP_API_URL}/api/tasks?limit=${limit}&page_num=${page}`);